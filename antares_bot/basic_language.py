@@ -87,6 +87,14 @@ class BasicLanguage:
         "zh-CN": "没有找到命令：{}",
         "en": "No such command: {}",
     }
+    NO_HANDLER_STATS = {
+        "zh-CN": "还没有处理过任何请求哦",
+        "en": "No handler has been called yet",
+    }
+    LONG_TEXT_AS_DOCUMENT = {
+        "zh-CN": "全文共{}字，本应分{}条消息发送，见附件",
+        "en": "Full text of {} characters ({} messages) is attached",
+    }
 
     @classmethod
     def t(cls, d: dict[str, str], locale: str | None = None):
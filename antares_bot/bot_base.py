@@ -1,7 +1,9 @@
+import asyncio
 from logging import DEBUG as LOGLEVEL_DEBUG
-from typing import TYPE_CHECKING, Any, Optional
+from typing import TYPE_CHECKING, Any, Iterable, List, Optional
 
 from telegram import InlineKeyboardButton
+from telegram.constants import BulkRequestLimit
 from telegram.error import TelegramError
 
 import antares_bot.context_manager as context_manager
@@ -9,6 +11,7 @@ from antares_bot import utils
 from antares_bot.bot_default_cfg import BasicConfig
 from antares_bot.bot_logging import get_logger, get_root_logger
 from antares_bot.bot_method_wrapper import TelegramBotBaseWrapper
+from antares_bot.callback_manager import format_callback_data
 from antares_bot.error import (
     IgnoreChannelUpdateException,
     InvalidChatTypeException,
@@ -82,6 +85,47 @@ class TelegramBotBase(TelegramBotBaseWrapper):
 
         return True
 
+    @classmethod
+    async def del_msgs(
+        cls, chat_id: int, msg_ids: Iterable[int], concurrency: int = 4
+    ) -> List[int]:
+        """
+        delete messages of a chat with `deleteMessages`, up to 100 per request,
+        `concurrency` requests at a time (paced by flood control if it is on).
+        returns the ids that could not be deleted.
+        if a request fails, its messages are deleted one by one to find out which failed.
+        """
+        from antares_bot.bot_inst import get_bot_instance
+
+        ids = list(dict.fromkeys(msg_ids))
+        step = BulkRequestLimit.MAX_LIMIT
+        batches = iter([ids[i : i + step] for i in range(0, len(ids), step)])
+        bot = get_bot_instance().bot
+        failed: List[int] = []
+
+        async def _delete_one(msg_id: int) -> None:
+            try:
+                await cls._call_api(
+                    bot.delete_message, chat_id=chat_id, message_id=msg_id
+                )
+            except TelegramError:
+                failed.append(msg_id)
+
+        async def _worker() -> None:
+            for batch in batches:
+                try:
+                    await cls._call_api(
+                        bot.delete_messages, chat_id=chat_id, message_ids=batch
+                    )
+                except TelegramError as e:
+                    DEBUG_LOGGER.debug("deleteMessages failed: %s", e)
+                    for msg_id in batch:
+                        await _delete_one(msg_id)
+
+        worker_count = min(concurrency, (len(ids) + step - 1) // step)
+        await asyncio.gather(*(_worker() for _ in range(worker_count)))
+        return failed
+
     @classmethod
     def debug_info(cls, msg, *args):
         DEBUG_LOGGER.debug(msg, *args)
@@ -105,7 +149,7 @@ class TelegramBotBase(TelegramBotBaseWrapper):
         cls, text: str, callback_key_name: str, callback_arg: Any
     ):
         return InlineKeyboardButton(
-            text, callback_data=f"{callback_key_name}:{callback_arg}"
+            text, callback_data=format_callback_data(callback_key_name, callback_arg)
         )
 
     @classmethod
@@ -31,7 +31,13 @@ from antares_bot.basic_language import BasicLanguage as Lang
 from antares_bot.bot_base import TelegramBotBase
 from antares_bot.bot_default_cfg import AntaresBotConfig, BasicConfig
 from antares_bot.bot_logging import get_logger, start_logger, stop_logger
-from antares_bot.callback_manager import CallbackDataManager
+from antares_bot.bot_method_wrapper import SEND_FALLBACK_STATS
+from antares_bot.callback_manager import (
+    DEFAULT_CALLBACK_DATA_EXPIRE_INTERVAL,
+    DEFAULT_CALLBACK_DATA_TTL,
+    CallbackDataManager,
+    CallbackDataStore,
+)
 from antares_bot.context import ChatData, RichCallbackContext, UserData
 from antares_bot.context_manager import ContextHelper, ContextReverseHelper, get_context
 from antares_bot.error import (
@@ -40,7 +46,14 @@ from antares_bot.error import (
     permission_exceptions,
 )
 from antares_bot.format_exc import format_exception_with_local_vars, format_local_value
-from antares_bot.framework import CallbackBase
+from antares_bot.framework import (
+    CallbackBase,
+    CallbackQueryRouter,
+    CommandRouter,
+    paged_keyboard_navigate,
+    paged_text_navigate,
+)
+from antares_bot.media_download import close_download_service
 from antares_bot.module_loader import ModuleKeeper
 from antares_bot.patching.job_quque_ex import JobQueueEx
 from antares_bot.sqlite.manager import DataBasesManager
@@ -58,7 +71,6 @@ if TYPE_CHECKING:
 _T = TypeVar("_T", bound="TelegramBotModuleBase", covariant=True)
 
 _LOGGER = get_logger("main")
-TIME_IN_A_DAY = 24 * 60 * 60
 
 _PROGRAM_SHUTDOWN_STARTED = False
 
@@ -146,8 +158,17 @@ class TelegramBot(TelegramBotBase):
         assert self.application.job_queue is not None
         self.job_queue = self.application.job_queue
         #
-        self.callback_manager = CallbackDataManager()
-        self.callback_key_dict: Dict[Tuple[int, int], List[str]] = dict()
+        self.callback_manager = CallbackDataManager(
+            default_ttl=read_user_cfg(AntaresBotConfig, "CALLBACK_DATA_TTL")
+            or DEFAULT_CALLBACK_DATA_TTL,
+            max_entries=read_user_cfg(AntaresBotConfig, "CALLBACK_DATA_MAX_ENTRIES"),
+            max_bytes=read_user_cfg(AntaresBotConfig, "CALLBACK_DATA_MAX_BYTES"),
+            store=(
+                CallbackDataStore(os.path.join(self.data_dir(), "callback_data.db"))
+                if read_user_cfg(AntaresBotConfig, "CALLBACK_DATA_PERSIST")
+                else None
+            ),
+        )
         self._custom_post_init_task: Awaitable | None = None
         self._custom_post_stop_task: Awaitable | None = None
         # TODO do a flags check at the end of the run. move the flags into a new class
@@ -177,6 +198,13 @@ class TelegramBot(TelegramBotBase):
     def bot_id(self):
         return self.bot.bot.id
 
+    @property
+    def callback_key_dict(self) -> Dict[Tuple[int, int], List[str]]:
+        """
+        keys of callback manager used by each message, key: `(chat_id, msg_id)`.
+        """
+        return self.callback_manager.message_index
+
     async def _do_post_init(self, app: Application):
         # use eager factory for python 3.12+
         if sys.version_info >= (3, 12):
@@ -185,6 +213,11 @@ class TelegramBot(TelegramBotBase):
         # bring the (pika) logger online and flush records buffered at import time
         await start_logger()
 
+        try:
+            await self.callback_manager.connect_store()
+        except Exception:
+            _LOGGER.error("Failed to connect callback data store", exc_info=True)
+
         await self.send_to(self.get_master_id(), Lang.t(Lang.STARTUP_PENDING))
 
         time0 = time.time()
@@ -269,6 +302,11 @@ class TelegramBot(TelegramBotBase):
             )
         )
         _LOGGER.warning("Post stop time (total: %.3fs):\n%s", total_time, timing_lines)
+        try:
+            await self.callback_manager.persist()
+        except Exception:
+            _LOGGER.error("Failed to persist callback data", exc_info=True)
+        await close_download_service()
         task_stop_db = DataBasesManager.get_inst().shutdown()
         # pull the repo if _post_stop_gitpull_flag is set.
         # if exit_fast (SIGTERM, SIGABRT), do not pull
@@ -317,6 +355,14 @@ class TelegramBot(TelegramBotBase):
         for module in self._module_keeper.get_all_enabled_modules():
             module.do_init(self)
 
+        self.application.add_handler(paged_keyboard_navigate.to_handler())
+        self.application.add_handler(paged_text_navigate.to_handler())
+        callback_router = CallbackQueryRouter()
+        command_router = (
+            CommandRouter()
+            if read_user_cfg(AntaresBotConfig, "COMMAND_DISPATCH_TABLE")
+            else None
+        )
         for module in self._module_keeper.get_all_enabled_modules():
             module_inst = module.module_instance
             for func in module_inst.collect_handlers():
@@ -335,7 +381,19 @@ class TelegramBot(TelegramBotBase):
                             for command in entry_point.commands:
                                 _doc = entry_point.callback.__doc__
                                 self.handler_docs[command] = _doc if _doc else "No doc"
-                self.application.add_handler(handler)
+                if CallbackQueryRouter.routable(func, handler):
+                    if len(callback_router) == 0:
+                        # takes the place of the first plain-prefix button handler
+                        self.application.add_handler(callback_router)
+                    callback_router.add(func.callback_prefix, handler)  # type: ignore
+                elif command_router is not None and CommandRouter.routable(
+                    func, handler
+                ):
+                    if len(command_router) == 0:
+                        self.application.add_handler(command_router)
+                    command_router.add(handler)  # type: ignore
+                else:
+                    self.application.add_handler(handler)
                 # try get module logger
                 py_module = module.py_module()
                 if hasattr(py_module, "_LOGGER"):
@@ -357,6 +415,12 @@ class TelegramBot(TelegramBotBase):
             time=datetime.time(hour=0, minute=0, tzinfo=SYSTEM_TIME_ZONE),
             name="daily_job",
         )
+        self.job_queue.run_repeating(
+            self._callback_data_expire_job,
+            interval=read_user_cfg(AntaresBotConfig, "CALLBACK_DATA_EXPIRE_INTERVAL")
+            or DEFAULT_CALLBACK_DATA_EXPIRE_INTERVAL,
+            name="callback_data_expire_job",
+        )
 
         signal.signal(signal.SIGINT, self.signal_stop)
         signal.signal(signal.SIGTERM, self.signal_stop)
@@ -551,21 +615,21 @@ class TelegramBot(TelegramBotBase):
     def data_dir(cls):
         return os.path.join(os.path.curdir, read_user_cfg(BasicConfig, "DATA_DIR"))
 
-    async def _daily_job(self, context: RichCallbackContext):
-        is_debug = self._is_debug_level()
-        if is_debug:
-            _debug_ids = []
-        for old_id in self.callback_manager.history.pop_before_keys(
-            time.time() - TIME_IN_A_DAY
-        ):
-            self.callback_manager.pop_data(old_id)
-            if is_debug:
-                _debug_ids.append(old_id)
-        if is_debug:
+    async def _callback_data_expire_job(self, context: RichCallbackContext):
+        count = self.callback_manager.expire()
+        await self.callback_manager.flush()
+        message_count = self.callback_manager.sweep_message_index()
+        if count > 0 or message_count > 0:
             _LOGGER.debug(
-                "Daily job: removed %s keys from callback manager", _debug_ids
+                "Removed %d expired keys and %d indexed messages from callback manager, stats: %s",
+                count,
+                message_count,
+                self.callback_manager.stats(),
             )
-        #
+
+    async def _daily_job(self, context: RichCallbackContext):
+        _LOGGER.warning("Callback manager stats: %s", self.callback_manager.stats())
+        _LOGGER.warning("Send fallback stats: %s", SEND_FALLBACK_STATS)
         _LOGGER.warning("Start running daily jobs for each module")
         with ContextReverseHelper():
             await asyncio.gather(
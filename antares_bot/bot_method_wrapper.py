@@ -1,14 +1,22 @@
 import asyncio
+import gzip
+import uuid
 from typing import (
     TYPE_CHECKING,
     Any,
     AsyncGenerator,
     Awaitable,
     Callable,
+    Dict,
+    Iterable,
     List,
+    Optional,
+    Tuple,
     TypeVar,
+    cast,
 )
 
+from telegram.constants import ParseMode
 from telegram.error import (
     BadRequest,
     ChatMigrated,
@@ -18,12 +26,43 @@ from telegram.error import (
     TelegramError,
 )
 
+from antares_bot.basic_language import BasicLanguage as Lang
+from antares_bot.bot_default_cfg import AntaresBotConfig
 from antares_bot.bot_logging import get_logger
-from antares_bot.text_process import longtext_split
+from antares_bot.broadcast import (
+    BROADCAST_FAILED,
+    BROADCAST_FORBIDDEN,
+    BROADCAST_MIGRATED,
+    BROADCAST_SENT,
+    BroadcastResult,
+    get_broadcast_store,
+)
+from antares_bot.callback_manager import PagedText
+from antares_bot.file_id_cache import (
+    file_id_cache_key,
+    get_file_id_cache,
+    is_stale_file_id_error,
+)
+from antares_bot.flood_control import (
+    PRIORITY_LOW,
+    FloodControlScheduler,
+    get_flood_control,
+)
+from antares_bot.init_hooks import read_user_cfg
+from antares_bot.media_download import get_download_service
+from antares_bot.reply_coalescer import get_reply_coalescer
+from antares_bot.reply_stream import ReplyStream
+from antares_bot.text_process import (
+    TEXT_LENGTH_LIMIT,
+    is_valid_parse_mode_text,
+    longtext_markdown_split,
+    longtext_split,
+    utf16_len,
+)
 
 
 if TYPE_CHECKING:
-    from telegram import Message
+    from telegram import Message, MessageEntity
 
     from antares_bot.context import RichCallbackContext
 
@@ -31,10 +70,37 @@ if TYPE_CHECKING:
 _T = TypeVar("_T")
 _LOGGER = get_logger("bot_base")
 
+# how often a send fell back to a degraded request.
+# `*_precheck` are caught locally, `*_retry` cost a failed round trip.
+SEND_FALLBACK_STATS: Dict[str, int] = {
+    "parse_mode_precheck": 0,
+    "parse_mode_retry": 0,
+    "reply_retry": 0,
+}
+
+# characters of a long text shown in the caption of the document it is sent as
+LONG_TEXT_PREVIEW_LENGTH = 500
+# send_message arguments that also apply to send_document
+_DOCUMENT_KWARGS = frozenset(
+    (
+        "chat_id",
+        "reply_to_message_id",
+        "reply_parameters",
+        "allow_sending_without_reply",
+        "disable_notification",
+        "protect_content",
+        "message_thread_id",
+        "reply_markup",
+        "business_connection_id",
+        "message_effect_id",
+    )
+)
+
 
 class TelegramBotBaseWrapper(object):
     RETRY_TIMES = 3
     RETRY_SLEEP_TIME = 1.0
+    BROADCAST_FLUSH_EVERY = 100
 
     @classmethod
     def get_context(cls) -> "RichCallbackContext":
@@ -48,6 +114,13 @@ class TelegramBotBaseWrapper(object):
         assert last is not None
         return last
 
+    @staticmethod
+    async def _get_last_or_none(gen: AsyncGenerator[_T, Any]) -> Optional[_T]:
+        last = None
+        async for m in gen:
+            last = m
+        return last
+
     @classmethod
     async def success_info(cls, text: str, **kwargs):
         await cls.reply(text, **kwargs)
@@ -86,14 +159,24 @@ class TelegramBotBaseWrapper(object):
             texts = longtext_split(text)
         if "reply_to_message_id" not in kwargs:
             kwargs["reply_to_message_id"] = message.id
+        if cls._long_text_as_document(texts):
+            kwargs["chat_id"] = message.chat_id
+            yield await cls._send_long_text_document(
+                message.get_bot().send_document, text, len(texts), **kwargs
+            )
+            return
         async for m in cls._sequence_send(message.reply_text, texts, **kwargs):
             yield m
 
     ##############################
 
+    # in a handler that coalesces replies, `reply` and `reply_v3` return `None`
+    # and `reply_v2` and `reply_v4` return `[]` for a buffered reply.
+
     @classmethod
     async def reply(cls, text: str, **kwargs):
-        return (await cls._get_last(cls._reply(text, **kwargs))).id
+        message = await cls._get_last_or_none(cls._reply(text, **kwargs))
+        return None if message is None else message.id
 
     @classmethod
     async def reply_v2(cls, text: str, **kwargs):
@@ -101,12 +184,20 @@ class TelegramBotBaseWrapper(object):
 
     @classmethod
     async def reply_v3(cls, text: str, **kwargs):
-        return await cls._get_last(cls._reply(text, **kwargs))
+        return await cls._get_last_or_none(cls._reply(text, **kwargs))
 
     @classmethod
     async def reply_v4(cls, text: str, **kwargs):
         return [m async for m in cls._reply(text, **kwargs)]
 
+    @classmethod
+    def reply_stream(cls, interval: float = 1.0, **kwargs) -> ReplyStream:
+        """
+        get a writer that shows its text as one reply, edited at most once per `interval` seconds.
+        see `ReplyStream`.
+        """
+        return ReplyStream(cls, interval, **kwargs)
+
     @classmethod
     async def _reply(cls, text: str, **kwargs):
         context = cls.get_context()
@@ -119,13 +210,39 @@ class TelegramBotBaseWrapper(object):
             and not context.is_callback_query()
         ):
             kwargs["reply_to_message_id"] = context.message_id
+        coalescer = get_reply_coalescer()
+        if coalescer is not None and coalescer.add(text, kwargs):
+            return
+        async for m in cls.reply_prepared(text, **kwargs):
+            yield m
+
+    @classmethod
+    async def reply_prepared(cls, text: str, **kwargs):
+        """
+        send a reply whose `chat_id` and reply target are already set, without coalescing.
+        """
+        context = cls.get_context()
         if "entities" in kwargs:
             texts = [text]
         else:
             texts = longtext_split(text)
+        if cls._long_text_as_document(texts):
+            yield await cls._send_long_text_document(
+                context.bot.send_document, text, len(texts), **kwargs
+            )
+            return
         async for m in cls._sequence_send(context.bot.send_message, texts, **kwargs):
             yield m
 
+    @classmethod
+    async def flush_replies(cls) -> None:
+        """
+        send the replies buffered so far, if the running handler coalesces replies.
+        """
+        coalescer = get_reply_coalescer()
+        if coalescer is not None:
+            await coalescer.flush()
+
     ##############################
 
     @classmethod
@@ -153,21 +270,142 @@ class TelegramBotBaseWrapper(object):
         else:
             texts = longtext_split(text)
         kwargs["chat_id"] = chat_id
-        async for m in cls._sequence_send(
-            get_bot_instance().bot.send_message, texts, **kwargs
-        ):
+        bot = get_bot_instance().bot
+        if cls._long_text_as_document(texts):
+            yield await cls._send_long_text_document(
+                bot.send_document, text, len(texts), **kwargs
+            )
+            return
+        async for m in cls._sequence_send(bot.send_message, texts, **kwargs):
             yield m
 
     ##############################
 
     @classmethod
-    async def send_photo(cls, chat_id, photo, **kwargs) -> "Message":
+    async def reply_paged(cls, text: str, **kwargs) -> "Message":
+        """
+        reply a long text as one message showing one page at a time, with prev/next buttons.
+        see `PagedText`.
+        with `reply_markup`, the pages are sent as separate messages, the last one with the markup.
+        with `entities`, the text can not be split, and `ValueError` is raised if it is too long.
+        """
+        context = cls.get_context()
+        kwargs.setdefault("chat_id", context.chat_id)
+        chat_id: int = kwargs["chat_id"]
+        if (
+            chat_id == context.chat_id
+            and context.message_id is not None
+            and "reply_to_message_id" not in kwargs
+            and not context.is_callback_query()
+        ):
+            kwargs["reply_to_message_id"] = context.message_id
+        return await cls._send_paged(context.bot.send_message, text, **kwargs)
+
+    @classmethod
+    async def send_paged(cls, chat_id: int, text: str, **kwargs) -> "Message":
+        from antares_bot.bot_inst import get_bot_instance
+
         kwargs["chat_id"] = chat_id
-        kwargs["photo"] = photo
+        return await cls._send_paged(
+            get_bot_instance().bot.send_message, text, **kwargs
+        )
+
+    @classmethod
+    async def _send_paged(
+        cls, interface_func: Callable[..., Awaitable["Message"]], text: str, **kwargs
+    ) -> "Message":
+        if "entities" in kwargs:
+            # the entities can not be split
+            if utf16_len(text) >= TEXT_LENGTH_LIMIT:
+                raise ValueError("text with entities is too long for one message")
+            return await cls._get_last(
+                cls._sequence_send(interface_func, [text], **kwargs)
+            )
+        if "reply_markup" in kwargs:
+            # no room for the buttons, the markup goes to the last message
+            return await cls._get_last(
+                cls._sequence_send(interface_func, longtext_split(text), **kwargs)
+            )
         from antares_bot.bot_inst import get_bot_instance
 
+        parse_mode = kwargs.pop("parse_mode", None)
+        entities: Optional[List[List["MessageEntity"]]] = None
+        if parse_mode == ParseMode.MARKDOWN:
+            pages, entities = longtext_markdown_split(text)
+        else:
+            pages = longtext_split(text)
+        if len(pages) <= 1:
+            if parse_mode is not None:
+                kwargs["parse_mode"] = parse_mode
+            return await cls._send_ignore_parsemode_or_replyto_exceptions(
+                interface_func, text=text, **kwargs
+            )
+        cb_manager = get_bot_instance().callback_manager
+        paged = PagedText(cb_manager, pages, entities, parse_mode)
+        message = await cls._send_ignore_parsemode_or_replyto_exceptions(
+            interface_func,
+            reply_markup=paged.get_reply_markup(),
+            **paged.text_kwargs(),
+            **kwargs,
+        )
+        cb_manager.index_message_keys(message.chat_id, message.id, [paged.key])
+        return message
+
+    ##############################
+
+    @classmethod
+    def _long_text_as_document(cls, texts: List[str]) -> bool:
+        """
+        policy hook: whether a text split into `texts` is sent as one document instead.
+        by default, texts of more than `LONG_TEXT_AS_DOCUMENT_ABOVE` messages in `AntaresBotConfig`.
+        """
+        threshold = read_user_cfg(AntaresBotConfig, "LONG_TEXT_AS_DOCUMENT_ABOVE")
+        return threshold is not None and len(texts) > threshold
+
+    @classmethod
+    async def _send_long_text_document(
+        cls,
+        interface_func: Callable[..., Awaitable["Message"]],
+        text: str,
+        chunk_count: int,
+        **kwargs,
+    ) -> "Message":
+        """
+        send `text` as a text file, gzip-compressed if `LONG_TEXT_DOCUMENT_GZIP` is set,
+        with the beginning of it as the caption.
+        """
+        data = text.encode("utf-8")
+        filename = "message.txt"
+        if read_user_cfg(AntaresBotConfig, "LONG_TEXT_DOCUMENT_GZIP"):
+            data = gzip.compress(data)
+            filename += ".gz"
+        preview = text[:LONG_TEXT_PREVIEW_LENGTH].rstrip()
+        if len(text) > LONG_TEXT_PREVIEW_LENGTH:
+            preview += "..."
+        caption = (
+            preview
+            + "\n\n"
+            + Lang.t(Lang.LONG_TEXT_AS_DOCUMENT).format(len(text), chunk_count)
+        )
+        # the preview is cut at an arbitrary place, so it is sent without parse_mode
+        document_kwargs = {k: v for k, v in kwargs.items() if k in _DOCUMENT_KWARGS}
         return await cls._send_ignore_parsemode_or_replyto_exceptions(
-            get_bot_instance().bot.send_photo, _no_retry=True, **kwargs
+            interface_func,
+            document=data,
+            filename=filename,
+            caption=caption,
+            **document_kwargs,
+        )
+
+    ##############################
+
+    @classmethod
+    async def send_photo(cls, chat_id, photo, **kwargs) -> "Message":
+        kwargs["chat_id"] = chat_id
+        from antares_bot.bot_inst import get_bot_instance
+
+        return await cls._send_media(
+            get_bot_instance().bot.send_photo, "photo", photo, **kwargs
         )
 
     @classmethod
@@ -182,19 +420,15 @@ class TelegramBotBaseWrapper(object):
             and not context.is_callback_query()
         ):
             kwargs["reply_to_message_id"] = context.message_id
-        kwargs["photo"] = photo
-        return await cls._send_ignore_parsemode_or_replyto_exceptions(
-            context.bot.send_photo, _no_retry=True, **kwargs
-        )
+        return await cls._send_media(context.bot.send_photo, "photo", photo, **kwargs)
 
     @classmethod
     async def send_document(cls, chat_id, document, **kwargs) -> "Message":
         kwargs["chat_id"] = chat_id
-        kwargs["document"] = document
         from antares_bot.bot_inst import get_bot_instance
 
-        return await cls._send_ignore_parsemode_or_replyto_exceptions(
-            get_bot_instance().bot.send_document, _no_retry=True, **kwargs
+        return await cls._send_media(
+            get_bot_instance().bot.send_document, "document", document, **kwargs
         )
 
     @classmethod
@@ -209,10 +443,184 @@ class TelegramBotBaseWrapper(object):
             and not context.is_callback_query()
         ):
             kwargs["reply_to_message_id"] = context.message_id
-        kwargs["document"] = document
-        return await cls._send_ignore_parsemode_or_replyto_exceptions(
-            context.bot.send_document, _no_retry=True, **kwargs
+        return await cls._send_media(
+            context.bot.send_document, "document", document, **kwargs
+        )
+
+    @classmethod
+    async def _send_media(
+        cls,
+        interface_func: Callable[..., Awaitable["Message"]],
+        kind: str,
+        media: Any,
+        **kwargs,
+    ) -> "Message":
+        """
+        send a photo or document, by the cached `file_id` if the same content was uploaded before.
+        """
+        cache = await get_file_id_cache()
+        key = None if cache is None else file_id_cache_key(media)
+        if cache is not None and key is not None:
+            file_id = cache.get(key, kind)
+            if file_id is not None:
+                kwargs[kind] = file_id
+                try:
+                    message = await cls._send_ignore_parsemode_or_replyto_exceptions(
+                        interface_func, _no_retry=True, **kwargs
+                    )
+                except BadRequest as e:
+                    if not is_stale_file_id_error(e):
+                        raise
+                    _LOGGER.warning("cached file_id of %s is rejected: %s", key, e)
+                    await cache.invalidate(key, kind)
+                else:
+                    await cache.touch(key, kind)
+                    return message
+        kwargs[kind] = media
+        message = await cls._send_ignore_parsemode_or_replyto_exceptions(
+            interface_func, _no_retry=True, **kwargs
+        )
+        if cache is not None and key is not None:
+            attachment = message.effective_attachment
+            if isinstance(attachment, tuple):
+                # photo sizes, the largest is the last
+                attachment = attachment[-1] if attachment else None
+            file_id = getattr(attachment, "file_id", None)
+            if file_id is not None:
+                await cache.put(key, kind, file_id)
+        return message
+
+    @classmethod
+    async def download_media(
+        cls,
+        media: Any = None,
+        max_side: Optional[int] = None,
+        max_file_size: Optional[int] = None,
+    ) -> str:
+        """
+        download a photo, document, ... through the shared download service and return the local path.
+        defaults to the attachment of the current message; for photos, the size is chosen
+        by `max_side` and `max_file_size`.
+        """
+        if media is None:
+            update = cls.get_context().current_update
+            message = None if update is None else update.effective_message
+            media = None if message is None else message.effective_attachment
+            if media is None:
+                raise ValueError("the current message has no attachment")
+        return await get_download_service().download(
+            media, max_side=max_side, max_file_size=max_file_size
+        )
+
+    ##############################
+
+    @classmethod
+    async def broadcast(
+        cls,
+        chat_ids: Iterable[int],
+        text: str,
+        broadcast_id: Optional[str] = None,
+        concurrency: int = 8,
+        **kwargs,
+    ) -> BroadcastResult:
+        """
+        send `text` to every chat in `chat_ids`, `concurrency` chats at a time,
+        in the low priority lane of flood control (always paced, even if `FLOOD_CONTROL` is off).
+        per-chat results are saved in `DATA_DIR/broadcast.db`.
+        call again with the returned `broadcast_id` to resume: finished chats are skipped,
+        and only failed or unattempted chats are sent again.
+        """
+        from antares_bot.bot_inst import get_bot_instance
+
+        store = await get_broadcast_store()
+        if broadcast_id is None:
+            broadcast_id = uuid.uuid4().hex
+        finished = await store.finished_chats(broadcast_id)
+        pending = [
+            chat_id for chat_id in dict.fromkeys(chat_ids) if chat_id not in finished
+        ]
+        skipped = len(finished)
+        if "entities" in kwargs:
+            texts = [text]
+        else:
+            texts = longtext_split(text)
+        send_message = get_bot_instance().bot.send_message
+        # `_call_api` paces the calls if flood control is on, otherwise pace them here
+        scheduler = None if get_flood_control() is not None else FloodControlScheduler()
+
+        counts: Dict[int, int] = {
+            BROADCAST_SENT: 0,
+            BROADCAST_FORBIDDEN: 0,
+            BROADCAST_MIGRATED: 0,
+            BROADCAST_FAILED: 0,
+        }
+        results: List[Tuple[int, int, Optional[str]]] = []
+
+        async def _flush():
+            nonlocal results
+            batch, results = results, []
+            await store.record(cast(str, broadcast_id), batch)
+
+        async def _worker(chat_iter):
+            for chat_id in chat_iter:
+                interface_func = (
+                    send_message
+                    if scheduler is None
+                    else scheduler.paced(send_message, chat_id, PRIORITY_LOW)
+                )
+                status, detail = await cls._broadcast_one(
+                    interface_func, chat_id, texts, **kwargs
+                )
+                counts[status] += 1
+                results.append((chat_id, status, detail))
+                if len(results) >= cls.BROADCAST_FLUSH_EVERY:
+                    await _flush()
+
+        chat_iter = iter(pending)
+        try:
+            await asyncio.gather(
+                *(_worker(chat_iter) for _ in range(min(concurrency, len(pending))))
+            )
+        finally:
+            await _flush()
+        _LOGGER.info(
+            "broadcast %s: %d sent, %d forbidden, %d migrated, %d failed, %d skipped",
+            broadcast_id,
+            counts[BROADCAST_SENT],
+            counts[BROADCAST_FORBIDDEN],
+            counts[BROADCAST_MIGRATED],
+            counts[BROADCAST_FAILED],
+            skipped,
         )
+        return BroadcastResult(
+            broadcast_id,
+            counts[BROADCAST_SENT],
+            counts[BROADCAST_FORBIDDEN],
+            counts[BROADCAST_MIGRATED],
+            counts[BROADCAST_FAILED],
+            skipped,
+        )
+
+    @classmethod
+    async def _broadcast_one(
+        cls,
+        interface_func: Callable[..., Awaitable["Message"]],
+        chat_id: int,
+        texts: List[str],
+        **kwargs,
+    ) -> Tuple[int, Optional[str]]:
+        try:
+            async for _ in cls._sequence_send(
+                interface_func, texts, chat_id=chat_id, _priority=PRIORITY_LOW, **kwargs
+            ):
+                pass
+        except Forbidden as e:
+            return BROADCAST_FORBIDDEN, str(e)
+        except ChatMigrated as e:
+            return BROADCAST_MIGRATED, str(e.new_chat_id)
+        except TelegramError as e:
+            return BROADCAST_FAILED, str(e)
+        return BROADCAST_SENT, None
 
     ##############################
 
@@ -260,25 +668,79 @@ class TelegramBotBaseWrapper(object):
                 await asyncio.sleep(_sleep_time)
         raise RuntimeError(f"unreachable: RETRY_TIMES={cls.RETRY_TIMES}")
 
+    @classmethod
+    async def _call_api(
+        cls,
+        interface_func: Callable[..., Awaitable[_T]],
+        _no_retry=False,
+        _priority: Optional[int] = None,
+        **kwargs,
+    ) -> _T:
+        coalescer = get_reply_coalescer()
+        if coalescer is not None:
+            # the buffered replies go first, to keep the order of the messages
+            await coalescer.flush()
+        flood_control = get_flood_control()
+        if flood_control is not None:
+            interface_func = flood_control.paced(
+                interface_func, kwargs.get("chat_id"), _priority
+            )
+        if _no_retry:
+            return await interface_func(**kwargs)
+        return await cls._retry_call(interface_func, **kwargs)
+
+    @classmethod
+    def _precheck_send_kwargs(cls, kwargs: dict) -> None:
+        """
+        avoid the requests Telegram is sure to reject, instead of waiting for a `BadRequest`.
+        """
+        if "reply_to_message_id" in kwargs and "reply_parameters" not in kwargs:
+            # send anyway if the message to reply is gone
+            kwargs.setdefault("allow_sending_without_reply", True)
+        parse_mode = kwargs.get("parse_mode")
+        if parse_mode is not None and "entities" not in kwargs:
+            text = kwargs.get("text", kwargs.get("caption"))
+            if isinstance(text, str) and not is_valid_parse_mode_text(text, parse_mode):
+                _LOGGER.warning(
+                    "text is not valid %s, sending without parse_mode", parse_mode
+                )
+                del kwargs["parse_mode"]
+                SEND_FALLBACK_STATS["parse_mode_precheck"] += 1
+
+    @classmethod
+    async def call_with_fallback(
+        cls, interface_func: Callable[..., Awaitable["Message"]], **kwargs
+    ) -> "Message":
+        """
+        call a send or edit method of the bot, e.g. `edit_message_text`, with the same
+        fallbacks as `reply`: retry without `parse_mode`, or without the message to reply,
+        when Telegram rejects the request because of them.
+        """
+        return await cls._send_ignore_parsemode_or_replyto_exceptions(
+            interface_func, **kwargs
+        )
+
     @classmethod
     async def _send_ignore_parsemode_or_replyto_exceptions(
         cls,
         interface_func: Callable[..., Awaitable["Message"]],
         _no_retry=False,
+        _priority: Optional[int] = None,
         **kwargs,
     ) -> "Message":
+        cls._precheck_send_kwargs(kwargs)
         try:
-            if _no_retry:
-                return await interface_func(**kwargs)
-            return await cls._retry_call(interface_func, **kwargs)
+            return await cls._call_api(interface_func, _no_retry, _priority, **kwargs)
         except BadRequest as e:
             if str(e).find("reply") != -1:
                 _LOGGER.error(
                     "send message failed, retrying by popping reply_to_message_id"
                 )
                 if kwargs.pop("reply_to_message_id", None) is not None:
+                    SEND_FALLBACK_STATS["reply_retry"] += 1
+                    kwargs.pop("allow_sending_without_reply", None)
                     return await cls._send_ignore_parsemode_or_replyto_exceptions(
-                        interface_func, _no_retry, **kwargs
+                        interface_func, _no_retry, _priority, **kwargs
                     )
             if str(e).find("parse") != -1:
                 parse_mode = kwargs.pop("parse_mode", None)
@@ -288,8 +750,9 @@ class TelegramBotBaseWrapper(object):
                     "send message failed, retrying by popping parse_mode: %s",
                     parse_mode,
                 )
+                SEND_FALLBACK_STATS["parse_mode_retry"] += 1
                 ret = await cls._send_ignore_parsemode_or_replyto_exceptions(
-                    interface_func, _no_retry, **kwargs
+                    interface_func, _no_retry, _priority, **kwargs
                 )
                 # reset parse_mode for the next call
                 kwargs["parse_mode"] = parse_mode
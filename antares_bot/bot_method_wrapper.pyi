@@ -1,4 +1,14 @@
-from typing import Any, Generator, Literal, Optional, Sequence, Union
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Generator,
+    Iterable,
+    Literal,
+    Optional,
+    Sequence,
+    Union,
+)
 
 from telegram import (
     Document,
@@ -8,11 +18,15 @@ from telegram import (
     PhotoSize,
     ReplyParameters,
 )
+from telegram._files._basemedium import _BaseMedium
 from telegram._message import _ReplyKwargs
 from telegram._utils.defaultvalue import DEFAULT_NONE
 from telegram._utils.types import DVInput, FileInput, JSONDict, ODVInput, ReplyMarkup
 from telegram.ext._utils.types import RLARGS
 
+from antares_bot.broadcast import BroadcastResult
+from antares_bot.reply_stream import ReplyStream
+
 class TelegramBotBaseWrapper(object):
     @classmethod
     async def success_info(
@@ -224,7 +238,7 @@ class TelegramBotBaseWrapper(object):
         pool_timeout: ODVInput[float] = DEFAULT_NONE,
         api_kwargs: Optional[JSONDict] = None,
         rate_limit_args: Optional[RLARGS] = None,
-    ) -> int: ...
+    ) -> Optional[int]: ...
     @classmethod
     async def reply_v2(
         cls,
@@ -278,7 +292,7 @@ class TelegramBotBaseWrapper(object):
         pool_timeout: ODVInput[float] = DEFAULT_NONE,
         api_kwargs: Optional[JSONDict] = None,
         rate_limit_args: Optional[RLARGS] = None,
-    ) -> Message: ...
+    ) -> Optional[Message]: ...
     @classmethod
     async def reply_v4(
         cls,
@@ -307,6 +321,47 @@ class TelegramBotBaseWrapper(object):
         rate_limit_args: Optional[RLARGS] = None,
     ) -> list[Message]: ...
     @classmethod
+    def reply_stream(
+        cls,
+        interval: float = 1.0,
+        *,
+        chat_id: Union[int, str, None] = None,
+        parse_mode: ODVInput[str] = DEFAULT_NONE,
+        disable_notification: ODVInput[bool] = DEFAULT_NONE,
+        protect_content: ODVInput[bool] = DEFAULT_NONE,
+        reply_markup: Optional[ReplyMarkup] = None,
+        message_thread_id: Optional[int] = None,
+        link_preview_options: ODVInput["LinkPreviewOptions"] = DEFAULT_NONE,
+        reply_to_message_id: Optional[int] = None,
+    ) -> ReplyStream: ...
+    @classmethod
+    async def reply_paged(
+        cls,
+        text: str,
+        *,
+        chat_id: Union[int, str, None] = None,
+        parse_mode: ODVInput[str] = DEFAULT_NONE,
+        entities: Optional[Sequence["MessageEntity"]] = None,
+        disable_notification: ODVInput[bool] = DEFAULT_NONE,
+        protect_content: ODVInput[bool] = DEFAULT_NONE,
+        reply_markup: Optional[ReplyMarkup] = None,
+        message_thread_id: Optional[int] = None,
+        link_preview_options: ODVInput["LinkPreviewOptions"] = DEFAULT_NONE,
+        reply_parameters: Optional["ReplyParameters"] = None,
+        business_connection_id: Optional[str] = None,
+        message_effect_id: Optional[str] = None,
+        allow_paid_broadcast: Optional[bool] = None,
+        disable_web_page_preview: Optional[bool] = None,
+        reply_to_message_id: Optional[int] = None,
+        allow_sending_without_reply: ODVInput[bool] = DEFAULT_NONE,
+        read_timeout: ODVInput[float] = DEFAULT_NONE,
+        write_timeout: ODVInput[float] = DEFAULT_NONE,
+        connect_timeout: ODVInput[float] = DEFAULT_NONE,
+        pool_timeout: ODVInput[float] = DEFAULT_NONE,
+        api_kwargs: Optional[JSONDict] = None,
+        rate_limit_args: Optional[RLARGS] = None,
+    ) -> Message: ...
+    @classmethod
     async def _reply(
         cls,
         text: str,
@@ -334,6 +389,39 @@ class TelegramBotBaseWrapper(object):
         rate_limit_args: Optional[RLARGS] = None,
     ) -> Generator[Message, Any, None]: ...
     @classmethod
+    async def reply_prepared(
+        cls,
+        text: str,
+        *,
+        chat_id: Union[int, str, None] = None,
+        parse_mode: ODVInput[str] = DEFAULT_NONE,
+        entities: Optional[Sequence["MessageEntity"]] = None,
+        disable_notification: ODVInput[bool] = DEFAULT_NONE,
+        protect_content: ODVInput[bool] = DEFAULT_NONE,
+        reply_markup: Optional[ReplyMarkup] = None,
+        message_thread_id: Optional[int] = None,
+        link_preview_options: ODVInput["LinkPreviewOptions"] = DEFAULT_NONE,
+        reply_parameters: Optional["ReplyParameters"] = None,
+        business_connection_id: Optional[str] = None,
+        message_effect_id: Optional[str] = None,
+        allow_paid_broadcast: Optional[bool] = None,
+        disable_web_page_preview: Optional[bool] = None,
+        reply_to_message_id: Optional[int] = None,
+        allow_sending_without_reply: ODVInput[bool] = DEFAULT_NONE,
+        read_timeout: ODVInput[float] = DEFAULT_NONE,
+        write_timeout: ODVInput[float] = DEFAULT_NONE,
+        connect_timeout: ODVInput[float] = DEFAULT_NONE,
+        pool_timeout: ODVInput[float] = DEFAULT_NONE,
+        api_kwargs: Optional[JSONDict] = None,
+        rate_limit_args: Optional[RLARGS] = None,
+    ) -> Generator[Message, Any, None]: ...
+    @classmethod
+    async def call_with_fallback(
+        cls, interface_func: Callable[..., Awaitable[Message]], **kwargs: Any
+    ) -> Message: ...
+    @classmethod
+    async def flush_replies(cls) -> None: ...
+    @classmethod
     async def send_to(
         cls,
         chat_id: int,
@@ -442,6 +530,33 @@ class TelegramBotBaseWrapper(object):
         rate_limit_args: Optional[RLARGS] = None,
     ) -> list[Message]: ...
     @classmethod
+    async def send_paged(
+        cls,
+        chat_id: int,
+        text: str,
+        *,
+        parse_mode: ODVInput[str] = DEFAULT_NONE,
+        entities: Optional[Sequence[MessageEntity]] = None,
+        disable_notification: DVInput[bool] = DEFAULT_NONE,
+        protect_content: ODVInput[bool] = DEFAULT_NONE,
+        reply_markup: Optional[ReplyMarkup] = None,
+        message_thread_id: Optional[int] = None,
+        link_preview_options: ODVInput["LinkPreviewOptions"] = DEFAULT_NONE,
+        reply_parameters: Optional["ReplyParameters"] = None,
+        business_connection_id: Optional[str] = None,
+        message_effect_id: Optional[str] = None,
+        allow_paid_broadcast: Optional[bool] = None,
+        disable_web_page_preview: ODVInput[bool] = DEFAULT_NONE,
+        reply_to_message_id: Optional[int] = None,
+        allow_sending_without_reply: ODVInput[bool] = DEFAULT_NONE,
+        read_timeout: ODVInput[float] = DEFAULT_NONE,
+        write_timeout: ODVInput[float] = DEFAULT_NONE,
+        connect_timeout: ODVInput[float] = DEFAULT_NONE,
+        pool_timeout: ODVInput[float] = DEFAULT_NONE,
+        api_kwargs: Optional[JSONDict] = None,
+        rate_limit_args: Optional[RLARGS] = None,
+    ) -> Message: ...
+    @classmethod
     async def _send_to(
         cls,
         chat_id: int,
@@ -585,3 +700,37 @@ class TelegramBotBaseWrapper(object):
         api_kwargs: Optional[JSONDict] = None,
         rate_limit_args: Optional[RLARGS] = None,
     ) -> Message: ...
+    @classmethod
+    async def download_media(
+        cls,
+        media: Union[_BaseMedium, Sequence[PhotoSize], None] = None,
+        max_side: Optional[int] = None,
+        max_file_size: Optional[int] = None,
+    ) -> str: ...
+    ##############################
+    @classmethod
+    async def broadcast(
+        cls,
+        chat_ids: Iterable[int],
+        text: str,
+        broadcast_id: Optional[str] = None,
+        concurrency: int = 8,
+        *,
+        parse_mode: ODVInput[str] = DEFAULT_NONE,
+        entities: Optional[Sequence[MessageEntity]] = None,
+        disable_notification: DVInput[bool] = DEFAULT_NONE,
+        protect_content: ODVInput[bool] = DEFAULT_NONE,
+        reply_markup: Optional[ReplyMarkup] = None,
+        message_thread_id: Optional[int] = None,
+        link_preview_options: ODVInput["LinkPreviewOptions"] = DEFAULT_NONE,
+        business_connection_id: Optional[str] = None,
+        message_effect_id: Optional[str] = None,
+        allow_paid_broadcast: Optional[bool] = None,
+        disable_web_page_preview: ODVInput[bool] = DEFAULT_NONE,
+        read_timeout: ODVInput[float] = DEFAULT_NONE,
+        write_timeout: ODVInput[float] = DEFAULT_NONE,
+        connect_timeout: ODVInput[float] = DEFAULT_NONE,
+        pool_timeout: ODVInput[float] = DEFAULT_NONE,
+        api_kwargs: Optional[JSONDict] = None,
+        rate_limit_args: Optional[RLARGS] = None,
+    ) -> BroadcastResult: ...
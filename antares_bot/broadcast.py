@@ -0,0 +1,137 @@
+import os
+import time
+from typing import Iterable, List, NamedTuple, Optional, Set, Tuple, cast
+
+from antares_bot.sqlite.creater import INT, REAL, TEXT, DbDeclarer
+from antares_bot.sqlite.manager import Database
+
+
+BROADCAST_SENT = 1
+BROADCAST_FORBIDDEN = 2
+BROADCAST_MIGRATED = 3
+BROADCAST_FAILED = 4
+
+# chats with these statuses are skipped when a broadcast is resumed
+BROADCAST_FINISHED_STATUSES = (BROADCAST_SENT, BROADCAST_FORBIDDEN, BROADCAST_MIGRATED)
+
+_INSERT_BATCH = 100
+
+
+class BroadcastResult(NamedTuple):
+    broadcast_id: str
+    sent: int
+    forbidden: int
+    migrated: int
+    failed: int
+    skipped: int
+
+
+class BroadcastStore:
+    """
+    Per-chat status of broadcasts, so that an interrupted broadcast can be resumed
+    and chats that blocked the bot or migrated can be pruned afterwards.
+    For `BROADCAST_MIGRATED`, `detail` is the new chat id; otherwise it is the error message.
+    """
+
+    TABLE_NAME = "broadcast_status"
+
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+        self.db: Optional[Database] = None
+
+    @property
+    def connected(self) -> bool:
+        return self.db is not None and self.db.conn is not None
+
+    async def connect(self) -> None:
+        declarer = DbDeclarer().declare(self.db_path)
+        declarer.declare_table(self.TABLE_NAME).declare_col(
+            "broadcast_id", TEXT, is_primary=True
+        ).declare_col("chat_id", INT, is_primary=True).declare_col(
+            "status", INT, is_not_null=True
+        ).declare_col(
+            "detail", TEXT
+        ).declare_col(
+            "updated_at", REAL, is_not_null=True
+        )
+        await declarer.create_or_validate()
+        db = Database(self.db_path)
+        await db.connect()
+        self.db = db
+
+    async def finished_chats(self, broadcast_id: str) -> Set[int]:
+        db = cast(Database, self.db)
+        async with db:
+            await db.cursor.execute(
+                f"SELECT chat_id FROM {self.TABLE_NAME} WHERE broadcast_id = ? AND status IN ({','.join('?' * len(BROADCAST_FINISHED_STATUSES))});",
+                (broadcast_id, *BROADCAST_FINISHED_STATUSES),
+            )
+            return {row[0] for row in await db.cursor.fetchall()}
+
+    async def record(
+        self, broadcast_id: str, results: List[Tuple[int, int, Optional[str]]]
+    ) -> None:
+        """
+        save `(chat_id, status, detail)` of a batch of chats.
+        """
+        if not results:
+            return
+        db = cast(Database, self.db)
+        now = time.time()
+        async with db:
+            for i in range(0, len(results), _INSERT_BATCH):
+                await db.insert_nolock(
+                    self.TABLE_NAME,
+                    [
+                        {
+                            "broadcast_id": broadcast_id,
+                            "chat_id": chat_id,
+                            "status": status,
+                            "detail": detail,
+                            "updated_at": now,
+                        }
+                        for chat_id, status, detail in results[i : i + _INSERT_BATCH]
+                    ],
+                )
+
+    async def chats_with_status(
+        self, broadcast_id: str, statuses: Iterable[int]
+    ) -> List[Tuple[int, int, Optional[str]]]:
+        """
+        `(chat_id, status, detail)` of the chats in `statuses`, e.g. for pruning
+        chats with `BROADCAST_FORBIDDEN` or `BROADCAST_MIGRATED`.
+        """
+        statuses = tuple(statuses)
+        db = cast(Database, self.db)
+        async with db:
+            await db.cursor.execute(
+                f"SELECT chat_id, status, detail FROM {self.TABLE_NAME} WHERE broadcast_id = ? AND status IN ({','.join('?' * len(statuses))});",
+                (broadcast_id, *statuses),
+            )
+            return [(row[0], row[1], row[2]) for row in await db.cursor.fetchall()]
+
+    async def drop(self, broadcast_id: str) -> None:
+        db = cast(Database, self.db)
+        async with db:
+            await db.delete_nolock(
+                self.TABLE_NAME, where={"broadcast_id": broadcast_id}
+            )
+
+
+_store: Optional[BroadcastStore] = None
+
+
+async def get_broadcast_store() -> BroadcastStore:
+    """
+    the shared store at `DATA_DIR/broadcast.db`, connected on first use.
+    """
+    global _store
+    if _store is None or not _store.connected:
+        from antares_bot.bot_inst import get_bot_instance
+
+        store = BroadcastStore(
+            os.path.join(get_bot_instance().data_dir(), "broadcast.db")
+        )
+        await store.connect()
+        _store = store
+    return _store
@@ -1,89 +1,872 @@
 import bisect
+import heapq
+import io
+import pickle
+import sys
 import time
+import weakref
+import zlib
+from array import array
+from collections import OrderedDict
 from typing import (
-    TYPE_CHECKING,
     Any,
+    AsyncIterator,
+    Awaitable,
     Callable,
     Dict,
     Generic,
     Iterable,
     List,
+    NamedTuple,
     Optional,
+    Sequence,
+    Set,
     Tuple,
     TypeVar,
     Union,
+    cast,
 )
 
-from telegram import InlineKeyboardButton
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, MessageEntity
+from telegram.constants import InlineKeyboardButtonLimit
 
+from antares_bot.bot_logging import get_logger
+from antares_bot.sqlite.creater import BLOB, INT, REAL, DbDeclarer
+from antares_bot.sqlite.manager import Database
 from antares_bot.utils import flatten_button
 
 
-if TYPE_CHECKING:
-    from telegram import InlineKeyboardMarkup
-
 _DataType = TypeVar("_DataType")
 
+DEFAULT_CALLBACK_DATA_TTL = 24 * 60 * 60  # seconds
+DEFAULT_CALLBACK_DATA_EXPIRE_INTERVAL = 60  # seconds
+EPOCH_BASE = 1704067200
+"""2024-01-01 UTC, so that keys fit in a signed 64-bit SQLite column until about 2092"""
+EPOCH_SHIFT = 32
+"""keys are `epoch << EPOCH_SHIFT | counter`, where epoch is the boot time in seconds after `EPOCH_BASE`"""
+_COMPRESS_THRESHOLD = 256
+# rows per INSERT, to stay below the bound-variable limit of SQLite
+_INSERT_BATCH = 100
+
+_KEY_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+_KEY_INDEX = {c: i for i, c in enumerate(_KEY_ALPHABET)}
+# leads every encoded key, so that they are never mistaken for legacy decimal keys
+_KEY_MARKER = "~"
+
+_LOGGER = get_logger(__name__)
+
+
+def _key_checksum(n_id: int) -> int:
+    return zlib.crc32(n_id.to_bytes(8, "little")) & 63
+
+
+def encode_callback_key(n_id: int) -> str:
+    """
+    encode an int key of the callback manager into `_KEY_MARKER`, base-64 digits
+    and one checksum digit.
+    """
+    if n_id < 0:
+        raise ValueError("Invalid key")
+    digits = [_KEY_ALPHABET[_key_checksum(n_id)]]
+    while True:
+        digits.append(_KEY_ALPHABET[n_id & 63])
+        n_id >>= 6
+        if n_id == 0:
+            break
+    digits.append(_KEY_MARKER)
+    digits.reverse()
+    return "".join(digits)
+
+
+def parse_callback_key(_id: Union[str, int]) -> int:
+    """
+    parse a key returned by `CallbackDataManager.set_data`, or a legacy decimal key.
+    raise `ValueError` if the key is invalid.
+    """
+    if isinstance(_id, int):
+        return _id
+    if not _id.startswith(_KEY_MARKER):
+        if _id.isascii() and _id.isdigit():
+            return int(_id)
+        raise ValueError(f"Invalid key: {_id!r}")
+    n_id = 0
+    try:
+        for c in _id[1:-1]:
+            n_id = (n_id << 6) | _KEY_INDEX[c]
+        if len(_id) > 2 and _KEY_INDEX[_id[-1]] == _key_checksum(n_id):
+            return n_id
+    except KeyError:
+        pass
+    raise ValueError(f"Invalid key: {_id!r}")
+
+
+class CallbackDataKey(NamedTuple):
+    """
+    decoded callback data of the form `tag:key`.
+    `id` is the int key of the callback manager, or `None` if `key` is not a valid key.
+    """
+
+    tag: str
+    key: str
+    id: Optional[int]
+
+
+def format_callback_data(tag: str, key: Any) -> str:
+    """
+    format the `callback_data` of a button as `tag:key`.
+    raise `ValueError` if it exceeds the limit of Telegram.
+    """
+    ret = f"{tag}:{key}"
+    if len(ret.encode()) > InlineKeyboardButtonLimit.MAX_CALLBACK_DATA:
+        raise ValueError(f"callback_data is too long: {ret}")
+    return ret
+
+
+def decode_callback_data(data: str) -> CallbackDataKey:
+    """
+    split `tag:key` at the first colon, and parse the key.
+    in data with more fields like `tag:key:xxx`, `key` is the first field after the tag.
+    """
+    tag, sep, rest = data.partition(":")
+    if not sep:
+        return CallbackDataKey(data, "", None)
+    key = rest.split(":", 1)[0]
+    try:
+        n_id: Optional[int] = parse_callback_key(key)
+    except ValueError:
+        n_id = None
+    return CallbackDataKey(tag, key, n_id)
+
 
 class CallbackHistoryManager:
-    __slots__ = "history_queue"
+    """
+    FIFO of `(time, key)` pairs, kept in two typed arrays instead of a list of tuples.
+    Purged entries are skipped by moving `head`; the dead prefix is dropped once it
+    makes up half of the arrays, so both enqueue and purge are amortized O(1) per entry.
+    """
+
+    __slots__ = ("times", "keys", "head")
 
     def __init__(self) -> None:
-        self.history_queue: List[Tuple[float, int]] = []
+        self.times = array("d")
+        self.keys = array("q")
+        self.head = 0
 
     def enqueue(self, key: int) -> None:
-        self.history_queue.append((time.time(), key))
+        t = time.time()
+        times = self.times
+        if len(times) > self.head and times[-1] > t:
+            # wall clock went backwards, keep the queue sorted
+            t = times[-1]
+        times.append(t)
+        self.keys.append(key)
 
     def pop_before_keys(self, before: float):
-        history_queue = self.history_queue
-        idx = bisect.bisect_left(history_queue, (before, 0))
-        if idx > 0:
-            self.history_queue = history_queue[idx:]
-        yield from (k for _, k in history_queue[:idx])
+        times = self.times
+        head = self.head
+        idx = bisect.bisect_left(times, before, head)
+        if idx == head:
+            return
+        keys = self.keys[head:idx]
+        if idx == len(times):
+            del times[:]
+            del self.keys[:]
+            self.head = 0
+        elif idx * 2 >= len(times):
+            del times[:idx]
+            del self.keys[:idx]
+            self.head = 0
+        else:
+            self.head = idx
+        yield from keys
+
+    def __len__(self) -> int:
+        return len(self.times) - self.head
+
+
+class _KeyboardNotLoaded(Exception):
+    """
+    raised while unpickling an entry that refers to a keyboard only found in the store.
+    """
+
+    def __init__(self, persist_id: int) -> None:
+        super().__init__(persist_id)
+        self.persist_id = persist_id
+
+
+class CallbackDataStore:
+    """
+    SQLite tier of `CallbackDataManager`, built on `Database`.
+    Entries evicted from memory, and all entries left at shutdown, are pickled into it,
+    so that buttons keep working after a restart.
+    """
+
+    TABLE_NAME = "callback_data"
+
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+        self.db: Optional[Database] = None
+
+    @property
+    def connected(self) -> bool:
+        return self.db is not None and self.db.conn is not None
+
+    async def connect(self) -> None:
+        declarer = DbDeclarer().declare(self.db_path)
+        declarer.declare_table(self.TABLE_NAME).declare_col(
+            "key", INT, is_primary=True
+        ).declare_col("expire_at", REAL, is_not_null=True).declare_col(
+            "data", BLOB, is_not_null=True
+        )
+        await declarer.create_or_validate()
+        db = Database(self.db_path)
+        await db.connect()
+        self.db = db
+
+    @staticmethod
+    def serialize(
+        data: Any, persistent_id: Optional[Callable[[Any], Any]] = None
+    ) -> bytes:
+        """
+        `persistent_id` is set on the pickler, see `pickle.Pickler.persistent_id`.
+        """
+        buf = io.BytesIO()
+        pickler = pickle.Pickler(buf, protocol=pickle.HIGHEST_PROTOCOL)
+        if persistent_id is not None:
+            pickler.persistent_id = persistent_id  # type: ignore[method-assign]
+        pickler.dump(data)
+        raw = buf.getvalue()
+        if len(raw) > _COMPRESS_THRESHOLD:
+            compressed = zlib.compress(raw)
+            if len(compressed) < len(raw):
+                return b"z" + compressed
+        return b"p" + raw
+
+    @staticmethod
+    def deserialize(
+        blob: bytes, persistent_load: Optional[Callable[[Any], Any]] = None
+    ) -> Any:
+        """
+        `persistent_load` is set on the unpickler, see `pickle.Unpickler.persistent_load`.
+        """
+        raw = zlib.decompress(blob[1:]) if blob[:1] == b"z" else blob[1:]
+        unpickler = pickle.Unpickler(io.BytesIO(raw))
+        if persistent_load is not None:
+            unpickler.persistent_load = persistent_load  # type: ignore[method-assign]
+        return unpickler.load()
+
+    async def load_epochs(self, now: float) -> Set[int]:
+        """
+        drop expired rows, and return the epochs of the rows left.
+        """
+        db = cast(Database, self.db)
+        async with db:
+            await db.cursor.execute(
+                f"DELETE FROM {self.TABLE_NAME} WHERE expire_at < ?;", (now,)
+            )
+            db.dirty_mark = True
+            await db.cursor.execute(
+                f"SELECT DISTINCT key >> {EPOCH_SHIFT} FROM {self.TABLE_NAME};"
+            )
+            return {row[0] for row in await db.cursor.fetchall()}
+
+    async def peek(self, n_id: int) -> Optional[Tuple[float, bytes]]:
+        """
+        return `(expire_at, blob)` of the row, or `None` if not found.
+        """
+        db = cast(Database, self.db)
+        async with db:
+            rows = await db.select_nolock(self.TABLE_NAME, where={"key": n_id})
+            if not rows:
+                return None
+            return rows[0]["expire_at"], rows[0]["data"]
+
+    async def take(self, n_id: int) -> Optional[Tuple[float, bytes]]:
+        """
+        remove the row and return `(expire_at, blob)`, or `None` if not found.
+        """
+        db = cast(Database, self.db)
+        async with db:
+            rows = await db.select_nolock(self.TABLE_NAME, where={"key": n_id})
+            if not rows:
+                return None
+            await db.delete_nolock(self.TABLE_NAME, where={"key": n_id})
+            return rows[0]["expire_at"], rows[0]["data"]
+
+    async def write(
+        self, rows: Dict[int, Tuple[float, bytes]], deleted: Set[int], now: float
+    ) -> None:
+        """
+        write the rows and delete the keys in one transaction. nothing is written if it fails.
+        """
+        db = cast(Database, self.db)
+        async with db:
+            try:
+                for n_id in deleted:
+                    await db.delete_nolock(self.TABLE_NAME, where={"key": n_id})
+                items = list(rows.items())
+                for i in range(0, len(items), _INSERT_BATCH):
+                    await db.insert_nolock(
+                        self.TABLE_NAME,
+                        [
+                            {"key": n_id, "expire_at": expire_at, "data": blob}
+                            for n_id, (expire_at, blob) in items[i : i + _INSERT_BATCH]
+                        ],
+                    )
+                await db.cursor.execute(
+                    f"DELETE FROM {self.TABLE_NAME} WHERE expire_at < ?;", (now,)
+                )
+                db.dirty_mark = True
+            except BaseException:
+                # `Database` commits the partial write on exit otherwise
+                await db.get_cur_connection().rollback()
+                db.dirty_mark = False
+                raise
 
 
 class CallbackDataManager:
-    __slots__ = ("id", "_dict", "history")
+    """
+    Bounded store of callback data.
 
-    def __init__(self) -> None:
-        self.id = 0
-        self._dict: Dict[int, Any] = {}
+    Every entry expires `ttl` seconds after it is stored (`default_ttl` if not given).
+    If `max_entries` or `max_bytes` is set, the least recently used entries are evicted
+    once the limit is exceeded. `max_bytes` is compared against a shallow estimate
+    (`sys.getsizeof`) of the stored data, so it is only an approximate budget.
+
+    Expired entries are purged incrementally: a little on every `set_data`, and
+    periodically by calling `expire()` (the bot schedules it on the job queue).
+
+    Keys are int ids encoded by `encode_callback_key`, and carry the boot epoch in their high bits, so keys of a previous run never
+    collide with new ones and are rejected without a lookup.
+
+    `message_index` maps `(chat_id, message_id)` to the keys used by the buttons of that
+    message. A message is dropped from it as soon as one of its keys expires or is evicted,
+    or once all of its keys are popped. `sweep_message_index()` drops the leftovers. If a `CallbackDataStore`
+    is attached, evicted entries spill to it instead of being dropped, and `persist()`
+    saves everything at shutdown. Entries on disk are only reachable after `fetch()`,
+    which the button pre-executer calls before the handler runs.
+    A `PersistKeyboards` in spilled data is stored once, as a row of its own under its
+    `persist_id`, and the entries refer to it, so that all of its keys share one keyboard
+    again once they are loaded back.
+    """
+
+    __slots__ = (
+        "id",
+        "epoch",
+        "_known_epochs",
+        "_dict",
+        "_sizes",
+        "_bytes",
+        "history",
+        "_histories",
+        "default_ttl",
+        "max_entries",
+        "max_bytes",
+        "store",
+        "_deadlines",
+        "_restored",
+        "_pending_spill",
+        "_flushing",
+        "_pending_delete",
+        "_keyboards",
+        "message_index",
+        "_key_messages",
+        "_message_refs",
+        "hits",
+        "misses",
+        "evictions",
+        "expirations",
+        "spills",
+    )
+
+    def __init__(
+        self,
+        default_ttl: float = DEFAULT_CALLBACK_DATA_TTL,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        store: Optional[CallbackDataStore] = None,
+    ) -> None:
+        if default_ttl <= 0:
+            raise ValueError("Invalid ttl")
+        self.epoch = int(time.time()) - EPOCH_BASE
+        self._known_epochs: Set[int] = {self.epoch}
+        self.id = self.epoch << EPOCH_SHIFT
+        self._dict: OrderedDict[int, Any] = OrderedDict()
+        self._sizes: Dict[int, int] = {}
+        self._bytes = 0
         self.history = CallbackHistoryManager()
+        """history of entries using `default_ttl`"""
+        self._histories: Dict[float, CallbackHistoryManager] = {
+            default_ttl: self.history
+        }
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.store = store
+        # the following are only used when a store is attached
+        self._deadlines: Dict[int, float] = {}
+        self._restored: List[Tuple[float, int]] = []
+        """heap of entries loaded back from the store"""
+        self._pending_spill: Dict[int, Tuple[float, bytes]] = {}
+        self._flushing: Dict[int, Tuple[float, bytes]] = {}
+        self._pending_delete: Set[int] = set()
+        self._keyboards: "weakref.WeakValueDictionary[int, PersistKeyboards]" = (
+            weakref.WeakValueDictionary()
+        )
+        """keyboards in memory by `persist_id`, shared by all entries loaded back"""
+        self.message_index: Dict[Tuple[int, int], List[str]] = {}
+        self._key_messages: Dict[int, Tuple[int, int]] = {}
+        """reverse of `message_index`, only keys in memory"""
+        self._message_refs: Dict[Tuple[int, int], int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.spills = 0
 
-    def set_data(self, data=None) -> str:
+    def set_data(self, data=None, ttl: Optional[float] = None) -> str:
         """
         store data and return the key to retrieve it later.
-        the key is a string of int.
+        the key is a short string, see `encode_callback_key`.
+        the data expires after `ttl` seconds (`default_ttl` if `None`).
         """
         if data is not None:
-            self._dict[self.id] = data
-            self.history.enqueue(self.id)
+            self.expire()
+            self._store(self.id, data, ttl)
         self.id += 1
-        return str(self.id - 1)
+        return encode_callback_key(self.id - 1)
 
     def pop_data(self, _id: Union[str, int]) -> Any:
         """
         pop the data by the key.
         """
-        n_id = int(_id)
-        return self._dict.pop(n_id, None)
+        n_id = parse_callback_key(_id)
+        ret = self._remove(n_id)
+        if ret is None and self.store is not None:
+            spilled = self._take_spilled(n_id)
+            if spilled is not None:
+                ret = spilled[0]
+        self._count_lookup(ret)
+        return ret
 
     def peek_data(self, _id: Union[str, int]) -> Any:
         """
         peek the data by the key.
         """
-        n_id = int(_id)
-        return self._dict.get(n_id, None)
+        n_id = parse_callback_key(_id)
+        ret = self._dict.get(n_id, None)
+        if ret is not None:
+            self._dict.move_to_end(n_id)
+        elif self.store is not None:
+            spilled = self._take_spilled(n_id)
+            if spilled is not None:
+                ret = spilled[0]
+                self._restore(n_id, ret, spilled[1])
+        self._count_lookup(ret)
+        return ret
 
     def modify_data(self, _id: Union[str, int], data: Any) -> None:
         """
         modify the data by the key.
+        if the data has already been removed, it is stored again with the default ttl.
         """
-        n_id = int(_id)
-        if data is not None:
+        n_id = parse_callback_key(_id)
+        if data is None:
+            self._remove(n_id)
+            if self.store is not None:
+                self._take_spilled(n_id)
+                self._pending_delete.add(n_id)
+        elif n_id in self._dict:
             self._dict[n_id] = data
+            self._dict.move_to_end(n_id)
+            if self.max_bytes is not None:
+                self._bytes -= self._sizes[n_id]
+                self._sizes[n_id] = self._estimate_size(data)
+                self._bytes += self._sizes[n_id]
+                self._evict()
         else:
-            self._dict.pop(n_id, None)
+            self._store(n_id, data, None)
+
+    def index_message_keys(self, chat_id: int, msg_id: int, cb_keys: List[str]) -> None:
+        """
+        remember the keys used by the buttons of a message.
+        """
+        message = (chat_id, msg_id)
+        self.pop_message_keys(chat_id, msg_id)
+        self.message_index[message] = cb_keys
+        for k in cb_keys:
+            try:
+                n_id = parse_callback_key(k)
+            except ValueError:
+                continue
+            if n_id in self._dict and n_id not in self._key_messages:
+                self._key_messages[n_id] = message
+                self._message_refs[message] = self._message_refs.get(message, 0) + 1
+
+    def pop_message_keys(self, chat_id: int, msg_id: int) -> List[str]:
+        """
+        forget the message and return its keys. the data of the keys is not removed.
+        """
+        message = (chat_id, msg_id)
+        cb_keys = self.message_index.pop(message, [])
+        if self._message_refs.pop(message, None) is not None:
+            key_messages = self._key_messages
+            for k in cb_keys:
+                try:
+                    n_id = parse_callback_key(k)
+                except ValueError:
+                    continue
+                if key_messages.get(n_id) == message:
+                    del key_messages[n_id]
+        return cb_keys
+
+    def sweep_message_index(self) -> int:
+        """
+        drop messages without any key in memory from `message_index`. return the number of dropped messages.
+        """
+        refs = self._message_refs
+        dead = [m for m in self.message_index if m not in refs]
+        for m in dead:
+            self.pop_message_keys(*m)
+        return len(dead)
+
+    def is_stale(self, n_id: int) -> bool:
+        """
+        whether the key belongs to a run whose data is all gone.
+        """
+        return (n_id >> EPOCH_SHIFT) not in self._known_epochs
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """
+        remove all expired entries. return the number of removed entries.
+        """
+        if now is None:
+            now = time.time()
+        count = 0
+        for ttl, history in self._histories.items():
+            for old_id in history.pop_before_keys(now - ttl):
+                if self._remove(old_id, expired=True) is not None:
+                    count += 1
+                elif self._pending_spill.pop(old_id, None) is not None:
+                    count += 1
+        restored = self._restored
+        while restored and restored[0][0] < now:
+            _, old_id = heapq.heappop(restored)
+            if self._remove(old_id, expired=True) is not None:
+                count += 1
+        self.expirations += count
+        return count
+
+    async def connect_store(self) -> None:
+        """
+        connect the attached store, and learn which previous epochs still have data.
+        """
+        store = self.store
+        if store is None:
+            return
+        await store.connect()
+        old_epochs = await store.load_epochs(time.time())
+        self._known_epochs.update(old_epochs)
+        if old_epochs and max(old_epochs) >= self.epoch:
+            # restarted within a second; move to a fresh epoch if no key is out yet
+            if self.id == self.epoch << EPOCH_SHIFT:
+                self.epoch = max(old_epochs) + 1
+                self._known_epochs.add(self.epoch)
+                self.id = self.epoch << EPOCH_SHIFT
+            else:
+                _LOGGER.warning(
+                    "Callback data epoch %d collides with the stored data", self.epoch
+                )
+
+    async def fetch(self, _id: Union[str, int]) -> None:
+        """
+        load the data of the key from the store into memory, if it is there.
+        """
+        store = self.store
+        if store is None or not store.connected:
+            return
+        try:
+            n_id = parse_callback_key(_id)
+        except ValueError:
+            return
+        if (
+            n_id in self._dict
+            or n_id in self._pending_spill
+            or n_id in self._flushing
+            or self.is_stale(n_id)
+        ):
+            return
+        row = await store.take(n_id)
+        if row is None or n_id in self._dict:
+            return
+        expire_at, blob = row
+        if expire_at < time.time():
+            return
+        # strong refs of the keyboards loaded here, until the entry holds them
+        loaded: Dict[int, Any] = {}
+        try:
+            while True:
+                try:
+                    data = store.deserialize(blob, self._persistent_load)
+                    break
+                except _KeyboardNotLoaded as e:
+                    if e.persist_id in loaded:
+                        raise
+                    await self._fetch_keyboard(e.persist_id, loaded)
+        except Exception:
+            _LOGGER.error("Failed to load callback data %d", n_id, exc_info=True)
+            return
+        self._restore(n_id, data, expire_at)
+
+    async def _fetch_keyboard(self, persist_id: int, loaded: Dict[int, Any]) -> None:
+        """
+        load a keyboard from the store, after the keyboards it refers to.
+        """
+        store = cast(CallbackDataStore, self.store)
+        wanted = [persist_id]
+        while wanted:
+            row = await store.peek(wanted[-1])
+            if row is None:
+                raise KeyError(f"keyboard {wanted[-1]} is not in the store")
+            try:
+                loaded[wanted[-1]] = self._load_keyboard(wanted[-1], row[1])
+            except _KeyboardNotLoaded as e:
+                if e.persist_id in wanted or e.persist_id in loaded:
+                    raise
+                wanted.append(e.persist_id)
+            else:
+                wanted.pop()
+
+    async def flush(self) -> None:
+        """
+        write spilled entries to the store, and drop expired rows from it.
+        """
+        store = self.store
+        if store is None or not store.connected or self._flushing:
+            return
+        self._flushing, self._pending_spill = self._pending_spill, {}
+        deleted, self._pending_delete = self._pending_delete, set()
+        try:
+            await store.write(self._flushing, deleted, time.time())
+        except Exception:
+            _LOGGER.error("Failed to flush callback data", exc_info=True)
+            # keep the newer spills and the keys taken back or deleted meanwhile
+            pending_spill = self._pending_spill
+            pending_delete = self._pending_delete
+            for n_id, row in self._flushing.items():
+                if n_id not in pending_spill and n_id not in pending_delete:
+                    pending_spill[n_id] = row
+            pending_delete.update(deleted)
+        finally:
+            self._flushing = {}
+
+    async def persist(self) -> None:
+        """
+        spill every entry in memory to the store. called at shutdown.
+        """
+        if self.store is None:
+            return
+        while self._dict:
+            n_id, data = self._dict.popitem(last=False)
+            if self.max_bytes is not None:
+                self._bytes -= self._sizes.pop(n_id)
+            self._spill(n_id, data)
+        await self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        counters for sizing the store.
+        """
+        return {
+            "entries": len(self._dict),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "spills": self.spills,
+            "pending_spills": len(self._pending_spill),
+            "indexed_messages": len(self.message_index),
+            "indexed_keys": len(self._key_messages),
+        }
+
+    def __len__(self) -> int:
+        return len(self._dict)
+
+    @staticmethod
+    def _estimate_size(data: Any) -> int:
+        return sys.getsizeof(data)
+
+    def _count_lookup(self, data: Any) -> None:
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+    def _store(self, n_id: int, data: Any, ttl: Optional[float]) -> None:
+        if ttl is None:
+            ttl = self.default_ttl
+        elif ttl <= 0:
+            raise ValueError("Invalid ttl")
+        history = self._histories.get(ttl)
+        if history is None:
+            history = self._histories[ttl] = CallbackHistoryManager()
+        self._dict[n_id] = data
+        history.enqueue(n_id)
+        if self.store is not None:
+            self._deadlines[n_id] = time.time() + ttl
+        self._account_and_evict(n_id, data)
+
+    def _restore(self, n_id: int, data: Any, deadline: float) -> None:
+        self._dict[n_id] = data
+        self._deadlines[n_id] = deadline
+        heapq.heappush(self._restored, (deadline, n_id))
+        self._account_and_evict(n_id, data)
+
+    def _account_and_evict(self, n_id: int, data: Any) -> None:
+        if self.max_bytes is not None:
+            size = self._estimate_size(data)
+            self._sizes[n_id] = size
+            self._bytes += size
+        self._evict()
+
+    def _unindex(self, n_id: int, whole_message: bool) -> None:
+        message = self._key_messages.pop(n_id, None)
+        if message is None:
+            return
+        refs = self._message_refs[message] - 1
+        if whole_message or refs == 0:
+            self.pop_message_keys(*message)
+        else:
+            self._message_refs[message] = refs
+
+    def _remove(self, n_id: int, expired: bool = False) -> Any:
+        self._unindex(n_id, expired)
+        ret = self._dict.pop(n_id, None)
+        if ret is not None:
+            if self.max_bytes is not None:
+                self._bytes -= self._sizes.pop(n_id)
+            if self.store is not None:
+                self._deadlines.pop(n_id, None)
+        return ret
+
+    def _evict(self) -> None:
+        max_entries = self.max_entries
+        max_bytes = self.max_bytes
+        _dict = self._dict
+        # always keep the newest entry, even if it alone exceeds the budget
+        while len(_dict) > 1 and (
+            (max_entries is not None and len(_dict) > max_entries)
+            or (max_bytes is not None and self._bytes > max_bytes)
+        ):
+            n_id, data = _dict.popitem(last=False)
+            if max_bytes is not None:
+                self._bytes -= self._sizes.pop(n_id)
+            self.evictions += 1
+            self._unindex(n_id, True)
+            if self.store is not None:
+                self._spill(n_id, data)
+
+    def _spill(self, n_id: int, data: Any) -> None:
+        deadline = self._deadlines.pop(n_id, None)
+        if deadline is None:
+            return
+        keyboards: Dict[int, PersistKeyboards] = {}
+        try:
+            blob = CallbackDataStore.serialize(data, self._persistent_id(keyboards))
+            keyboard_rows = self._serialize_keyboards(keyboards, deadline)
+        except Exception:
+            _LOGGER.warning(
+                "Callback data %d cannot be pickled, its button stops working",
+                n_id,
+                exc_info=True,
+            )
+            return
+        self._pending_spill[n_id] = (deadline, blob)
+        self._pending_spill.update(keyboard_rows)
+        self.spills += 1
+
+    def _persistent_id(
+        self, found: Dict[int, "PersistKeyboards"]
+    ) -> Callable[[Any], Optional[int]]:
+        """
+        pickle keyboards as references to their own rows, collecting them into `found`.
+        """
+
+        def persistent_id(obj: Any) -> Optional[int]:
+            if not isinstance(obj, PersistKeyboards):
+                return None
+            if obj.persist_id is None:
+                obj.persist_id = self.id
+                self.id += 1
+                self._keyboards[obj.persist_id] = obj
+            found[obj.persist_id] = obj
+            return obj.persist_id
+
+        return persistent_id
+
+    def _serialize_keyboards(
+        self, keyboards: Dict[int, "PersistKeyboards"], deadline: float
+    ) -> Dict[int, Tuple[float, bytes]]:
+        """
+        rows of the keyboards, and of the keyboards they refer to.
+        a keyboard row lives as long as the last entry referring to it.
+        """
+        rows: Dict[int, Tuple[float, bytes]] = {}
+        todo = list(keyboards.items())
+        while todo:
+            persist_id, keyboard = todo.pop()
+            if persist_id in rows:
+                continue
+            keyboard.persist_expire_at = max(keyboard.persist_expire_at, deadline)
+            found: Dict[int, PersistKeyboards] = {}
+            rows[persist_id] = (
+                keyboard.persist_expire_at,
+                CallbackDataStore.serialize(
+                    keyboard, self._keyboard_persistent_id(keyboard, found)
+                ),
+            )
+            todo.extend(found.items())
+        return rows
+
+    def _keyboard_persistent_id(
+        self, keyboard: "PersistKeyboards", found: Dict[int, "PersistKeyboards"]
+    ) -> Callable[[Any], Optional[int]]:
+        persistent_id = self._persistent_id(found)
+        # the keyboard itself is the content of the row
+        return lambda obj: None if obj is keyboard else persistent_id(obj)
+
+    def _persistent_load(self, persist_id: int) -> "PersistKeyboards":
+        keyboard = self._keyboards.get(persist_id)
+        if keyboard is not None:
+            return keyboard
+        row = self._pending_spill.get(persist_id) or self._flushing.get(persist_id)
+        if row is None:
+            raise _KeyboardNotLoaded(persist_id)
+        return self._load_keyboard(persist_id, row[1])
+
+    def _load_keyboard(self, persist_id: int, blob: bytes) -> "PersistKeyboards":
+        keyboard = CallbackDataStore.deserialize(blob, self._persistent_load)
+        self._keyboards[persist_id] = keyboard
+        return keyboard
+
+    def _take_spilled(self, n_id: int) -> Optional[Tuple[Any, float]]:
+        """
+        take the entry back from the spill buffers. return `(data, deadline)`.
+        """
+        row = self._pending_spill.pop(n_id, None)
+        if row is None:
+            row = self._flushing.get(n_id)
+            if row is None:
+                return None
+            # it is being written right now, remove it from disk later
+            self._pending_delete.add(n_id)
+        deadline, blob = row
+        try:
+            return CallbackDataStore.deserialize(blob, self._persistent_load), deadline
+        except Exception:
+            _LOGGER.error("Failed to load callback data %d", n_id, exc_info=True)
+            return None
 
 
 class PersistKeyboards(Generic[_DataType]):
@@ -97,14 +880,19 @@ class PersistKeyboards(Generic[_DataType]):
 
     When the data is retrieved:
     * the type of data is `Tuple[_DataType, PersistKeyboards[_DataType]]`.
-    * the index can be retrieved by calling `self.idx(get_cb_data_key)`, where `get_cb_data_key = bot_module._get_cb_data_key(query)`.
+    * the index can be retrieved by calling `self.idx(get_cb_data_key)`, where `get_cb_data_key = bot_module._get_cb_data_key(query)`,
+      or `bot_module.query_at_btn_index(query)`, which reuses the key decoded for the update.
     """
 
     def __init__(self, cb_manager: CallbackDataManager) -> None:
         self.cb_data_keys: List[str] = []
         self.repr_cb: Optional[Callable[[int, str, _DataType], str]] = None
         self.cb_manager = cb_manager
-        self._idx_map: Dict[str, int] = dict()
+        self._idx_map: Dict[int, int] = dict()
+        """key: parsed callback data key"""
+        self.persist_id: Optional[int] = None
+        """key of the row of the keyboard in `CallbackDataStore`, set when first spilled"""
+        self.persist_expire_at = 0.0
 
     def get_reply_markup(
         self, pattern_key: str, button_in_row: int
@@ -118,7 +906,9 @@ class PersistKeyboards(Generic[_DataType]):
 
     def _to_buttons(self, pattern_key: str) -> List[InlineKeyboardButton]:
         return [
-            InlineKeyboardButton(self._get_text(i), callback_data=f"{pattern_key}:{k}")
+            InlineKeyboardButton(
+                self._get_text(i), callback_data=format_callback_data(pattern_key, k)
+            )
             for i, k in enumerate(self.cb_data_keys)
         ]
 
@@ -152,9 +942,9 @@ class PersistKeyboards(Generic[_DataType]):
         self.cb_data_keys = cb_data_keys
         self.repr_cb = repr_cb
         for i, k in enumerate(cb_data_keys):
-            self._idx_map[k] = i
+            self._idx_map[parse_callback_key(k)] = i
 
-    def modify_data(self, cb_data_key: str, data: _DataType) -> None:
+    def modify_data(self, cb_data_key: Union[str, int], data: _DataType) -> None:
         idx = self.idx(cb_data_key)
         self.modify_data_by_index(idx, data)
 
@@ -174,8 +964,8 @@ class PersistKeyboards(Generic[_DataType]):
         data: _DataType = self.cb_manager.peek_data(cb_data_key)[0]
         return self.repr_cb(idx, cb_data_key, data)
 
-    def idx(self, cb_data_key: str) -> int:
-        return self._idx_map[cb_data_key]
+    def idx(self, cb_data_key: Union[str, int]) -> int:
+        return self._idx_map[parse_callback_key(cb_data_key)]
 
     def store_data(self, data: _DataType) -> str:
         return self.cb_manager.set_data((data, self))
@@ -190,5 +980,255 @@ class PersistKeyboards(Generic[_DataType]):
         self._idx_map.clear()
         self.repr_cb = None
 
+    def __getstate__(self) -> Dict[str, Any]:
+        # pickled once per keyboard when spilled into `CallbackDataStore`.
+        # the manager is rebound on load, and `repr_cb` is kept only if it can be pickled
+        state = self.__dict__.copy()
+        state["cb_manager"] = None
+        if self.repr_cb is not None:
+            try:
+                pickle.dumps(self.repr_cb, protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                state["repr_cb"] = None
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        from antares_bot.bot_inst import get_bot_instance
+
+        self.__dict__.update(state)
+        self.cb_manager = get_bot_instance().callback_manager
+
     def __len__(self) -> int:
         return len(self.cb_data_keys)
+
+
+PAGED_KEYBOARD_PREV_TAG = "_page.prev"
+PAGED_KEYBOARD_NEXT_TAG = "_page.next"
+
+_PagedDataSource = Union[
+    Sequence[_DataType],
+    Callable[[int, int], Awaitable[Sequence[_DataType]]],
+    AsyncIterator[_DataType],
+]
+
+
+class PagedKeyboards(PersistKeyboards[_DataType]):
+    """
+    A `PersistKeyboards` that only stores and renders one page of a large data source.
+
+    The source is one of:
+    * a sequence, sliced for each page;
+    * an async function `fetch(offset, limit)` returning a sequence, e.g. a SQL query with
+      `LIMIT ? OFFSET ?` (see `sql_page_fetcher`);
+    * an async iterator, buffered as far as it has been paged through.
+
+    The usage is like:
+    * construct with callback data manager, source, and the pattern key of your button handler.
+    * `await load_page(0)`, then call `get_reply_markup()` to get the InlineKeyboardMarkup.
+    * cache `all_cb_data_keys()` by the sent message, so they are cleaned up with it.
+
+    Prev/next buttons are handled by the framework, which edits the markup of the message.
+    Buttons of the page work like `PersistKeyboards`, except that `repr_cb` gets the index in
+    the whole source, and `idx()` returns the index in the current page (add `offset` for the former).
+    """
+
+    def __init__(
+        self,
+        cb_manager: CallbackDataManager,
+        source: _PagedDataSource[_DataType],
+        pattern_key: str,
+        page_size: int = 10,
+        button_in_row: int = 1,
+        repr_cb: Optional[Callable[[int, str, _DataType], str]] = None,
+    ) -> None:
+        if page_size <= 0:
+            raise ValueError("Invalid page size")
+        super().__init__(cb_manager)
+        self.source = source
+        self.pattern_key = pattern_key
+        self.page_size = page_size
+        self.button_in_row = button_in_row
+        self.repr_cb = repr_cb
+        self.page = 0
+        self.has_next = False
+        self._buffer: List[_DataType] = []
+        self._exhausted = False
+        self.key = cb_manager.set_data(self)
+        """key of the keyboard itself, used by the prev/next buttons"""
+
+    @property
+    def offset(self) -> int:
+        return self.page * self.page_size
+
+    async def load_page(self, page: int) -> bool:
+        """
+        store the data of the page into callback manager, replacing the current page.
+        return `False` and keep the current page if the page is empty.
+        """
+        if page < 0:
+            return False
+        offset = page * self.page_size
+        items, has_next = await self._fetch(offset, self.page_size)
+        if not items and page > 0:
+            return False
+        for k in self.cb_data_keys:
+            self.cb_manager.pop_data(k)
+        self._idx_map.clear()
+        self.page = page
+        self.has_next = has_next
+        self.setup_use_keys([self.store_data(d) for d in items], self.repr_cb)
+        return True
+
+    def get_reply_markup(
+        self, pattern_key: Optional[str] = None, button_in_row: Optional[int] = None
+    ) -> Optional["InlineKeyboardMarkup"]:
+        """
+        get the InlineKeyboardMarkup of the loaded page, with prev/next buttons.
+        """
+        if pattern_key is None:
+            pattern_key = self.pattern_key
+        if button_in_row is None:
+            button_in_row = self.button_in_row
+        markup = super().get_reply_markup(pattern_key, button_in_row)
+        nav: List[InlineKeyboardButton] = []
+        if self.page > 0:
+            nav.append(
+                InlineKeyboardButton(
+                    "«",
+                    callback_data=format_callback_data(
+                        PAGED_KEYBOARD_PREV_TAG, self.key
+                    ),
+                )
+            )
+        if self.has_next:
+            nav.append(
+                InlineKeyboardButton(
+                    "»",
+                    callback_data=format_callback_data(
+                        PAGED_KEYBOARD_NEXT_TAG, self.key
+                    ),
+                )
+            )
+        if not nav:
+            return markup
+        rows = list(markup.inline_keyboard) if markup is not None else []
+        rows.append(nav)
+        return InlineKeyboardMarkup(rows)
+
+    def all_cb_data_keys(self) -> List[str]:
+        """
+        keys of the loaded page and of the keyboard itself.
+        """
+        return [self.key] + self.cb_data_keys
+
+    def clean(self) -> None:
+        super().clean()
+        self.cb_manager.pop_data(self.key)
+
+    def _get_text(self, idx: int) -> str:
+        if self.repr_cb is None:
+            return str(self.offset + idx)
+        cb_data_key = self.cb_data_keys[idx]
+        data: _DataType = self.cb_manager.peek_data(cb_data_key)[0]
+        return self.repr_cb(self.offset + idx, cb_data_key, data)
+
+    async def _fetch(self, offset: int, limit: int) -> Tuple[List[_DataType], bool]:
+        source = self.source
+        if isinstance(source, Sequence):
+            return list(source[offset : offset + limit]), offset + limit < len(source)
+        if callable(source):
+            items = list(await source(offset, limit + 1))
+            return items[:limit], len(items) > limit
+        buffer = self._buffer
+        while not self._exhausted and len(buffer) <= offset + limit:
+            try:
+                buffer.append(await source.__anext__())
+            except StopAsyncIteration:
+                self._exhausted = True
+        return buffer[offset : offset + limit], len(buffer) > offset + limit
+
+
+PAGED_TEXT_PREV_TAG = "_text.prev"
+PAGED_TEXT_NEXT_TAG = "_text.next"
+
+
+class PagedText:
+    """
+    A long text split into pages, of which one message shows one page at a time.
+
+    The pages are stored once in callback manager, under the key shared by the prev/next
+    buttons of the message, and expire with it. The buttons are handled by the framework,
+    which edits the message to the other page.
+    `entities` are the entities of each page, or `None` to send the pages with `parse_mode`.
+    """
+
+    def __init__(
+        self,
+        cb_manager: CallbackDataManager,
+        pages: List[str],
+        entities: Optional[List[List[MessageEntity]]] = None,
+        parse_mode: Optional[str] = None,
+    ) -> None:
+        if not pages:
+            raise ValueError("No page")
+        self.pages = pages
+        self.entities = entities
+        self.parse_mode = parse_mode
+        self.page = 0
+        self.key = cb_manager.set_data(self)
+        """key of the pages, used by the prev/next buttons"""
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    def get_reply_markup(self) -> Optional["InlineKeyboardMarkup"]:
+        """
+        prev/next buttons of the current page, or `None` if there is only one page.
+        """
+        if len(self.pages) <= 1:
+            return None
+        nav: List[InlineKeyboardButton] = []
+        if self.page > 0:
+            nav.append(
+                InlineKeyboardButton(
+                    f"« {self.page}/{len(self.pages)}",
+                    callback_data=format_callback_data(PAGED_TEXT_PREV_TAG, self.key),
+                )
+            )
+        if self.page < len(self.pages) - 1:
+            nav.append(
+                InlineKeyboardButton(
+                    f"{self.page + 2}/{len(self.pages)} »",
+                    callback_data=format_callback_data(PAGED_TEXT_NEXT_TAG, self.key),
+                )
+            )
+        return InlineKeyboardMarkup([nav])
+
+    def text_kwargs(self) -> Dict[str, Any]:
+        """
+        `text` and its `entities` or `parse_mode` of the current page, for sending or editing.
+        """
+        kwargs: Dict[str, Any] = {"text": self.pages[self.page]}
+        if self.entities is not None:
+            kwargs["entities"] = self.entities[self.page]
+        elif self.parse_mode is not None:
+            kwargs["parse_mode"] = self.parse_mode
+        return kwargs
+
+
+def sql_page_fetcher(
+    db: Database, sql: str, params: Sequence[Any] = ()
+) -> Callable[[int, int], Awaitable[List[Any]]]:
+    """
+    make a page source of `PagedKeyboards` from a select statement, which must not end with `;`.
+    rows are returned as `aiosqlite.Row`.
+    """
+
+    async def fetch(offset: int, limit: int) -> List[Any]:
+        async with db:
+            await db.cursor.execute(
+                f"{sql} LIMIT ? OFFSET ?;", (*params, limit, offset)
+            )
+            return list(await db.cursor.fetchall())
+
+    return fetch
@@ -4,12 +4,15 @@ from telegram import Update
 from telegram.constants import ChatType
 from telegram.ext import Application, CallbackContext, ExtBot
 
+from antares_bot.callback_manager import CallbackDataKey, decode_callback_data
 from antares_bot.utils import ObjectDict, get_msg_id, get_reply_to_msg_id
 
 
 if TYPE_CHECKING:
     from typing import Self
 
+    from telegram import CallbackQuery
+
 
 class ChatData:
     def __init__(self) -> None:
@@ -33,6 +36,7 @@ class RichCallbackContext(CallbackContext[ExtBot, UserData, ChatData, dict]):
         self._reply_to_message_id: Optional[int] = None
         self._update: Optional[Update] = None
         self._type = ""
+        self._callback_data_key: Optional[CallbackDataKey] = None
 
     @classmethod
     def from_update(cls, update: object, application: "Application") -> "Self":
@@ -63,6 +67,18 @@ class RichCallbackContext(CallbackContext[ExtBot, UserData, ChatData, dict]):
     def is_callback_query(self):
         return self._update.callback_query is not None
 
+    @property
+    def callback_data_key(self) -> Optional[CallbackDataKey]:
+        """
+        the decoded callback data of the callback query, decoded once per update.
+        """
+        if self._callback_data_key is None:
+            query = self.callback_query
+            if query is None or query.data is None:
+                return None
+            self._callback_data_key = decode_callback_data(query.data)
+        return self._callback_data_key
+
     def get_key(self):
         return (self.chat_id, self.user_id)
 
@@ -85,3 +101,11 @@ class RichCallbackContext(CallbackContext[ExtBot, UserData, ChatData, dict]):
     @property
     def type(self) -> str:
         return self._type
+
+    @property
+    def current_update(self) -> Optional[Update]:
+        return self._update
+
+    @property
+    def callback_query(self) -> Optional["CallbackQuery"]:
+        return self._update.callback_query if self._update is not None else None
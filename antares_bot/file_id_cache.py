@@ -0,0 +1,182 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional, Tuple, cast
+
+from antares_bot.bot_default_cfg import AntaresBotConfig
+from antares_bot.init_hooks import read_user_cfg
+from antares_bot.sqlite.creater import REAL, TEXT, DbDeclarer
+from antares_bot.sqlite.manager import Database
+
+
+DEFAULT_FILE_ID_CACHE_MAX_ENTRIES = 10000
+
+
+def file_id_cache_key(media: Any) -> Optional[str]:
+    """
+    content address of a media to upload: sha256 of the bytes, or path + mtime + size of a local file.
+    `None` for what Telegram does not need to upload again (file ids, urls, telegram objects)
+    and for streams, which can not be hashed without consuming them.
+    """
+    if isinstance(media, (bytes, bytearray, memoryview)):
+        return "sha256:" + hashlib.sha256(media).hexdigest()
+    if isinstance(media, (str, Path)):
+        try:
+            st = os.stat(media)
+        except (OSError, ValueError):
+            # file id or url
+            return None
+        if not os.path.isfile(media):
+            return None
+        return f"path:{os.path.abspath(media)}:{st.st_mtime_ns}:{st.st_size}"
+    return None
+
+
+def is_stale_file_id_error(e: Exception) -> bool:
+    msg = str(e).lower()
+    return "file identifier" in msg or "file_id" in msg or "remote file" in msg
+
+
+class FileIdCache:
+    """
+    Maps the content of uploaded photos and documents to the `file_id` Telegram returned,
+    so that the same file is sent by id instead of being uploaded again.
+    Kept in memory in LRU order and written through to SQLite.
+    """
+
+    TABLE_NAME = "file_id_cache"
+
+    def __init__(
+        self, db_path: str, max_entries: int = DEFAULT_FILE_ID_CACHE_MAX_ENTRIES
+    ) -> None:
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.db: Optional[Database] = None
+        # (key, kind) -> file_id
+        self._entries: OrderedDict[Tuple[str, str], str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def connected(self) -> bool:
+        return self.db is not None and self.db.conn is not None
+
+    async def connect(self) -> None:
+        declarer = DbDeclarer().declare(self.db_path)
+        declarer.declare_table(self.TABLE_NAME).declare_col(
+            "key", TEXT, is_primary=True
+        ).declare_col("kind", TEXT, is_primary=True).declare_col(
+            "file_id", TEXT, is_not_null=True
+        ).declare_col(
+            "last_used", REAL, is_not_null=True
+        )
+        await declarer.create_or_validate()
+        db = Database(self.db_path)
+        await db.connect()
+        self.db = db
+        async with db:
+            await db.cursor.execute(
+                f"SELECT key, kind, file_id FROM {self.TABLE_NAME} ORDER BY last_used;"
+            )
+            for row in await db.cursor.fetchall():
+                self._entries[(row[0], row[1])] = row[2]
+        await self._evict()
+
+    def get(self, key: str, kind: str) -> Optional[str]:
+        file_id = self._entries.get((key, kind))
+        if file_id is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end((key, kind))
+        return file_id
+
+    async def touch(self, key: str, kind: str) -> None:
+        """
+        save the recency of an entry, called after it was sent successfully.
+        """
+        db = cast(Database, self.db)
+        async with db:
+            await db.update_nolock(
+                self.TABLE_NAME,
+                {"last_used": time.time()},
+                where={"key": key, "kind": kind},
+            )
+
+    async def put(self, key: str, kind: str, file_id: str) -> None:
+        self._entries[(key, kind)] = file_id
+        self._entries.move_to_end((key, kind))
+        db = cast(Database, self.db)
+        async with db:
+            await db.insert_nolock(
+                self.TABLE_NAME,
+                {
+                    "key": key,
+                    "kind": kind,
+                    "file_id": file_id,
+                    "last_used": time.time(),
+                },
+            )
+        await self._evict()
+
+    async def invalidate(self, key: str, kind: str) -> None:
+        """
+        drop an entry whose `file_id` Telegram rejected.
+        """
+        self.invalidations += 1
+        self._entries.pop((key, kind), None)
+        db = cast(Database, self.db)
+        async with db:
+            await db.delete_nolock(self.TABLE_NAME, where={"key": key, "kind": kind})
+
+    async def _evict(self) -> None:
+        if len(self._entries) <= self.max_entries:
+            return
+        evicted = []
+        while len(self._entries) > self.max_entries:
+            evicted.append(self._entries.popitem(last=False)[0])
+        db = cast(Database, self.db)
+        async with db:
+            for key, kind in evicted:
+                await db.delete_nolock(
+                    self.TABLE_NAME, where={"key": key, "kind": kind}
+                )
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+_cache: Optional[FileIdCache] = None
+_cache_lock = asyncio.Lock()
+
+
+async def get_file_id_cache() -> Optional[FileIdCache]:
+    """
+    the shared cache at `DATA_DIR/file_id_cache.db`, or None if `FILE_ID_CACHE` is not enabled in `AntaresBotConfig`.
+    """
+    global _cache
+    if not read_user_cfg(AntaresBotConfig, "FILE_ID_CACHE"):
+        return None
+    if _cache is not None and _cache.connected:
+        return _cache
+    async with _cache_lock:
+        if _cache is None or not _cache.connected:
+            from antares_bot.bot_inst import get_bot_instance
+
+            cache = FileIdCache(
+                os.path.join(get_bot_instance().data_dir(), "file_id_cache.db"),
+                read_user_cfg(AntaresBotConfig, "FILE_ID_CACHE_MAX_ENTRIES")
+                or DEFAULT_FILE_ID_CACHE_MAX_ENTRIES,
+            )
+            await cache.connect()
+            _cache = cache
+    return _cache
@@ -0,0 +1,246 @@
+import asyncio
+import bisect
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar, Union
+
+from telegram.error import RetryAfter
+
+from antares_bot.bot_default_cfg import AntaresBotConfig, BasicConfig
+from antares_bot.bot_logging import get_logger
+from antares_bot.init_hooks import read_user_cfg
+
+
+_T = TypeVar("_T")
+_LOGGER = get_logger(__name__)
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# (tokens per second, burst), see https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this
+DEFAULT_FLOOD_CONTROL_LIMITS: Dict[str, Tuple[float, int]] = {
+    "global": (30.0, 30),
+    "private": (1.0, 3),
+    "group": (20 / 60, 5),
+}
+
+
+class TokenBucket(object):
+    __slots__ = ("rate", "capacity", "tokens", "stamp")
+
+    def __init__(self, rate: float, capacity: int, now: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.stamp = now
+
+    def _refill(self, now: float) -> None:
+        if now > self.stamp:
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.stamp) * self.rate
+            )
+            self.stamp = now
+
+    def delay(self, now: float) -> float:
+        """
+        seconds until a token is available.
+        """
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def hold(self, now: float, seconds: float) -> None:
+        """
+        make `delay` at least `seconds` from now.
+        """
+        self._refill(now)
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class FloodControlScheduler(object):
+    """
+    Paces outbound Bot API calls with a global token bucket and one bucket per chat,
+    so that the bot stays under Telegram's flood limits instead of hitting `RetryAfter`.
+    Callers wait in priority lanes; the master chat goes first by default.
+    """
+
+    PRUNE_THRESHOLD = 4096
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, Tuple[float, int]]] = None,
+        master_id: Optional[int] = None,
+    ) -> None:
+        self.limits = dict(DEFAULT_FLOOD_CONTROL_LIMITS)
+        if limits:
+            self.limits.update(limits)
+        self.master_id = master_id
+        self._global = TokenBucket(*self.limits["global"], time.monotonic())
+        self._chats: Dict[Union[int, str], TokenBucket] = {}
+        # sorted by (priority, seq)
+        self._waiting: List[
+            Tuple[int, int, Optional[Union[int, str]], asyncio.Future]
+        ] = []
+        self._seq = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def _chat_bucket(
+        self, chat_id: Optional[Union[int, str]], now: float
+    ) -> Optional[TokenBucket]:
+        if chat_id is None:
+            return None
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.PRUNE_THRESHOLD:
+                self._prune(now)
+            rate, capacity = self.limits[
+                "private" if isinstance(chat_id, int) and chat_id > 0 else "group"
+            ]
+            bucket = self._chats[chat_id] = TokenBucket(rate, capacity, now)
+        return bucket
+
+    def _prune(self, now: float) -> None:
+        # a full bucket is the same as a new one
+        for chat_id in [k for k, v in self._chats.items() if v.is_full(now)]:
+            del self._chats[chat_id]
+
+    def _grant(self, bucket: Optional[TokenBucket], now: float) -> None:
+        self._global.take(now)
+        if bucket is not None:
+            bucket.take(now)
+
+    async def acquire(
+        self, chat_id: Optional[Union[int, str]], priority: Optional[int] = None
+    ) -> None:
+        """
+        wait until a message to `chat_id` may be sent.
+        """
+        if priority is None:
+            priority = (
+                PRIORITY_HIGH
+                if chat_id is not None and chat_id == self.master_id
+                else PRIORITY_NORMAL
+            )
+        now = time.monotonic()
+        if not self._waiting:
+            bucket = self._chat_bucket(chat_id, now)
+            if self._global.delay(now) == 0 and (
+                bucket is None or bucket.delay(now) == 0
+            ):
+                self._grant(bucket, now)
+                return
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._seq += 1
+        bisect.insort(self._waiting, (priority, self._seq, chat_id, future))
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._run())
+        await future
+
+    def hold(self, chat_id: Optional[Union[int, str]], seconds: float) -> None:
+        """
+        called on `RetryAfter`: no message to `chat_id` is sent in the next `seconds`.
+        """
+        _LOGGER.warning("flood limit hit, holding chat %s for %ss", chat_id, seconds)
+        now = time.monotonic()
+        bucket = self._chat_bucket(chat_id, now)
+        (bucket if bucket is not None else self._global).hold(now, seconds)
+
+    def paced(
+        self,
+        func: Callable[..., Awaitable[_T]],
+        chat_id: Optional[Union[int, str]],
+        priority: Optional[int] = None,
+    ) -> Callable[..., Awaitable[_T]]:
+        """
+        wrap a Bot API method, so that every call of it waits for its turn.
+        """
+
+        async def wrapper(*args: Any, **kwargs: Any) -> _T:
+            await self.acquire(chat_id, priority)
+            try:
+                return await func(*args, **kwargs)
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                self.hold(
+                    chat_id,
+                    (
+                        retry_after
+                        if isinstance(retry_after, (int, float))
+                        else retry_after.total_seconds()
+                    ),
+                )
+                raise
+
+        wrapper.__name__ = getattr(func, "__name__", "paced")
+        return wrapper
+
+    async def _run(self) -> None:
+        assert self._wakeup is not None
+        while self._waiting:
+            now = time.monotonic()
+            wait = self._global.delay(now)
+            granted = False
+            if wait == 0:
+                wait = math.inf
+                i = 0
+                while i < len(self._waiting):
+                    future = self._waiting[i][3]
+                    if future.done():
+                        # cancelled by the caller
+                        del self._waiting[i]
+                        continue
+                    bucket = self._chat_bucket(self._waiting[i][2], now)
+                    delay = 0.0 if bucket is None else bucket.delay(now)
+                    if delay == 0:
+                        del self._waiting[i]
+                        self._grant(bucket, now)
+                        future.set_result(None)
+                        granted = True
+                        break
+                    wait = min(wait, delay)
+                    i += 1
+            if granted or not self._waiting:
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "waiting": len(self._waiting),
+            "chats": len(self._chats),
+        }
+
+
+_scheduler: Optional[FloodControlScheduler] = None
+_scheduler_checked = False
+
+
+def get_flood_control() -> Optional[FloodControlScheduler]:
+    """
+    the shared scheduler, or None if `FLOOD_CONTROL` is not enabled in `AntaresBotConfig`.
+    """
+    global _scheduler, _scheduler_checked
+    if not _scheduler_checked:
+        _scheduler_checked = True
+        if read_user_cfg(AntaresBotConfig, "FLOOD_CONTROL"):
+            _scheduler = FloodControlScheduler(
+                read_user_cfg(AntaresBotConfig, "FLOOD_CONTROL_LIMITS"),
+                read_user_cfg(BasicConfig, "MASTER_ID"),
+            )
+    return _scheduler
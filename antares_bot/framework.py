@@ -1,24 +1,45 @@
 # pylint: disable=no-member, not-callable, arguments-differ
+import asyncio
+import bisect
 import re
+import time
 from functools import wraps
 from typing import (
     TYPE_CHECKING,
     Any,
     Callable,
     Dict,
+    Iterable,
+    List,
     Optional,
     Pattern,
+    Set,
+    Tuple,
     Type,
     Union,
     overload,
 )
 
-from telegram import Update
-from telegram.ext import CallbackQueryHandler, CommandHandler, MessageHandler
+
+from telegram import MessageEntity, Update
+from telegram.ext import (
+    BaseHandler,
+    CallbackQueryHandler,
+    CommandHandler,
+    MessageHandler,
+)
 from telegram.ext import filters as filters_module
 
 from antares_bot.basic_language import BasicLanguage as L
 from antares_bot.bot_logging import get_logger
+from antares_bot.callback_manager import (
+    PAGED_KEYBOARD_NEXT_TAG,
+    PAGED_KEYBOARD_PREV_TAG,
+    PAGED_TEXT_NEXT_TAG,
+    PAGED_TEXT_PREV_TAG,
+    PagedKeyboards,
+    PagedText,
+)
 from antares_bot.context_manager import ContextHelper
 from antares_bot.error import (
     InvalidChatTypeException,
@@ -26,11 +47,11 @@ from antares_bot.error import (
     UserPermissionException,
     permission_exceptions,
 )
+from antares_bot.handler_stats import new_handler_stats
+from antares_bot.reply_coalescer import ReplyCoalescer
 
 
 if TYPE_CHECKING:
-    from telegram.ext import BaseHandler
-
     from antares_bot.context import RichCallbackContext
 
 _LOGGER = get_logger(__name__)
@@ -40,15 +61,24 @@ class CallbackBase(object):
     """
     Base class for all callback wrappers.
     subclasses need to implement `kwargs` property and `on_init`.
+    if `coalesce_replies` is True, the replies of one invocation are merged by a `ReplyCoalescer`.
+    the post executer runs even if the handler fails, with `None` as the result.
     """
 
     handler_type: Type["BaseHandler"]
 
+    callback_prefix: Optional[str] = None
+    coalesce_replies: bool = False
+
     def __init__(self, func, *args, **kwargs):
         self._instance = None
+        self._pre_executer = None
+        self._post_executer = None
         self.on_init(*args, **kwargs)
         self._register_and_wrap(func)
-        self._pre_executer = None
+        self.stats = new_handler_stats(
+            f"{getattr(func, '__module__', '?')}.{getattr(func, '__qualname__', repr(func))}"
+        )
 
     def on_init(self, *args, **kwargs):
         raise NotImplementedError
@@ -57,18 +87,28 @@ class CallbackBase(object):
         wraps(func)(self)
 
     async def __call__(self, update: Update, context: "RichCallbackContext"):
+        start = time.perf_counter()
+        try:
+            return await self._execute(update, context)
+        except Exception:
+            self.stats.errors += 1
+            raise
+        finally:
+            self.stats.record(time.perf_counter() - start)
+
+    async def _execute(self, update: Update, context: "RichCallbackContext"):
         # pre execute
         await self.pre_execute(update, context)
 
         # check blacklist
         # pass
         with ContextHelper(context):
+            result = None
             try:
-                if self._instance is not None:
-                    return await self.__wrapped__(self._instance, update, context)  # type: ignore
-                else:
-                    return await self.__wrapped__(update, context)  # type: ignore
+                result = await self._call_wrapped(update, context)
+                return result
             except permission_exceptions() as e:
+                self.stats.rejections += 1
                 try:
                     if (
                         self.handler_type == CommandHandler
@@ -88,6 +128,24 @@ class CallbackBase(object):
                     _LOGGER.error("%s.__call__", self.__class__.__name__, exc_info=True)
             except InvalidQueryException as e:
                 _LOGGER.warning("Invalid query: %s %s", update.callback_query, e)
+            finally:
+                # also after a failure, e.g. to answer the callback query
+                await self.post_execute(update, context, result)
+
+    async def _call_wrapped(self, update: Update, context: "RichCallbackContext"):
+        if self._instance is not None:
+            coro = self.__wrapped__(self._instance, update, context)  # type: ignore
+        else:
+            coro = self.__wrapped__(update, context)  # type: ignore
+        if not self.coalesce_replies:
+            return await coro
+        from antares_bot.bot_inst import get_bot_instance
+
+        with ReplyCoalescer(get_bot_instance()) as coalescer:
+            try:
+                return await coro
+            finally:
+                await coalescer.close()
 
     def __get__(self, instance, cls):
         if instance is not None:
@@ -102,6 +160,12 @@ class CallbackBase(object):
         if self._pre_executer:
             await self._pre_executer(update, context)
 
+    async def post_execute(
+        self, update: Update, context: "RichCallbackContext", result: Any
+    ):
+        if self._post_executer:
+            await self._post_executer(update, context, result)
+
     def __repr__(self) -> str:
         try:
             name = self.__name__  # type: ignore
@@ -113,9 +177,10 @@ class CallbackBase(object):
 class CommandCallback(CallbackBase):
     handler_type = CommandHandler
 
-    def on_init(self, filters, block):
+    def on_init(self, filters, block, coalesce_replies=False):
         self.filters = filters
         self.block = block
+        self.coalesce_replies = coalesce_replies
 
     @property
     def kwargs(self):
@@ -128,6 +193,9 @@ class CommandCallback(CallbackBase):
 
 class GeneralCallback(CallbackBase):
     PRE_EXUCUTER_KW = "pre_executer"
+    POST_EXUCUTER_KW = "post_executer"
+    PREFIX_KW = "callback_prefix"
+    COALESCE_KW = "coalesce_replies"
 
     def on_init(self, handler_type, kwargs: dict):
         self.handler_type = handler_type
@@ -136,6 +204,162 @@ class GeneralCallback(CallbackBase):
         pre_executer = kwargs.pop(self.PRE_EXUCUTER_KW, None)
         if pre_executer is not None:
             self._pre_executer = pre_executer
+        post_executer = kwargs.pop(self.POST_EXUCUTER_KW, None)
+        if post_executer is not None:
+            self._post_executer = post_executer
+        self.callback_prefix = kwargs.pop(self.PREFIX_KW, None)
+        self.coalesce_replies = kwargs.pop(self.COALESCE_KW, False)
+
+
+class _HandlerRouter(BaseHandler[Update, "RichCallbackContext", Any]):
+    """
+    Base of the routers that replace a linear scan over many handlers with a
+    dict lookup. The matched handler still runs its own `check_update` and
+    `handle_update`, so filters and `context` are the same as before.
+    """
+
+    __slots__ = ()
+
+    def __init__(self) -> None:
+        super().__init__(self._route, block=False)
+
+    @staticmethod
+    def _first_match(
+        update: Update, handlers: Iterable[BaseHandler]
+    ) -> Optional[Tuple[BaseHandler, Any]]:
+        for handler in handlers:
+            check_result = handler.check_update(update)
+            if check_result is not None and check_result is not False:
+                return handler, check_result
+        return None
+
+    def check_update(self, update: object) -> Optional[Tuple[BaseHandler, Any]]:
+        """
+        the matched handler and its check result, or `None`.
+        """
+        raise NotImplementedError
+
+    async def handle_update(  # type: ignore[override]
+        self,
+        update: Update,
+        application: Any,
+        check_result: Tuple[BaseHandler, Any],
+        context: "RichCallbackContext",
+    ) -> Any:
+        handler, handler_check_result = check_result
+        return await handler.handle_update(
+            update, application, handler_check_result, context
+        )
+
+    async def _route(self, update: Update, context: "RichCallbackContext") -> None:
+        # never called, `handle_update` delegates to the matched handler
+        return None
+
+
+class CallbackQueryRouter(_HandlerRouter):
+    """
+    Dispatches callback queries of all plain-prefix button handlers with a
+    single lookup of the callback data prefix, instead of trying the regex
+    of every `CallbackQueryHandler` in turn.
+    """
+
+    __slots__ = ("_prefixes", "_lengths")
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._prefixes: Dict[str, Tuple[int, CallbackQueryHandler]] = {}
+        self._lengths: List[int] = []
+
+    @staticmethod
+    def routable(func: Any, handler: BaseHandler) -> bool:
+        return (
+            isinstance(func, CallbackBase)
+            and func.callback_prefix is not None
+            and isinstance(handler, CallbackQueryHandler)
+            and not handler.block
+        )
+
+    def add(self, prefix: str, handler: CallbackQueryHandler) -> None:
+        if prefix in self._prefixes:
+            # same as the old linear scan: the first registered one wins
+            _LOGGER.warning(
+                "callback prefix %r is already routed, %s is unreachable",
+                prefix,
+                handler.callback,
+            )
+            return
+        self._prefixes[prefix] = (len(self._prefixes), handler)
+        if len(prefix) not in self._lengths:
+            bisect.insort(self._lengths, len(prefix))
+
+    def __len__(self) -> int:
+        return len(self._prefixes)
+
+    def check_update(self, update: object) -> Optional[Tuple[BaseHandler, Any]]:
+        if not isinstance(update, Update) or update.callback_query is None:
+            return None
+        data = update.callback_query.data
+        if not isinstance(data, str):
+            return None
+        # the earliest registered of the matching prefixes
+        best_order = -1
+        best: Optional[CallbackQueryHandler] = None
+        for length in self._lengths:
+            if length > len(data):
+                break
+            entry = self._prefixes.get(data[:length])
+            if entry is not None and (best is None or entry[0] < best_order):
+                best_order, best = entry
+        if best is None:
+            return None
+        return self._first_match(update, (best,))
+
+
+class CommandRouter(_HandlerRouter):
+    """
+    Dispatches all non-blocking `CommandCallback`s with a dict lookup of the
+    command name, instead of trying every `CommandHandler` in turn.
+    Enabled by `COMMAND_DISPATCH_TABLE` in `AntaresBotConfig`.
+    """
+
+    __slots__ = ("_commands", "_count")
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._commands: Dict[str, List[CommandHandler]] = {}
+        self._count = 0
+
+    @staticmethod
+    def routable(func: Any, handler: BaseHandler) -> bool:
+        return (
+            isinstance(func, CommandCallback)
+            and isinstance(handler, CommandHandler)
+            and not handler.block
+        )
+
+    def add(self, handler: CommandHandler) -> None:
+        for command in handler.commands:
+            # handlers of the same command are tried in registration order
+            self._commands.setdefault(command, []).append(handler)
+        self._count += 1
+
+    def __len__(self) -> int:
+        return self._count
+
+    def check_update(self, update: object) -> Optional[Tuple[BaseHandler, Any]]:
+        if not isinstance(update, Update):
+            return None
+        message = update.effective_message
+        if message is None or not message.text or not message.entities:
+            return None
+        entity = message.entities[0]
+        if entity.type != MessageEntity.BOT_COMMAND or entity.offset != 0:
+            return None
+        command = message.text[1 : entity.length].split("@", 1)[0].lower()
+        handlers = self._commands.get(command)
+        if handlers is None:
+            return None
+        return self._first_match(update, handlers)
 
 
 class _CommandCallbackMethodDecor(object):
@@ -144,13 +368,17 @@ class _CommandCallbackMethodDecor(object):
     """
 
     def __init__(
-        self, filters: Optional[filters_module.BaseFilter] = None, block: bool = False
+        self,
+        filters: Optional[filters_module.BaseFilter] = None,
+        block: bool = False,
+        coalesce_replies: bool = False,
     ):
         self.filters = filters
         self.block = block
+        self.coalesce_replies = coalesce_replies
 
     def __call__(self, func):
-        return CommandCallback(func, self.filters, self.block)
+        return CommandCallback(func, self.filters, self.block, self.coalesce_replies)
 
 
 class GeneralCallbackWrapper(object):
@@ -183,16 +411,18 @@ def command_callback_wrapper(func: Callable) -> CommandCallback: ...
 def command_callback_wrapper(
     block: bool = False,
     filters: Optional[filters_module.BaseFilter] = None,
+    coalesce_replies: bool = False,
 ) -> CommandCallback: ...
 
 
 def command_callback_wrapper(  # type: ignore
     block: Any = False,
     filters: Optional[filters_module.BaseFilter] = None,
+    coalesce_replies: bool = False,
 ):
     if callable(block):
         return _CommandCallbackMethodDecor()(block)
-    return _CommandCallbackMethodDecor(filters, block)
+    return _CommandCallbackMethodDecor(filters, block, coalesce_replies)
 
 
 def general_callback_wrapper(handler_type, block=False, **kwargs):
@@ -205,26 +435,139 @@ def general_callback_wrapper(handler_type, block=False, **kwargs):
     return GeneralCallbackWrapper(handler_type, **kwargs)
 
 
+_REGEX_SPECIAL_CHARS = frozenset(".^$*+?{}[]\\|()")
+
+
+_pending_answers: Set["asyncio.Task[Any]"] = set()
+
+
+def _on_answer_done(task: "asyncio.Task[Any]") -> None:
+    _pending_answers.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        _LOGGER.warning("failed to answer callback query", exc_info=task.exception())
+
+
+async def _btn_fetch_data(update: Update, context: "RichCallbackContext"):
+    # make sure data spilled to disk is back in memory before the handler peeks it
+    cb_data_key = context.callback_data_key
+    if cb_data_key is not None and cb_data_key.id is not None:
+        from antares_bot.bot_inst import get_bot_instance
+
+        await get_bot_instance().callback_manager.fetch(cb_data_key.id)
+
+
 async def _btn_pre_executer(update: Update, context: "RichCallbackContext"):
     query = update.callback_query
     assert query is not None and query.data is not None
-    await query.answer()
+    # answer concurrently, the handler does not wait for the round trip
+    task = asyncio.get_running_loop().create_task(query.answer())
+    _pending_answers.add(task)
+    task.add_done_callback(_on_answer_done)
+    await _btn_fetch_data(update, context)
+
+
+async def _btn_answer_post_executer(
+    update: Update, context: "RichCallbackContext", result: Any
+):
+    query = update.callback_query
+    assert query is not None
+    try:
+        await query.answer(result if isinstance(result, str) else None)
+    except Exception:
+        _LOGGER.warning("failed to answer callback query", exc_info=True)
 
 
 def btn_click_wrapper(
     pattern: Optional[
         Union[str, Pattern[str], type, Callable[[object], Optional[bool]]]
     ] = None,
+    answer_with_result: bool = False,
 ):
+    """
+    button click handler wrapper.
+    the query is answered concurrently with the handler. if `answer_with_result` is True,
+    it is answered after the handler instead, showing the returned `str` (if any) as a toast;
+    if the handler fails, the query is still answered, without a toast.
+    """
+    kwargs: Dict[str, Any] = {}
     if isinstance(pattern, str):
+        if not _REGEX_SPECIAL_CHARS.intersection(pattern):
+            # plain prefix, dispatched by `CallbackQueryRouter`
+            kwargs[GeneralCallback.PREFIX_KW] = pattern
         # startswith `pattern`
         pattern = re.compile(f"^{pattern}")
-    kwargs: Dict[str, Any] = {}
     kwargs["pattern"] = pattern
-    kwargs[GeneralCallback.PRE_EXUCUTER_KW] = _btn_pre_executer
+    if answer_with_result:
+        kwargs[GeneralCallback.PRE_EXUCUTER_KW] = _btn_fetch_data
+        kwargs[GeneralCallback.POST_EXUCUTER_KW] = _btn_answer_post_executer
+    else:
+        kwargs[GeneralCallback.PRE_EXUCUTER_KW] = _btn_pre_executer
     return general_callback_wrapper(CallbackQueryHandler, **kwargs)
 
 
+@btn_click_wrapper(
+    re.compile(
+        f"^({re.escape(PAGED_KEYBOARD_PREV_TAG)}|{re.escape(PAGED_KEYBOARD_NEXT_TAG)}):"
+    )
+)
+async def paged_keyboard_navigate(update: Update, context: "RichCallbackContext"):
+    """
+    shared handler of the prev/next buttons of `PagedKeyboards`.
+    """
+    from antares_bot.bot_inst import get_bot_instance
+
+    query = update.callback_query
+    cb_data_key = context.callback_data_key
+    assert query is not None and cb_data_key is not None
+    cb_manager = get_bot_instance().callback_manager
+    keyboard = None if cb_data_key.id is None else cb_manager.peek_data(cb_data_key.id)
+    if not isinstance(keyboard, PagedKeyboards):
+        # the keyboard expired
+        await query.edit_message_reply_markup(None)
+        return
+    delta = 1 if cb_data_key.tag == PAGED_KEYBOARD_NEXT_TAG else -1
+    if not await keyboard.load_page(keyboard.page + delta):
+        return
+    await query.edit_message_reply_markup(keyboard.get_reply_markup())
+    message = query.message
+    if message is not None:
+        cb_manager.index_message_keys(
+            message.chat.id, message.message_id, keyboard.all_cb_data_keys()
+        )
+
+
+@btn_click_wrapper(
+    re.compile(
+        f"^({re.escape(PAGED_TEXT_PREV_TAG)}|{re.escape(PAGED_TEXT_NEXT_TAG)}):"
+    )
+)
+async def paged_text_navigate(update: Update, context: "RichCallbackContext"):
+    """
+    shared handler of the prev/next buttons of `PagedText`.
+    """
+    from antares_bot.bot_inst import get_bot_instance
+    from antares_bot.bot_method_wrapper import TelegramBotBaseWrapper
+
+    query = update.callback_query
+    cb_data_key = context.callback_data_key
+    assert query is not None and cb_data_key is not None
+    cb_manager = get_bot_instance().callback_manager
+    paged = None if cb_data_key.id is None else cb_manager.peek_data(cb_data_key.id)
+    if not isinstance(paged, PagedText):
+        # the pages expired
+        await query.edit_message_reply_markup(None)
+        return
+    page = paged.page + (1 if cb_data_key.tag == PAGED_TEXT_NEXT_TAG else -1)
+    if not 0 <= page < len(paged):
+        return
+    paged.page = page
+    await TelegramBotBaseWrapper.call_with_fallback(
+        query.edit_message_text,
+        reply_markup=paged.get_reply_markup(),
+        **paged.text_kwargs(),
+    )
+
+
 @overload
 def msg_handle_wrapper(
     filters: Callable[["Update"], Any],
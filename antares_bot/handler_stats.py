@@ -0,0 +1,114 @@
+from array import array
+from bisect import bisect_left
+from typing import Any, Dict, List, Tuple
+
+
+# upper bounds of the latency buckets, in seconds. the last bucket is unbounded.
+BUCKET_BOUNDS: Tuple[float, ...] = (
+    0.001,
+    0.002,
+    0.005,
+    0.01,
+    0.02,
+    0.05,
+    0.1,
+    0.2,
+    0.5,
+    1.0,
+    2.0,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+class HandlerStats(object):
+    """
+    Latency histogram and counters of one handler.
+    `record` only updates preallocated counters.
+    """
+
+    __slots__ = (
+        "name",
+        "count",
+        "errors",
+        "rejections",
+        "total_time",
+        "max_time",
+        "buckets",
+    )
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.count = 0
+        self.errors = 0
+        self.rejections = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.buckets = array("Q", bytes(8 * (len(BUCKET_BOUNDS) + 1)))
+
+    def record(self, elapsed: float) -> None:
+        self.count += 1
+        self.total_time += elapsed
+        if elapsed > self.max_time:
+            self.max_time = elapsed
+        self.buckets[bisect_left(BUCKET_BOUNDS, elapsed)] += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        upper bound of the bucket holding the `q` quantile, in seconds.
+        falls back to the max time for the unbounded bucket.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                if i < len(BUCKET_BOUNDS):
+                    return min(BUCKET_BOUNDS[i], self.max_time)
+                break
+        return self.max_time
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "count": self.count,
+            "errors": self.errors,
+            "rejections": self.rejections,
+            "total_time": self.total_time,
+            "max_time": self.max_time,
+            "bucket_bounds": list(BUCKET_BOUNDS),
+            "buckets": self.buckets.tolist(),
+        }
+
+    def reset(self) -> None:
+        self.count = self.errors = self.rejections = 0
+        self.total_time = self.max_time = 0.0
+        for i in range(len(self.buckets)):
+            self.buckets[i] = 0
+
+
+_ALL_STATS: List[HandlerStats] = []
+
+
+def new_handler_stats(name: str) -> HandlerStats:
+    stats = HandlerStats(name)
+    _ALL_STATS.append(stats)
+    return stats
+
+
+def get_handler_stats() -> List[HandlerStats]:
+    """
+    stats of all handlers, in creation order.
+    """
+    return list(_ALL_STATS)
+
+
+def export_handler_stats() -> List[Dict[str, Any]]:
+    """
+    raw stats of all handlers that were called at least once, for export.
+    """
+    return [stats.to_dict() for stats in _ALL_STATS if stats.count]
@@ -53,6 +53,21 @@ class AntaresBotConfig:
     # SYSTEMD_SERVICE_NAME = "antares_bot.service"
     # IGNORE_IMPORT_MODULE_ERROR = True
     # PATCH_TRACEBACK = True
+    # COMMAND_DISPATCH_TABLE = True  # look up commands in a dict instead of trying every CommandHandler
+    # FLOOD_CONTROL = True  # pace outbound messages with token buckets instead of waiting for RetryAfter
+    # FLOOD_CONTROL_LIMITS = {"global": (30, 30), "private": (1, 3), "group": (20 / 60, 5)}  # (messages per second, burst)
+    # FILE_ID_CACHE = True  # send photos/documents uploaded before by file_id, cached in DATA_DIR/file_id_cache.db
+    # FILE_ID_CACHE_MAX_ENTRIES = 10000
+    # LONG_TEXT_AS_DOCUMENT_ABOVE = 5  # send replies that would be split into more messages as one text file
+    # LONG_TEXT_DOCUMENT_GZIP = True  # gzip that text file
+    # REPLY_COALESCE_WINDOW = 0.3  # seconds a reply of a coalesce_replies=True handler waits to be merged with the next
+    # DOWNLOAD_CONCURRENCY = 4  # parallel file downloads of get_download_service()
+    # DOWNLOAD_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # LRU-evict downloads in DATA_DIR/downloads beyond this size
+    # CALLBACK_DATA_TTL = 86400  # seconds before a button's callback data expires
+    # CALLBACK_DATA_MAX_ENTRIES = 100000  # LRU-evict callback data beyond this count
+    # CALLBACK_DATA_MAX_BYTES = 64 * 1024 * 1024  # approximate memory budget of callback data
+    # CALLBACK_DATA_EXPIRE_INTERVAL = 60  # seconds between expiry sweeps
+    # CALLBACK_DATA_PERSIST = True  # spill callback data to DATA_DIR/callback_data.db, keeping buttons alive across restarts
 """
 
 
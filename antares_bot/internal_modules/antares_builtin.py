@@ -8,6 +8,7 @@ from telegram import MessageOriginChannel, MessageOriginChat, MessageOriginUser,
 from antares_bot.basic_language import BasicLanguage as Lang
 from antares_bot.bot_logging import get_logger, get_root_logger
 from antares_bot.framework import command_callback_wrapper
+from antares_bot.handler_stats import get_handler_stats
 from antares_bot.module_base import TelegramBotModuleBase
 from antares_bot.permission_check import CheckLevel
 from antares_bot.text_process import trim_spaces_before_line
@@ -52,6 +53,7 @@ class AntaresBuiltin(TelegramBotModuleBase):
             self.exec,
             self.get_id,
             self.help,
+            self.handler_stats,
         ]
 
     @command_callback_wrapper
@@ -114,7 +116,7 @@ class AntaresBuiltin(TelegramBotModuleBase):
         except Exception:
             asyncio.get_running_loop().create_task(self.reply(Lang.t(Lang.EXEC_FAILED)))
             raise
-        await self.reply(
+        await self.reply_paged(
             Lang.t(Lang.EXEC_SUCCEEDED).format(ans), parse_mode="MarkdownV2"
         )
 
@@ -205,7 +207,7 @@ class AntaresBuiltin(TelegramBotModuleBase):
         ret = ""
         for command in self.parent.handler_docs.keys():
             ret += f"`/help {command}`\n"
-        await self.success_info(ret, parse_mode="Markdown")
+        await self.reply_paged(ret, parse_mode="Markdown")
 
     @staticmethod
     def _match_helpdoc_line0_command_list_format(
@@ -262,3 +264,29 @@ class AntaresBuiltin(TelegramBotModuleBase):
         return await self.success_info(
             f"/{markdown_escape(command)}:\n{doc}", parse_mode="Markdown"
         )
+
+    @command_callback_wrapper
+    async def handler_stats(self, update: Update, context: "RichCallbackContext"):
+        """
+        handler_stats - show handler latency stats
+        `/handler_stats [n]`: show p50/p95/p99 latency of the `n` (default 10) handlers
+        taking the most total time.
+        """
+        self.check(CheckLevel.MASTER)
+        try:
+            n = int(context.args[0]) if context.args else 10
+        except ValueError:
+            return await self.error_info("`n` should be an integer")
+        all_stats = [stats for stats in get_handler_stats() if stats.count]
+        if not all_stats:
+            return await self.reply(Lang.t(Lang.NO_HANDLER_STATS))
+        all_stats.sort(key=lambda stats: stats.total_time, reverse=True)
+        lines = ["name count err rej p50 p95 p99 (ms)"]
+        for stats in all_stats[:n]:
+            lines.append(
+                f"{stats.name} {stats.count} {stats.errors} {stats.rejections} "
+                f"{stats.quantile(0.5) * 1000:.1f} {stats.quantile(0.95) * 1000:.1f} "
+                f"{stats.quantile(0.99) * 1000:.1f}"
+            )
+        content = "\n".join(lines)
+        return await self.reply(f"```\n{content}\n```", parse_mode="Markdown")
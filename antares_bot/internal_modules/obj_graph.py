@@ -38,7 +38,7 @@ class ObjGraph(TelegramBotModuleBase):
     def mark_handlers(self) -> List[Union["CallbackBase", "BaseHandler"]]:
         return [self.memory_graph, self.backrefs, self.tracemalloc]
 
-    @command_callback_wrapper
+    @command_callback_wrapper(coalesce_replies=True)
     async def memory_graph(self, update: "Update", context: "RichCallbackContext"):
         self.check(level=CheckLevel.MASTER)
         s1 = StringIO()
@@ -105,7 +105,7 @@ class ObjGraph(TelegramBotModuleBase):
             loop.create_task(self.reply(f"There is {len(top_stats)} tracemalloc stats"))
             top_stats = top_stats[:200]
             stats_str = "\n".join(str(stat) for stat in top_stats)
-            await self.reply(stats_str)
+            await self.reply_paged(stats_str)
             return
         else:
             tracemalloc.start()
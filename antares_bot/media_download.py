@@ -0,0 +1,233 @@
+import asyncio
+import os
+import shutil
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, Optional, Sequence, Tuple, Union
+
+from antares_bot.bot_default_cfg import AntaresBotConfig
+from antares_bot.bot_logging import get_logger
+from antares_bot.init_hooks import read_user_cfg
+
+
+if TYPE_CHECKING:
+    from telegram import Bot, PhotoSize
+
+
+_LOGGER = get_logger(__name__)
+
+DEFAULT_DOWNLOAD_CONCURRENCY = 4
+DEFAULT_DOWNLOAD_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+_PART_SUFFIX = ".part"
+
+
+def pick_photo_size(
+    photos: Sequence["PhotoSize"],
+    max_side: Optional[int] = None,
+    max_file_size: Optional[int] = None,
+) -> "PhotoSize":
+    """
+    the largest photo size within `max_side` and `max_file_size`, or the smallest one if none fits.
+    """
+    if not photos:
+        raise ValueError("no photo size to pick")
+    fitting = [
+        p
+        for p in photos
+        if (max_side is None or max(p.width, p.height) <= max_side)
+        and (max_file_size is None or (p.file_size or 0) <= max_file_size)
+    ]
+    if not fitting:
+        return min(photos, key=lambda p: p.width * p.height)
+    return max(fitting, key=lambda p: (p.width * p.height, p.file_size or 0))
+
+
+class DownloadService(object):
+    """
+    Downloads Telegram files into `cache_dir`, named by `file_unique_id`.
+    Files are downloaded through the request of the bot, at most `max_concurrency` at a time.
+    A file that is being downloaded or was downloaded before is not downloaded again,
+    and the least recently used files are removed beyond `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_concurrency: int = DEFAULT_DOWNLOAD_CONCURRENCY,
+        max_bytes: int = DEFAULT_DOWNLOAD_CACHE_MAX_BYTES,
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # file_unique_id -> (path, size), in LRU order
+        self._entries: Optional[OrderedDict[str, Tuple[str, int]]] = None
+        self._total_bytes = 0
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.joins = 0
+
+    def _load(self) -> OrderedDict:
+        if self._entries is not None:
+            return self._entries
+        os.makedirs(self.cache_dir, exist_ok=True)
+        found = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if not entry.is_file():
+                    continue
+                if entry.name.endswith(_PART_SUFFIX):
+                    # left by an interrupted download
+                    os.remove(entry.path)
+                    continue
+                st = entry.stat()
+                found.append((st.st_mtime, entry.name, entry.path, st.st_size))
+        found.sort()
+        self._entries = OrderedDict()
+        for _, name, path, size in found:
+            self._entries[os.path.splitext(name)[0]] = (path, size)
+            self._total_bytes += size
+        return self._entries
+
+    def cached_path(self, file_unique_id: str) -> Optional[str]:
+        """
+        path of a downloaded file, or None. marks it as recently used.
+        """
+        entries = self._load()
+        entry = entries.get(file_unique_id)
+        if entry is None:
+            return None
+        path = entry[0]
+        if not os.path.exists(path):
+            del entries[file_unique_id]
+            self._total_bytes -= entry[1]
+            return None
+        entries.move_to_end(file_unique_id)
+        # keep the LRU order across restarts
+        os.utime(path)
+        return path
+
+    async def download(
+        self,
+        media: Union[Any, Sequence["PhotoSize"]],
+        bot: Optional["Bot"] = None,
+        max_side: Optional[int] = None,
+        max_file_size: Optional[int] = None,
+    ) -> str:
+        """
+        download a file and return its local path.
+        `media` is a `PhotoSize`, `Document`, `Video`, ... or the photo sizes of a message,
+        from which one is chosen by `pick_photo_size`.
+        """
+        if isinstance(media, (list, tuple)):
+            media = pick_photo_size(media, max_side, max_file_size)
+        file_unique_id: str = media.file_unique_id
+        path = self.cached_path(file_unique_id)
+        if path is not None:
+            self.hits += 1
+            return path
+        task = self._inflight.get(file_unique_id)
+        if task is not None:
+            self.joins += 1
+        else:
+            self.misses += 1
+            if bot is None:
+                from antares_bot.bot_inst import get_bot_instance
+
+                bot = get_bot_instance().bot
+            task = asyncio.get_running_loop().create_task(
+                self._fetch(bot, media.file_id, file_unique_id)
+            )
+            self._inflight[file_unique_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(file_unique_id, None))
+        # a cancelled caller must not cancel the download other callers wait for
+        return await asyncio.shield(task)
+
+    async def _fetch(self, bot: "Bot", file_id: str, file_unique_id: str) -> str:
+        async with self._semaphore:
+            tg_file = await bot.get_file(file_id)
+            file_path = tg_file.file_path
+            if file_path is None:
+                raise ValueError(f"file {file_unique_id} can not be downloaded")
+            entries = self._load()
+            path = os.path.join(
+                self.cache_dir, file_unique_id + os.path.splitext(file_path)[1]
+            )
+            part = path + _PART_SUFFIX
+            try:
+                if bot.local_mode and os.path.isfile(file_path):
+                    await asyncio.to_thread(shutil.copyfile, file_path, part)
+                else:
+                    await tg_file.download_to_drive(part)
+                os.replace(part, path)
+            except BaseException:
+                if os.path.exists(part):
+                    os.remove(part)
+                raise
+        size = os.path.getsize(path)
+        old = entries.pop(file_unique_id, None)
+        if old is not None:
+            self._total_bytes -= old[1]
+        entries[file_unique_id] = (path, size)
+        self._total_bytes += size
+        self._evict()
+        return path
+
+    def _evict(self) -> None:
+        entries = self._load()
+        # the most recent file is kept even if it alone is over the limit
+        while self._total_bytes > self.max_bytes and len(entries) > 1:
+            _, (path, size) = entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                _LOGGER.warning(
+                    "failed to remove cached download %s", path, exc_info=True
+                )
+
+    async def close(self) -> None:
+        for task in list(self._inflight.values()):
+            task.cancel()
+        if self._inflight:
+            await asyncio.gather(*self._inflight.values(), return_exceptions=True)
+
+    def stats(self) -> dict:
+        entries = self._load()
+        return {
+            "entries": len(entries),
+            "bytes": self._total_bytes,
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "joins": self.joins,
+        }
+
+
+_service: Optional[DownloadService] = None
+
+
+def get_download_service() -> DownloadService:
+    """
+    the shared service, caching downloads in `DATA_DIR/downloads`.
+    """
+    global _service
+    if _service is None:
+        from antares_bot.bot_inst import get_bot_instance
+
+        _service = DownloadService(
+            os.path.join(get_bot_instance().data_dir(), "downloads"),
+            read_user_cfg(AntaresBotConfig, "DOWNLOAD_CONCURRENCY")
+            or DEFAULT_DOWNLOAD_CONCURRENCY,
+            read_user_cfg(AntaresBotConfig, "DOWNLOAD_CACHE_MAX_BYTES")
+            or DEFAULT_DOWNLOAD_CACHE_MAX_BYTES,
+        )
+    return _service
+
+
+async def close_download_service() -> None:
+    global _service
+    if _service is not None:
+        await _service.close()
+        _service = None
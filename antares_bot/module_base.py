@@ -9,6 +9,11 @@ from telegram.ext import ConversationHandlerEx
 
 from antares_bot.basic_language import BasicLanguage as L
 from antares_bot.bot_base import TelegramBotBase
+from antares_bot.callback_manager import (
+    CallbackDataKey,
+    decode_callback_data,
+    format_callback_data,
+)
 from antares_bot.error import InvalidQueryException
 from antares_bot.framework import command_callback_wrapper
 from antares_bot.utils import exception_manual_handle
@@ -82,7 +87,7 @@ class TelegramBotModuleBase(TelegramBotBase):
         for dt in data:
             key_raw = self.parent.callback_manager.set_data(dt)
             raw_keys.append(key_raw)
-            keys.append(f"{key}:{key_raw}")
+            keys.append(format_callback_data(key, key_raw))
         return raw_keys, keys
 
     def _get_cb_data_key(self, query: "CallbackQuery"):
@@ -90,8 +95,20 @@ class TelegramBotModuleBase(TelegramBotBase):
         generally the data format stored in callback manager is `key:xxx`.
         get the callback data `xxx` after the colon.
         """
+        return self.get_callback_data_key(query).key
+
+    def get_callback_data_key(self, query: "CallbackQuery") -> CallbackDataKey:
+        """
+        get the decoded callback data `key:xxx` of the query.
+        the query of the current update is decoded only once.
+        """
+        context = self.peek_context()
+        if context is not None and context.callback_query is query:
+            cb_data_key = context.callback_data_key
+            assert cb_data_key is not None
+            return cb_data_key
         assert query.data is not None
-        return query.data.split(":")[1]
+        return decode_callback_data(query.data)
 
     def get_btn_callback_data(
         self, query: "CallbackQuery", pop: bool = False, check_valid=False
@@ -101,12 +118,15 @@ class TelegramBotModuleBase(TelegramBotBase):
         if `pop` is True, the data will be removed from callback manager.
         if `check_valid` is True, it will call `on_invalid_query` if the data is `None`.
         """
-        k = self._get_cb_data_key(query)
-        ret = (
-            self.parent.callback_manager.pop_data(k)
-            if pop
-            else self.parent.callback_manager.peek_data(k)
-        )
+        k = self.get_callback_data_key(query).id
+        if k is None:
+            ret = None
+        else:
+            ret = (
+                self.parent.callback_manager.pop_data(k)
+                if pop
+                else self.parent.callback_manager.peek_data(k)
+            )
         if ret is None and check_valid:
             loop = asyncio.get_running_loop()
             loop.create_task(self.on_invalid_query(query))
@@ -138,8 +158,9 @@ class TelegramBotModuleBase(TelegramBotBase):
         """
         cache the callback keys by message id.
         note the `key` here is the key of the callback manager.
+        the cache is dropped automatically once one of the keys expires.
         """
-        self.parent.callback_key_dict[(chat_id, msg_id)] = cb_keys
+        self.parent.callback_manager.index_message_keys(chat_id, msg_id, cb_keys)
 
     def cache_cb_keys_by_message(self, message: Message, cb_keys: List[str]) -> None:
         """
@@ -153,10 +174,20 @@ class TelegramBotModuleBase(TelegramBotBase):
         clean the callback keys by message id.
         note the `key` here is the key of the callback manager.
         """
-        cb_keys = self.parent.callback_key_dict.pop((chat_id, msg_id), [])
+        cb_keys = self.parent.callback_manager.pop_message_keys(chat_id, msg_id)
         for key in cb_keys:
             self.parent.callback_manager.pop_data(key)
 
+    async def delete_messages(self, chat_id: int, msg_ids: Iterable[int]) -> List[int]:
+        """
+        clean the callback keys of the messages, and delete them with `del_msgs`.
+        returns the ids that could not be deleted.
+        """
+        msg_ids = list(msg_ids)
+        for msg_id in msg_ids:
+            self.clean_cb_keys_by_id(chat_id, msg_id)
+        return await self.del_msgs(chat_id, msg_ids)
+
     def clean_cb_keys(self, context: "RichCallbackContext") -> None:
         self.clean_cb_keys_by_id(context.chat_id, context.message_id)
 
@@ -169,14 +200,23 @@ class TelegramBotModuleBase(TelegramBotBase):
         text: str = "",
         remove_message: bool = False,
         reply_markup: Optional["InlineKeyboardMarkup"] = None,
+        delete_msg_ids: Iterable[int] = (),
     ):
+        """
+        `delete_msg_ids`: other messages of the chat to delete together,
+        e.g. the previous messages of the conversation. they are deleted with `delete_messages`,
+        so failures there are not raised.
+        """
         assert query.message
         assert isinstance(query.message, Message)
-        self.clean_cb_keys_by_message(query.message)
+        message = query.message
+        self.clean_cb_keys_by_message(message)
+        delete_msg_ids = list(delete_msg_ids)
+        if delete_msg_ids:
+            await self.delete_messages(message.chat_id, delete_msg_ids)
         if remove_message:
-            return await query.message.delete()
-        #
-        return await query.message.edit_text(text, reply_markup=reply_markup)
+            return await message.delete()
+        return await message.edit_text(text, reply_markup=reply_markup)
 
     async def on_invalid_query(self, query):
         """
@@ -192,6 +232,8 @@ class TelegramBotModuleBase(TelegramBotBase):
         """
         _, keyboard = self.get_btn_callback_data(query)
         keyboard = cast("PersistKeyboards", keyboard)
-        return keyboard.idx(self._get_cb_data_key(query))
+        k = self.get_callback_data_key(query).id
+        assert k is not None
+        return keyboard.idx(k)
 
     # -----------------------helper functions end-----------------------
@@ -0,0 +1,146 @@
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+
+from antares_bot.bot_default_cfg import AntaresBotConfig
+from antares_bot.bot_logging import get_logger
+from antares_bot.init_hooks import read_user_cfg
+from antares_bot.text_process import TEXT_LENGTH_LIMIT
+
+
+if TYPE_CHECKING:
+    from contextvars import Token
+
+    from antares_bot.bot_method_wrapper import TelegramBotBaseWrapper
+
+
+_LOGGER = get_logger(__name__)
+
+# seconds a coalesced reply waits for the next one, if `REPLY_COALESCE_WINDOW` is not set
+DEFAULT_COALESCE_WINDOW = 0.3
+# replies with these arguments are sent as they are
+_UNMERGEABLE_KWARGS = frozenset(("entities", "reply_markup"))
+
+_current_coalescer: ContextVar[Optional["ReplyCoalescer"]] = ContextVar(
+    "ReplyCoalescer", default=None
+)
+
+
+def get_reply_coalescer() -> Optional["ReplyCoalescer"]:
+    """
+    the coalescer of the running handler, if it coalesces replies.
+    """
+    return _current_coalescer.get()
+
+
+@contextmanager
+def no_reply_coalescing() -> Iterator[None]:
+    """
+    send the replies in this block right away, for callers that need the sent message.
+    """
+    token = _current_coalescer.set(None)
+    try:
+        yield
+    finally:
+        _current_coalescer.reset(token)
+
+
+class ReplyCoalescer(object):
+    """
+    Buffers the replies of one handler invocation, and sends them merged into as few
+    messages as `TEXT_LENGTH_LIMIT` allows.
+    Replies are flushed `window` seconds after the first buffered one, on `flush`, before any
+    other request of the handler, or when the handler returns. Consecutive replies are merged only if they have the same arguments.
+    Used by handlers wrapped with `coalesce_replies=True`, see `CallbackBase`.
+    """
+
+    def __init__(
+        self, wrapper: "TelegramBotBaseWrapper", window: Optional[float] = None
+    ) -> None:
+        self.wrapper = wrapper
+        if window is None:
+            window = read_user_cfg(AntaresBotConfig, "REPLY_COALESCE_WINDOW")
+        self.window = DEFAULT_COALESCE_WINDOW if window is None else window
+        self._pending: List[Tuple[str, Dict[str, Any]]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._closed = False
+        self._token: Optional["Token[Optional[ReplyCoalescer]]"] = None
+
+    def add(self, text: str, kwargs: Dict[str, Any]) -> bool:
+        """
+        buffer a reply. returns False if it can not be coalesced and should be sent now.
+        `kwargs` must already hold the `chat_id` and reply target.
+        """
+        if self._closed or _UNMERGEABLE_KWARGS.intersection(kwargs):
+            return False
+        self._pending.append((text, kwargs))
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(
+                self._delayed_flush()
+            )
+        return True
+
+    async def _delayed_flush(self) -> None:
+        await asyncio.sleep(self.window)
+        self._flush_task = None
+        try:
+            # a cancelled flush task must not interrupt a request half way
+            await asyncio.shield(self.flush())
+        except Exception:
+            _LOGGER.error("coalesced reply flush failed", exc_info=True)
+
+    @staticmethod
+    def merge(
+        pending: List[Tuple[str, Dict[str, Any]]],
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        join consecutive replies with the same arguments by newlines,
+        as long as the result fits in one message.
+        """
+        merged: List[Tuple[str, Dict[str, Any]]] = []
+        for text, kwargs in pending:
+            if merged:
+                last_text, last_kwargs = merged[-1]
+                if (
+                    last_kwargs == kwargs
+                    and len(last_text) + 1 + len(text) < TEXT_LENGTH_LIMIT
+                ):
+                    merged[-1] = (f"{last_text}\n{text}", last_kwargs)
+                    continue
+            merged.append((text, kwargs))
+        return merged
+
+    async def flush(self) -> None:
+        """
+        send all buffered replies.
+        """
+        async with self._lock:
+            pending, self._pending = self._pending, []
+            with no_reply_coalescing():
+                for text, kwargs in self.merge(pending):
+                    async for _ in self.wrapper.reply_prepared(text, **kwargs):
+                        pass
+
+    async def close(self) -> None:
+        """
+        flush the buffered replies. later replies are sent without coalescing.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        task, self._flush_task = self._flush_task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self.flush()
+
+    def __enter__(self) -> "ReplyCoalescer":
+        self._token = _current_coalescer.set(self)
+        return self
+
+    def __exit__(self, *args) -> None:
+        if self._token is not None:
+            _current_coalescer.reset(self._token)
+            self._token = None
@@ -0,0 +1,167 @@
+import asyncio
+from typing import TYPE_CHECKING, Any, List, Optional, Type
+
+from telegram.error import BadRequest
+
+from antares_bot.bot_logging import get_logger
+from antares_bot.reply_coalescer import no_reply_coalescing
+from antares_bot.text_process import longtext_split
+
+
+if TYPE_CHECKING:
+    from telegram import Message
+
+    from antares_bot.bot_method_wrapper import TelegramBotBaseWrapper
+
+
+_LOGGER = get_logger(__name__)
+
+
+class ReplyStream(object):
+    """
+    Writer returned by `TelegramBotBaseWrapper.reply_stream`.
+    Text written within `interval` seconds is shown by a single edit, edits that would not
+    change the message are skipped, and the text rolls over to a new message when it
+    no longer fits in one. `close` flushes the final text.
+
+    ```
+    async with self.reply_stream() as stream:
+        for i in range(100):
+            stream.write(f"step {i} done\\n")
+            await do_step(i)
+    ```
+    """
+
+    def __init__(
+        self, wrapper: Type["TelegramBotBaseWrapper"], interval: float = 1.0, **kwargs
+    ) -> None:
+        self.wrapper = wrapper
+        self.interval = interval
+        self.kwargs = kwargs
+        self.reply_markup = kwargs.pop("reply_markup", None)
+        self.messages: List["Message"] = []
+        self._text = ""
+        # text of the messages before the last one, which are never edited again
+        self._frozen_len = 0
+        # text currently shown by the last message
+        self._shown = ""
+        self._closed = False
+        self._last_flush = 0.0
+        self._flush_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    @property
+    def message_ids(self) -> List[int]:
+        return [m.id for m in self.messages]
+
+    def write(self, text: str) -> None:
+        """
+        append `text`.
+        """
+        self.set_text(self._text + text)
+
+    def set_text(self, text: str) -> None:
+        """
+        replace the whole text. the part already rolled over to previous messages can not change.
+        """
+        if self._closed:
+            raise RuntimeError("write to a closed reply stream")
+        if not text.startswith(self._text[: self._frozen_len]):
+            raise ValueError("the text of rolled over messages can not change")
+        self._text = text
+        if self._flush_task is None:
+            loop = asyncio.get_running_loop()
+            delay = max(0.0, self._last_flush + self.interval - loop.time())
+            self._flush_task = loop.create_task(self._delayed_flush(delay))
+
+    async def _delayed_flush(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self._flush_task = None
+        try:
+            # a cancelled flush task must not interrupt a request half way
+            await asyncio.shield(self.flush())
+        except Exception:
+            _LOGGER.error("reply stream flush failed", exc_info=True)
+
+    async def flush(self, final: bool = False) -> None:
+        async with self._lock:
+            self._last_flush = asyncio.get_running_loop().time()
+            tail = self._text[self._frozen_len :]
+            if not tail.strip():
+                return
+            chunks = longtext_split(tail)
+            for i, chunk in enumerate(chunks):
+                is_last = i == len(chunks) - 1
+                reply_markup = self.reply_markup if final and is_last else None
+                if self.messages and i == 0:
+                    if chunk != self._shown or reply_markup is not None:
+                        await self._edit(chunk, reply_markup)
+                else:
+                    await self._send(chunk, reply_markup)
+                self._shown = chunk
+                if not is_last:
+                    # roll over: the current message is complete
+                    consumed = len(chunk)
+                    if tail.startswith(chunk) and tail[consumed : consumed + 1] == "\n":
+                        consumed += 1
+                    self._frozen_len += consumed
+                    tail = tail[consumed:]
+
+    async def _send(self, text: str, reply_markup: Any) -> None:
+        kwargs = dict(self.kwargs)
+        if reply_markup is not None:
+            kwargs["reply_markup"] = reply_markup
+        if not self.messages:
+            # the message is edited later, so it can not wait in a `ReplyCoalescer`
+            await self.wrapper.flush_replies()
+            with no_reply_coalescing():
+                message = await self.wrapper.reply_v3(text, **kwargs)
+        else:
+            kwargs.pop("reply_to_message_id", None)
+            message = await self.wrapper.send_to_v3(
+                self.messages[-1].chat_id, text, **kwargs
+            )
+        self.messages.append(message)
+
+    async def _edit(self, text: str, reply_markup: Any) -> None:
+        message = self.messages[-1]
+        kwargs: dict = {
+            "chat_id": message.chat_id,
+            "message_id": message.id,
+            "text": text,
+        }
+        for key in ("parse_mode", "entities", "link_preview_options"):
+            if key in self.kwargs:
+                kwargs[key] = self.kwargs[key]
+        if reply_markup is not None:
+            kwargs["reply_markup"] = reply_markup
+        try:
+            await self.wrapper.call_with_fallback(
+                message.get_bot().edit_message_text, **kwargs
+            )
+        except BadRequest as e:
+            if str(e).find("not modified") == -1:
+                raise
+
+    async def close(self) -> None:
+        """
+        flush the final text, and attach `reply_markup` to the last message.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        task, self._flush_task = self._flush_task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self.flush(final=True)
+
+    async def __aenter__(self) -> "ReplyStream":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
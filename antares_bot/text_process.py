@@ -1,5 +1,6 @@
+import re
 from dataclasses import dataclass
-from typing import Callable
+from typing import Iterable, Iterator
 
 from telegram import MessageEntity
 from telegram.constants import MessageEntityType
@@ -629,163 +630,233 @@ MARKDOWN_SUPPORTED_LANGUAGES = set(
 TEXT_LENGTH_LIMIT = 4000
 
 
+# continuous characters other than ascii letters, digits and common CJK characters
+_SPECIAL_RUN_RE = re.compile("[^A-Za-z0-9\u4e00-\u9fa5]{8,}")
+# characters which alone do not make a run special, e.g. markdown marks and punctuations
+_COMMON_SPECIAL_CHARS = "`*_~;:()[]{}<>#+-=|.!$% \n，！："
+_TRUE_SPECIAL_CHAR_RE = re.compile(f"[^{re.escape(_COMMON_SPECIAL_CHARS)}]")
+_DOUBLE_SPACE_RE = re.compile(r"\s\s")
+
+
 def find_special_sequences(text: str):
     """
     find all special sequences (continuous special characters, length >= 8)
+    a sequence must contain a character not in `_COMMON_SPECIAL_CHARS`,
+    and must not contain two continuous spaces.
     """
     results: list[tuple[int, int]] = []
-    COUNT_LIMIT = 8
-    # 定义一个函数来判断字符是否为特殊字符或空格
-
-    def is_special_char(char):
-        return not (
-            (ord("A") <= ord(char) <= ord("Z"))
-            or (ord("a") <= ord(char) <= ord("z"))
-            or (ord("0") <= ord(char) <= ord("9"))
-            or "\u4e00" <= char <= "\u9fa5"
-        )
+    for match in _SPECIAL_RUN_RE.finditer(text):
+        start, end = match.span()
+        if _TRUE_SPECIAL_CHAR_RE.search(text, start, end) is None:
+            continue
+        if _DOUBLE_SPACE_RE.search(text, start, end) is None:
+            results.append((start, end))
+    return results
 
-    def is_true_special_char(char):
-        if char in (
-            "`",
-            "*",
-            "_",
-            "~",
-            ";",
-            ":",
-            "(",
-            ")",
-            "[",
-            "]",
-            "{",
-            "}",
-            "<",
-            ">",
-            "#",
-            "+",
-            "-",
-            "=",
-            "|",
-            ".",
-            "!",
-            "$",
-            "%",
-            " ",
-            "\n",
-            "，",
-            "！",
-            "：",
-        ):
-            return False
-        return is_special_char(char)
 
-    for index, char in enumerate(text):
-        if len(results) > 0 and results[-1][0] <= index < results[-1][1]:
-            continue
-        # 判断当前字符是否为特殊符号或空格
-        if not is_true_special_char(char):
-            continue
-        last_end = results[-1][1] if len(results) > 0 else -1
-        # scan nearby special char and count them
-        start = index
-        for i in range(index - 1, last_end, -1):
-            if not is_special_char(text[i]):
-                break
-            start = i
-        end = index + 1
-        for i in range(index + 1, len(text)):
-            if not is_special_char(text[i]):
+def utf16_len(text: str) -> int:
+    """
+    length of `text` in UTF-16 code units, which is what Telegram limits and counts offsets in.
+    """
+    if text.isascii():
+        return len(text)
+    return len(text.encode("utf-16-le")) >> 1
+
+
+def _utf16_prefix_end(text: str, start: int, limit: int) -> int:
+    # end of the longest `text[start:end]` of at most `limit` UTF-16 code units
+    end = min(len(text), start + limit)
+    units = utf16_len(text[start:end])
+    while units > limit:
+        end -= 1
+        units -= 2 if ord(text[end]) > 0xFFFF else 1
+    return end
+
+
+def _utf16_pieces(text: str, limit: int) -> Iterator[str]:
+    # split a line into pieces of at most `limit` UTF-16 code units
+    start = 0
+    while True:
+        end = _utf16_prefix_end(text, start, limit)
+        if end == len(text):
+            yield text[start:]
+            return
+        yield text[start:end]
+        start = end
+
+
+_LINE_SCAN_WINDOW = 1 << 16
+
+
+def _iter_lines(txt: str) -> Iterator[str]:
+    # split a window of the text at a time, instead of copying all lines at once
+    start = 0
+    while len(txt) - start > _LINE_SCAN_WINDOW:
+        end = txt.rfind("\n", start, start + _LINE_SCAN_WINDOW)
+        if end == -1:
+            end = txt.find("\n", start + _LINE_SCAN_WINDOW)
+            if end == -1:
                 break
-            end = i + 1
-        if end - start >= COUNT_LIMIT:
-            space_test_fail = False
-            last_is_space = False
-            for i in range(start, end):
-                if last_is_space:
-                    if text[i].isspace():
-                        space_test_fail = True
-                        break
-                    else:
-                        last_is_space = False
-                else:
-                    if text[i].isspace():
-                        last_is_space = True
-            if not space_test_fail:
-                results.append((start, end))
-    return results
+        yield from txt[start:end].split("\n")
+        start = end + 1
+    yield from txt[start:].split("\n")
 
 
-def force_longtext_split(txt: list[str]) -> list[str]:
-    counting = 0
-    i = 0
-    ans: list[str] = []
-    sep_len = 0
-    while i < len(txt):
-        if counting + len(txt[i]) < TEXT_LENGTH_LIMIT - sep_len:
-            counting += len(txt[i])
-            sep_len = 1
-            i += 1
+def _iter_line_units(txt: str) -> Iterator[str | list[str]]:
+    # a unit is a single line, or all lines of a ``` block, which are kept together if possible
+    block: list[str] | None = None
+    for line in _iter_lines(txt):
+        if block is None:
+            if line.startswith("```"):
+                block = [line]
+            else:
+                yield line
         else:
-            if i == 0:
-                # too long, must split
-                super_long_line = txt[0]
-                _end = min(1000, len(super_long_line))
-                part = super_long_line[:_end]
-                txt[0] = super_long_line[_end:]
-                ans.append(part)
+            block.append(line)
+            if line.startswith("```"):
+                yield block
+                block = None
+    if block is not None:
+        # not closed, not a block
+        yield from block
+
+
+def _pack_line_units(units: Iterable[str | list[str]]) -> Iterator[str]:
+    """
+    join the lines into texts shorter than `TEXT_LENGTH_LIMIT` UTF-16 code units.
+    the newline between two texts is dropped, and a line too long is split into pieces.
+    """
+    lines: list[str] = []
+    # UTF-16 length of "\n".join(lines)
+    size = 0
+    for unit in units:
+        if isinstance(unit, str):
+            unit = [unit]
+            lengths = [utf16_len(unit[0])]
+        else:
+            lengths = [utf16_len(line) for line in unit]
+            unit_size = sum(lengths) + len(unit) - 1
+            if lines and unit_size < TEXT_LENGTH_LIMIT <= size + 1 + unit_size:
+                # start a new text, so that the block is not split
+                yield "\n".join(lines)
+                lines = []
+        for line, length in zip(unit, lengths):
+            if lines and size + 1 + length < TEXT_LENGTH_LIMIT:
+                lines.append(line)
+                size += 1 + length
                 continue
-            else:
-                ans.append("\n".join(txt[:i]))
-                txt = txt[i:]
-                i = 0
-                sep_len = 0
-                counting = 0
-    if len(txt) > 0:
-        ans.append("\n".join(txt))
-    return ans
+            if lines:
+                yield "\n".join(lines)
+            if length < TEXT_LENGTH_LIMIT:
+                lines = [line]
+                size = length
+                continue
+            # too long, must split
+            pieces = list(_utf16_pieces(line, TEXT_LENGTH_LIMIT - 1))
+            yield from pieces[:-1]
+            lines = [pieces[-1]]
+            size = utf16_len(pieces[-1])
+    if lines:
+        yield "\n".join(lines)
+
+
+def force_longtext_split(txt: list[str]) -> list[str]:
+    """
+    join the lines into texts shorter than `TEXT_LENGTH_LIMIT`, ignoring ``` blocks.
+    """
+    return list(_pack_line_units(txt))
+
+
+def iter_longtext_split(txt: str) -> Iterator[str]:
+    """
+    split `txt` into texts shorter than `TEXT_LENGTH_LIMIT` UTF-16 code units,
+    lazily in one scan of the text, so that the first text can be sent before the rest is split.
+    lines are not split unless a line alone is too long,
+    and a ``` block is not split unless the block alone is too long.
+    """
+    if len(txt) < TEXT_LENGTH_LIMIT and utf16_len(txt) < TEXT_LENGTH_LIMIT:
+        yield txt
+        return
+    yield from _pack_line_units(_iter_line_units(txt))
 
 
 def longtext_split(txt: str) -> list[str]:
-    if len(txt) < TEXT_LENGTH_LIMIT:
-        return [txt]
-    txts = txt.split("\n")
-    ans: list[str] = []
-    # search for ``` of markdown block
-    dotsss_start = -1
-    dotsss_end = -1
-    for i in range(len(txts)):
-        if txts[i].startswith("```"):
-            if dotsss_start == -1:
-                dotsss_start = i
-            else:
-                dotsss_end = i
-                break
-    if dotsss_start != -1 and dotsss_end != -1:
-        if dotsss_start == 0 and dotsss_end == len(txts) - 1:
-            # cannot keep markdown block!!!
-            return force_longtext_split(txts)
-        parts = (
-            txts[:dotsss_start],
-            txts[dotsss_start : dotsss_end + 1],
-            txts[dotsss_end + 1 :],
-        )
-        for i, part in enumerate(parts):
-            if len(part) > 0:
-                if i == 0:
-                    ans.extend(force_longtext_split(part))
-                else:
-                    this_text = "\n".join(part)
-                    ans.extend(longtext_split(this_text))
-        return ans
-    #
-    return force_longtext_split(txts)
+    return list(iter_longtext_split(txt))
+
+
+@dataclass(eq=False)
+class TextSpan:
+    """
+    an entity, which may cover several text objects. compared by identity.
+    """
+
+    entity_type: MessageEntityType
+    code_language: str | None = None
+    url: str | None = None
+    custom_emoji_id: str | None = None
 
 
 @dataclass
 class TextObject:
     text: str
-    entity_type: MessageEntityType | None
-    code_language: str | None = None
+    spans: tuple[TextSpan, ...] = ()
+    """entities covering the text, outer first"""
+
+
+_TOKEN_TEXT = 0
+_TOKEN_ESCAPE = 1
+_TOKEN_DELIMITER = 2
+_TOKEN_LINK = 3
+_TOKEN_CUSTOM_EMOJI = 4
+
+_INLINE_TOKEN_RE = re.compile(
+    r"\\([\\`*_~|\[\]()>!])"
+    r"|!\[([^\[\]\n]*)\]\(tg://emoji\?id=(\d+)\)"
+    r"|\[([^\[\]\n]*)\]\(((?:https?://|tg://|mailto:)[^()\s]+)\)"
+    r"|(\*\*|__|~~|\|\||[`*])"
+)
+# tried in order. the markup of a level is only parsed outside the entities of the levels
+# before it, and a delimiter without a pair turns off the markup of the rest of the levels.
+# `None` is the level of links and custom emojis.
+_INLINE_LEVELS: tuple[tuple[str | None, MessageEntityType | None], ...] = (
+    ("`", MessageEntityType.CODE),
+    (None, None),
+    ("**", MessageEntityType.BOLD),
+    ("__", MessageEntityType.UNDERLINE),
+    ("~~", MessageEntityType.STRIKETHROUGH),
+    ("||", MessageEntityType.SPOILER),
+    ("*", MessageEntityType.ITALIC),
+)
+# `>` starts a blockquote line, `**>` an expandable one
+_QUOTE_RE = re.compile(r"(\*\*)?> ?")
+
+# a token is (kind, source text, value, extra).
+# value is the character of an escape, the marker of a delimiter or the text of a link,
+# extra is the url of a link or the id of a custom emoji
+_Token = tuple[int, str, str, str | None]
+
+
+def _tokenize_inline(text: str) -> list[_Token]:
+    tokens: list[_Token] = []
+    pos = 0
+    for match in _INLINE_TOKEN_RE.finditer(text):
+        start = match.start()
+        if start > pos:
+            tokens.append((_TOKEN_TEXT, text[pos:start], text[pos:start], None))
+        escaped, emoji, emoji_id, link, url, delimiter = match.groups()
+        source = match.group()
+        if escaped is not None:
+            tokens.append((_TOKEN_ESCAPE, source, escaped, None))
+        elif emoji_id is not None:
+            tokens.append((_TOKEN_CUSTOM_EMOJI, source, emoji, emoji_id))
+        elif url is not None:
+            tokens.append((_TOKEN_LINK, source, link, url))
+        else:
+            tokens.append((_TOKEN_DELIMITER, source, delimiter, None))
+        pos = match.end()
+    if pos < len(text):
+        tokens.append((_TOKEN_TEXT, text[pos:], text[pos:], None))
+    return tokens
 
 
 def trim_spaces_before_line(code: str):
@@ -814,73 +885,172 @@ def trim_spaces_before_line(code: str):
 
 
 class MarkdownParser:
+    """
+    Converts markdown to texts with entities, each text shorter than `TEXT_LENGTH_LIMIT`
+    UTF-16 code units. Text objects are packed greedily into the text being built,
+    and entity offsets are counted in UTF-16 code units as they are added.
+
+    Supported markup: ``` blocks with an optional language, `code`, **bold**, __underline__,
+    ~~strikethrough~~, ||spoiler||, *italic*, [text](url), ![emoji](tg://emoji?id=...),
+    and lines starting with `>` (or `**>` for an expandable one) as blockquotes.
+    Inline markup does not nest and does not span lines. A backslash escapes a markup character.
+    """
+
     def __init__(self) -> None:
         self.texts: list[str] = []
         self.entities: list[list[MessageEntity]] = []
+        # the text being built
+        self.cur_parts: list[str] = []
+        # [span, offset, length] of the entities of the text being built
+        self.cur_entities: list[list] = []
+        self.cur_spans: dict[TextSpan, list] = {}
         self.cur_text_couting = 0
-        self.rest_text_object: list[TextObject] = []
+        """length of the text being built, in UTF-16 code units"""
+        self.quote_span: TextSpan | None = None
+        # state of `parse_stream`
+        self._in_code = False
+        self._code_parts: list[str] = []
+        self._held_lines: list[str] = []
+        self._line_pushed = False
 
     def enqueue(self, text_object: TextObject):
-        if len(text_object.text) > 0:
-            self.rest_text_object.append(text_object)
-            self.cur_text_couting += len(text_object.text)
-
-    @classmethod
-    def recursive_markdown_escape_except_block(
-        cls,
-        s: str,
-        partition_func: Callable[[str], list[TextObject]],
-        recursive_escape_func: Callable[[str], list[TextObject]],
-    ) -> list[TextObject]:
-        partitioned = partition_func(s)
-        ret = []
-        if len(partitioned) % 2 == 1:
-            for i, value in enumerate(partitioned):
-                if i % 2 == 0:
-                    ret += recursive_escape_func(value.text)
-                else:
-                    ret.append(value)
-        return ret
-
-    @classmethod
-    def split_special(cls, text: str) -> list[str]:
-        special_sequences = find_special_sequences(text)
-        ret = []
-        cur = 0
-        for start, end in special_sequences:
-            ret.append(text[cur:start])
-            ret.append(text[start:end])
-            cur = end
-        ret.append(text[cur:])
-        return ret
+        if len(text_object.text) == 0:
+            return
+        length = utf16_len(text_object.text)
+        if length >= TEXT_LENGTH_LIMIT:
+            # too long, will force split
+            for part in self.force_split_up_text_object(text_object):
+                self.enqueue(part)
+            return
+        if self.cur_text_couting + length >= TEXT_LENGTH_LIMIT:
+            self.digest()
+        for span in text_object.spans:
+            entity = self.cur_spans.get(span)
+            if entity is not None and entity[1] + entity[2] == self.cur_text_couting:
+                # continued
+                entity[2] += length
+            else:
+                entity = [span, self.cur_text_couting, length]
+                self.cur_spans[span] = entity
+                self.cur_entities.append(entity)
+        self.cur_parts.append(text_object.text)
+        self.cur_text_couting += length
 
     def feed(self, text: str, is_codeblock: bool):
         text = text.strip()
+        self.quote_span = None
         if is_codeblock:
             code, code_lang = self.get_code_lang(text)
             code = trim_spaces_before_line(code)
             self.enqueue(
                 TextObject(
                     text=code,
-                    entity_type=MessageEntityType.PRE,
-                    code_language=code_lang,
+                    spans=(TextSpan(MessageEntityType.PRE, code_language=code_lang),),
                 )
             )
         else:
             lines = text.split("\n")
             sep = ""
             for line in lines:
-                self.push_text(
-                    sep + line,
-                    [
-                        (self.split_special, None),
-                        ("`", MessageEntityType.CODE),
-                        ("**", MessageEntityType.BOLD),
-                        ("*", MessageEntityType.ITALIC),
-                    ],
-                )
+                self.push_line(sep + line)
                 sep = "\n"
-        self.digest()
+
+    def push_line(self, line: str):
+        """
+        push a line of plain text, starting with the newline if it is not the first line.
+        """
+        sep = "\n" if line.startswith("\n") else ""
+        quote = _QUOTE_RE.match(line, len(sep))
+        if quote is None:
+            self.quote_span = None
+            self.push_inline(line)
+            return
+        if self.quote_span is None:
+            self.quote_span = TextSpan(
+                MessageEntityType.EXPANDABLE_BLOCKQUOTE
+                if quote.group(1)
+                else MessageEntityType.BLOCKQUOTE
+            )
+            # the newline before a blockquote is not quoted
+            self.enqueue(TextObject(text=sep))
+            sep = ""
+        self.push_inline(sep + line[quote.end() :], (self.quote_span,))
+
+    def push_inline(self, text: str, outer: tuple[TextSpan, ...] = ()):
+        """
+        compile the inline markup of `text`. special sequences are kept as they are.
+        """
+        cur = 0
+        for start, end in find_special_sequences(text):
+            self.push_tokens(_tokenize_inline(text[cur:start]), 0, outer)
+            self.enqueue(TextObject(text=text[start:end], spans=outer))
+            cur = end
+        self.push_tokens(_tokenize_inline(text[cur:]), 0, outer)
+
+    def push_tokens(
+        self, tokens: list[_Token], level: int, outer: tuple[TextSpan, ...]
+    ):
+        # skip the levels without markup in the tokens
+        markers = {token[2] for token in tokens if token[0] == _TOKEN_DELIMITER}
+        if any(token[0] > _TOKEN_DELIMITER for token in tokens):
+            markers.add(None)
+        while level < len(_INLINE_LEVELS) and _INLINE_LEVELS[level][0] not in markers:
+            level += 1
+        if level == len(_INLINE_LEVELS):
+            self.push_plain(tokens, outer)
+            return
+        marker, entity_type = _INLINE_LEVELS[level]
+        start = 0
+        if marker is None:
+            for i, token in enumerate(tokens):
+                if token[0] == _TOKEN_LINK:
+                    span = TextSpan(MessageEntityType.TEXT_LINK, url=token[3])
+                elif token[0] == _TOKEN_CUSTOM_EMOJI:
+                    span = TextSpan(
+                        MessageEntityType.CUSTOM_EMOJI, custom_emoji_id=token[3]
+                    )
+                else:
+                    continue
+                self.push_tokens(tokens[start:i], level + 1, outer)
+                self.enqueue(TextObject(text=token[2], spans=outer + (span,)))
+                start = i + 1
+            self.push_tokens(tokens[start:], level + 1, outer)
+            return
+        assert entity_type is not None
+        delimiters = [
+            i
+            for i, token in enumerate(tokens)
+            if token[0] == _TOKEN_DELIMITER and token[2] == marker
+        ]
+        if len(delimiters) % 2 == 1:
+            # not paired, no markup
+            self.push_plain(tokens, outer)
+            return
+        for left, right in zip(delimiters[::2], delimiters[1::2]):
+            self.push_tokens(tokens[start:left], level + 1, outer)
+            self.push_plain(
+                tokens[left + 1 : right],
+                outer + (TextSpan(entity_type),),
+                as_source=entity_type == MessageEntityType.CODE,
+            )
+            start = right + 1
+        self.push_tokens(tokens[start:], level + 1, outer)
+
+    def push_plain(
+        self,
+        tokens: list[_Token],
+        spans: tuple[TextSpan, ...],
+        as_source: bool = False,
+    ):
+        """
+        push the tokens as text without markup. escapes are resolved unless `as_source`.
+        """
+        resolve_escape = not as_source
+        text = "".join(
+            token[2] if resolve_escape and token[0] == _TOKEN_ESCAPE else token[1]
+            for token in tokens
+        )
+        self.enqueue(TextObject(text=text, spans=spans))
 
     @classmethod
     def get_code_lang(cls, text: str):
@@ -893,148 +1063,66 @@ class MarkdownParser:
             code = text
         return code, code_lang
 
-    @classmethod
-    def join_escaped(cls, splitted: list[str]) -> list[str]:
-        ret = []
-        left_over = ""
-        for split_text in splitted:
-            if split_text.endswith("\\"):
-                # count last continuous backslash
-                count = 0
-                for i in range(len(split_text) - 1, -1, -1):
-                    if split_text[i] == "\\":
-                        count += 1
-                    else:
-                        break
-                if count % 2 == 1:
-                    left_over += split_text
-                    continue
-            ret.append(left_over + split_text)
-            left_over = ""
-        if left_over:
-            ret.append(left_over)
-        return ret
-
-    def push_text(
-        self,
-        text: str,
-        split_config: list[
-            tuple[str | Callable[[str], list[str]], MessageEntityType | None]
-        ],
-    ):
-        splitter = split_config[0][0]
-        if isinstance(splitter, str):
-            splitted = text.split(splitter)
-            if len(splitter) == 1:
-                splitted = self.join_escaped(splitted)
-        else:
-            splitted = splitter(text)
-        if len(splitted) % 2 == 1:
-            for i, sub_text in enumerate(splitted):
-                if i % 2 == 0:
-                    if len(split_config) == 1:
-                        self.enqueue(TextObject(text=sub_text, entity_type=None))
-                    else:
-                        self.push_text(sub_text, split_config[1:])
-                else:
-                    self.enqueue(
-                        TextObject(text=sub_text, entity_type=split_config[0][1])
-                    )
-            return
-        self.enqueue(TextObject(text=text, entity_type=None))
-
-    @classmethod
-    def _digest(
-        cls, rest_text_object: list[TextObject]
-    ) -> tuple[str, list[MessageEntity], list[TextObject]]:
-        text = ""
-        entities = []
-        end_at = len(rest_text_object)
-        for i, text_object in enumerate(rest_text_object):
-            if len(text + text_object.text) >= TEXT_LENGTH_LIMIT:
-                end_at = i
-                break
-            if text_object.entity_type is not None:
-                new_entity = MessageEntity(
-                    text_object.entity_type,
-                    offset=len(text),
-                    length=len(text_object.text),
-                    language=text_object.code_language,
-                )
-                entities.append(new_entity)
-            text += text_object.text
-        return text, entities, rest_text_object[end_at:]
-
     def digest(self):
-        if self.cur_text_couting < TEXT_LENGTH_LIMIT:
-            return
-        assert len(self.rest_text_object) > 0
-        for text_object in self.rest_text_object:
-            if len(text_object.text) >= TEXT_LENGTH_LIMIT:
-                # too long, will force split
-                self.force_split_up()
-                break
-        while self.cur_text_couting >= TEXT_LENGTH_LIMIT:
-            text, entities, self.rest_text_object = self._digest(self.rest_text_object)
-            self._update_text_counting()
-            if text:
-                self.texts.append(text)
-                self.entities.append(entities)
-
-    def force_split_up(self):
-        text_objects = self.rest_text_object
-        self.rest_text_object = sum(
-            (self.force_split_up_text_object(x) for x in text_objects), []
-        )
-        self.rest_text_object = list(
-            filter(lambda x: len(x.text) > 0, self.rest_text_object)
-        )
-        self._update_text_counting()
-
-    def _update_text_counting(self):
-        self.cur_text_couting = sum(len(x.text) for x in self.rest_text_object)
+        """
+        finish the text being built.
+        """
+        if self.cur_parts:
+            self.texts.append("".join(self.cur_parts))
+            self.entities.append(
+                [
+                    MessageEntity(
+                        span.entity_type,
+                        offset=offset,
+                        length=length,
+                        url=span.url,
+                        language=span.code_language,
+                        custom_emoji_id=span.custom_emoji_id,
+                    )
+                    for span, offset, length in self.cur_entities
+                ]
+            )
+        self.cur_parts = []
+        self.cur_entities = []
+        self.cur_spans = {}
+        self.cur_text_couting = 0
 
     def digest_final(self):
-        text, entities, self.rest_text_object = self._digest(self.rest_text_object)
-        assert 0 == len(self.rest_text_object)
-        if text:
-            self.texts.append(text)
-            self.entities.append(entities)
-        self.fix_entities_offset()
+        self.digest()
         return self.texts, self.entities
 
-    def fix_entities_offset(self):
-        for i, (text, entities) in enumerate(zip(self.texts, self.entities)):
-            new_entities = MessageEntity.adjust_message_entities_to_utf_16(
-                text, entities
-            )
-            self.entities[i] = new_entities
-
     @classmethod
     def force_split_up_text_object(cls, text_object: TextObject) -> list[TextObject]:
-        if len(text_object.text) < TEXT_LENGTH_LIMIT:
+        """
+        split a text object of at least `TEXT_LENGTH_LIMIT` UTF-16 code units,
+        at the last newline that fits in a text if there is one.
+        """
+        text = text_object.text
+        limit = TEXT_LENGTH_LIMIT - 1
+        if _utf16_prefix_end(text, 0, limit) == len(text):
             return [text_object]
-        parted_1, parted_2 = cls.split_2_parts(text_object.text)
-        kwargs: dict = {"entity_type": text_object.entity_type}
-        if text_object.entity_type == MessageEntityType.PRE:
-            kwargs["code_language"] = text_object.code_language
-        return [TextObject(text=parted_1, **kwargs)] + cls.force_split_up_text_object(
-            TextObject(text=parted_2, **kwargs)
-        )
-
-    @classmethod
-    def split_2_parts(self, long_text: str) -> tuple[str, str]:
-        long_text = long_text.strip()
-        first_part = long_text[:TEXT_LENGTH_LIMIT]
-        last_part = long_text[TEXT_LENGTH_LIMIT:]
-        split_first_part = first_part.rpartition("\n")
-        if split_first_part[1] == "\n" and split_first_part[0]:
-            parted_1 = split_first_part[0]
-            parted_2 = split_first_part[2] + last_part
-        else:
-            parted_1 = first_part
-            parted_2 = last_part
-        return parted_1, parted_2
+        kwargs: dict = {"spans": text_object.spans}
+        text = text.strip()
+        parts: list[TextObject] = []
+        pos = 0
+        while True:
+            end = _utf16_prefix_end(text, pos, limit)
+            if end == len(text):
+                break
+            # the newline itself is dropped, so it may be the `TEXT_LENGTH_LIMIT`th unit
+            newline = text.rfind("\n", pos, _utf16_prefix_end(text, pos, limit + 1))
+            if newline > pos:
+                parts.append(TextObject(text=text[pos:newline], **kwargs))
+                pos = newline + 1
+            else:
+                parts.append(TextObject(text=text[pos:end], **kwargs))
+                pos = end
+            if _utf16_prefix_end(text, pos, limit) == len(text):
+                break
+            while text[pos].isspace():
+                pos += 1
+        parts.append(TextObject(text=text[pos:], **kwargs))
+        return parts
 
     def parse(self, txt: str) -> tuple[list[str], list[list[MessageEntity]]]:
         first_level_split = txt.split("```")
@@ -1046,7 +1134,317 @@ class MarkdownParser:
             self.feed(txt_part, is_codeblock=i % 2 == 1)
         return self.digest_final()
 
+    def parse_stream(
+        self, fragments: Iterable[str]
+    ) -> Iterator[tuple[str, list[MessageEntity]]]:
+        """
+        like `parse`, but takes the markdown as fragments, e.g. the lines of a file,
+        and yields each text with its entities as soon as it is complete.
+        only the current line and the current ``` block are kept in memory.
+        different from `parse`, only an unclosed ``` block at the end is taken as plain text.
+        """
+        buf = ""
+        for fragment in fragments:
+            buf = self._consume(buf + fragment)
+            yield from self._pop_digested()
+        if self._in_code:
+            # broken code block
+            self._in_code = False
+            buf = "```" + "".join(self._code_parts) + buf
+            self._code_parts = []
+        self._feed_plain(buf, final=True)
+        self.digest()
+        yield from self._pop_digested()
+
+    def _consume(self, buf: str) -> str:
+        # feed what is complete in `buf`, return the rest
+        while True:
+            fence = buf.find("```")
+            if self._in_code:
+                if fence == -1:
+                    # the last 2 characters may be the start of a fence
+                    keep = max(0, len(buf) - 2)
+                    self._code_parts.append(buf[:keep])
+                    return buf[keep:]
+                self._code_parts.append(buf[:fence])
+                self.feed("".join(self._code_parts), is_codeblock=True)
+                self._in_code = False
+            else:
+                if fence == -1:
+                    return self._feed_plain(buf, final=False)
+                self._feed_plain(buf[:fence], final=True)
+                self._in_code = True
+                self._code_parts = []
+            buf = buf[fence + 3 :]
+
+    def _feed_plain(self, text: str, final: bool) -> str:
+        # feed the complete lines of plain text, as `feed` does for a whole part.
+        # a line is held back until a later line has non-space text,
+        # so that the trailing spaces of the part can still be stripped.
+        # return the incomplete last line, or feed it too if the part ends here.
+        lines = text.split("\n")
+        rest = lines.pop()
+        for line in lines:
+            if not line.strip():
+                if self._held_lines:
+                    self._held_lines.append(line)
+                continue
+            for held in self._held_lines:
+                self._push_plain_line(held)
+            self._held_lines = [line if self._held_lines else line.lstrip()]
+        if not final:
+            return rest
+        if self._held_lines or rest.strip():
+            tail = "\n".join(self._held_lines + [rest]).rstrip()
+            if not self._held_lines:
+                tail = tail.lstrip()
+            for line in tail.split("\n"):
+                self._push_plain_line(line)
+        self._held_lines = []
+        self._line_pushed = False
+        self.quote_span = None
+        return ""
+
+    def _push_plain_line(self, line: str):
+        self.push_line("\n" + line if self._line_pushed else line)
+        self._line_pushed = True
+
+    def _pop_digested(self) -> Iterator[tuple[str, list[MessageEntity]]]:
+        texts, entities = self.texts, self.entities
+        self.texts = []
+        self.entities = []
+        return zip(texts, entities)
+
 
 def longtext_markdown_split(txt: str) -> tuple[list[str], list[list[MessageEntity]]]:
     splitter = MarkdownParser()
     return splitter.parse(txt)
+
+
+def iter_longtext_markdown_split(
+    fragments: Iterable[str],
+) -> Iterator[tuple[str, list[MessageEntity]]]:
+    """
+    streaming `longtext_markdown_split`: convert markdown read in fragments, e.g. from a file
+    or a pipe, and yield each `(text, entities)` as soon as it is complete.
+    """
+    return MarkdownParser().parse_stream(fragments)
+
+
+_MARKDOWN_V2_RESERVED = frozenset("_*[]()~`>#+-=|{}.!")
+
+_HTML_ALLOWED_TAGS = frozenset(
+    (
+        "a",
+        "b",
+        "strong",
+        "i",
+        "em",
+        "u",
+        "ins",
+        "s",
+        "strike",
+        "del",
+        "span",
+        "tg-spoiler",
+        "tg-emoji",
+        "code",
+        "pre",
+        "blockquote",
+    )
+)
+
+
+def _find_markdown_v2_end(text: str, start: int, end_mark: str, n: int) -> int:
+    """
+    index of the first unescaped `end_mark` from `start`, or -1.
+    """
+    i = start
+    while i < n:
+        if text[i] == "\\":
+            i += 2
+            continue
+        if text.startswith(end_mark, i):
+            return i
+        i += 1
+    return -1
+
+
+def _toggle_markdown_v2_mark(stack: list[str], mark: str) -> None:
+    """
+    close the innermost open entity of `mark`, or open one.
+    """
+    for k in range(len(stack) - 1, -1, -1):
+        if stack[k] == mark:
+            del stack[k]
+            return
+    stack.append(mark)
+
+
+def is_valid_markdown_v2(text: str) -> bool:
+    """
+    check `text` against the MarkdownV2 rules of the Bot API, without sending it.
+    only reports errors that Telegram is sure to reject, like unescaped reserved
+    characters and unclosed entities.
+    """
+    n = len(text)
+    stack: list[str] = []
+    i = 0
+    line_start = True
+    in_quote = False
+    while i < n:
+        c = text[i]
+        if c == "\n":
+            line_start = True
+            in_quote = False
+            i += 1
+            continue
+        at_line_start = line_start
+        line_start = False
+        if c == "\\":
+            i += 2
+            continue
+        if c not in _MARKDOWN_V2_RESERVED:
+            i += 1
+            continue
+        if c == "`":
+            if text.startswith("```", i):
+                j = _find_markdown_v2_end(text, i + 3, "```", n)
+                if j == -1:
+                    return False
+                i = j + 3
+            else:
+                j = _find_markdown_v2_end(text, i + 1, "`", n)
+                if j == -1:
+                    return False
+                i = j + 1
+            continue
+        if at_line_start and (c == ">" or text.startswith("**>", i)):
+            in_quote = True
+            i += 1 if c == ">" else 3
+            continue
+        if c == "|":
+            if not text.startswith("||", i):
+                return False
+            if "||" in stack:
+                _toggle_markdown_v2_mark(stack, "||")
+            elif in_quote and text[i + 2 : i + 3] in ("", "\n"):
+                # end of an expandable block quotation
+                pass
+            else:
+                stack.append("||")
+            i += 2
+            continue
+        if c in "*_~":
+            # `__` is always read greedily as underline
+            mark = "__" if text.startswith("__", i) else c
+            _toggle_markdown_v2_mark(stack, mark)
+            i += len(mark)
+            if mark == "__" and text.startswith("_", i) and not text.startswith("__", i):
+                # the `_` left of `___` closes an italic entity if one is open;
+                # otherwise Telegram decides, so it is not reported
+                if "_" in stack:
+                    _toggle_markdown_v2_mark(stack, "_")
+                i += 1
+            continue
+        if c == "!" and text.startswith("![", i):
+            stack.append("[")
+            i += 2
+            continue
+        if c == "[":
+            stack.append("[")
+            i += 1
+            continue
+        if c == "]":
+            if not stack or stack[-1] != "[":
+                return False
+            stack.pop()
+            if text.startswith("(", i + 1):
+                j = _find_markdown_v2_end(text, i + 2, ")", n)
+                if j == -1:
+                    return False
+                i = j + 1
+            else:
+                i += 1
+            continue
+        # other reserved characters must be escaped
+        return False
+    return not stack
+
+
+def is_valid_markdown(text: str) -> bool:
+    """
+    check `text` against the legacy Markdown rules of the Bot API, without sending it.
+    """
+    n = len(text)
+    i = 0
+    while i < n:
+        c = text[i]
+        if c == "\\" and text[i + 1 : i + 2] in ("_", "*", "`", "["):
+            i += 2
+        elif c in "_*":
+            j = text.find(c, i + 1)
+            if j == -1:
+                return False
+            i = j + 1
+        elif c == "`":
+            mark = "```" if text.startswith("```", i) else "`"
+            j = text.find(mark, i + len(mark))
+            if j == -1:
+                return False
+            i = j + len(mark)
+        elif c == "[":
+            j = text.find("]", i + 1)
+            if j == -1:
+                return False
+            if text.startswith("(", j + 1):
+                k = text.find(")", j + 2)
+                if k == -1:
+                    return False
+                j = k
+            i = j + 1
+        else:
+            i += 1
+    return True
+
+
+def is_valid_html(text: str) -> bool:
+    """
+    check that every `<` of `text` starts a supported tag and that tags are balanced,
+    as the HTML parse mode of the Bot API requires, without sending it.
+    """
+    stack: list[str] = []
+    i = text.find("<")
+    while i != -1:
+        j = text.find(">", i + 1)
+        if j == -1:
+            return False
+        tag = text[i + 1 : j]
+        closing = tag.startswith("/")
+        name = (tag[1:] if closing else tag).split(None, 1)
+        if not name:
+            return False
+        tag_name = name[0].lower()
+        if tag_name not in _HTML_ALLOWED_TAGS:
+            return False
+        if closing:
+            if not stack or stack[-1] != tag_name:
+                return False
+            stack.pop()
+        else:
+            stack.append(tag_name)
+        i = text.find("<", j + 1)
+    return not stack
+
+
+def is_valid_parse_mode_text(text: str, parse_mode: str | None) -> bool:
+    """
+    local check of `text` for `parse_mode`. unknown parse modes are assumed valid.
+    """
+    if parse_mode == "MarkdownV2":
+        return is_valid_markdown_v2(text)
+    if parse_mode == "Markdown":
+        return is_valid_markdown(text)
+    if parse_mode == "HTML":
+        return is_valid_html(text)
+    return True
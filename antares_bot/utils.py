@@ -128,12 +128,10 @@ def is_channel(update: Update) -> bool:
 def flatten_button(
     buttons: List[InlineKeyboardButton], numberInOneLine: int
 ) -> InlineKeyboardMarkup:
-    btl: List[List[InlineKeyboardButton]] = []
-    while len(buttons) > numberInOneLine:
-        btl.append(buttons[:numberInOneLine])
-        buttons = buttons[numberInOneLine:]
-    if len(buttons) > 0:
-        btl.append(buttons)
+    btl: List[List[InlineKeyboardButton]] = [
+        buttons[i : i + numberInOneLine]
+        for i in range(0, len(buttons), numberInOneLine)
+    ]
     return InlineKeyboardMarkup(btl)
 
 
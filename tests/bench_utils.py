@@ -0,0 +1,30 @@
+import os
+import time
+
+import pytest
+
+
+benchmark = pytest.mark.skipif(
+    not os.environ.get("ANTARES_BENCHMARK"),
+    reason="set ANTARES_BENCHMARK=1 to run the benchmarks, with `pytest -s` to see them",
+)
+"""
+mark of the benchmarks. they also check the results, but on inputs too large for
+every run of the tests.
+"""
+
+
+def best_time(func, *args, repeat: int = 3) -> float:
+    """
+    the best time of `repeat` calls, in milliseconds.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def report(name: str, **timings: float) -> None:
+    print(f"\n{name}: " + ", ".join(f"{k} {v:.1f} ms" for k, v in timings.items()))
@@ -0,0 +1,12 @@
+"""
+config for the tests, importable as `bot_cfg` since pytest puts this directory on `sys.path`.
+"""
+
+
+class BasicConfig:
+    TOKEN = "abcdef:123456"
+    MASTER_ID = 123456789
+
+
+class AntaresBotConfig:
+    PIKA_LOGGER_ENABLED = False
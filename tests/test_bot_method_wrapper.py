@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+
+pytest.importorskip("telegram")
+pytest.importorskip("aiosqlite")
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup  # noqa: E402
+
+from antares_bot.bot_method_wrapper import TelegramBotBaseWrapper  # noqa: E402
+from antares_bot.text_process import TEXT_LENGTH_LIMIT, utf16_len  # noqa: E402
+
+
+class _FakeSend:
+    """
+    records the kwargs of every call, and returns them as the sent message.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, **kwargs):
+        self.calls.append(kwargs)
+        return kwargs
+
+
+def test_send_paged_long_text_with_reply_markup():
+    send = _FakeSend()
+    markup = InlineKeyboardMarkup([[InlineKeyboardButton("ok", callback_data="ok")]])
+    text = "\n".join(f"line {i}" for i in range(2000))
+    last = asyncio.run(
+        TelegramBotBaseWrapper._send_paged(send, text, chat_id=1, reply_markup=markup)
+    )
+    assert len(send.calls) > 1
+    assert all(utf16_len(call["text"]) < TEXT_LENGTH_LIMIT for call in send.calls)
+    assert "\n".join(call["text"] for call in send.calls) == text
+    assert all("reply_markup" not in call for call in send.calls[:-1])
+    assert last is send.calls[-1]
+    assert last["reply_markup"] is markup
+
+
+def test_send_paged_long_text_with_entities():
+    send = _FakeSend()
+    with pytest.raises(ValueError):
+        asyncio.run(
+            TelegramBotBaseWrapper._send_paged(
+                send, "a" * TEXT_LENGTH_LIMIT, chat_id=1, entities=[]
+            )
+        )
+    assert not send.calls
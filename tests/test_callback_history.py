@@ -0,0 +1,116 @@
+import bisect
+import random
+import time
+import tracemalloc
+
+import pytest
+
+
+pytest.importorskip("telegram")
+
+from bench_utils import benchmark, best_time, report  # noqa: E402
+
+from antares_bot.callback_manager import CallbackHistoryManager  # noqa: E402
+
+
+class _ListHistory:
+    """
+    the list of `(time, key)` tuples `CallbackHistoryManager` used to be.
+    """
+
+    def __init__(self) -> None:
+        self.history_queue = []
+
+    def enqueue(self, key: int) -> None:
+        self.history_queue.append((time.time(), key))
+
+    def pop_before_keys(self, before: float):
+        history_queue = self.history_queue
+        idx = bisect.bisect_left(history_queue, (before, 0))
+        if idx > 0:
+            self.history_queue = history_queue[idx:]
+        yield from (k for _, k in history_queue[:idx])
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_history_same_as_list(monkeypatch, seed):
+    clock = _Clock()
+    monkeypatch.setattr(time, "time", clock)
+    rng = random.Random(seed)
+    history = CallbackHistoryManager()
+    expected = _ListHistory()
+    key = 0
+    for _ in range(3000):
+        if rng.random() < 0.7:
+            # several entries often share one timestamp
+            clock.now += rng.choice([0, 0, 0.5, 1, 10])
+            history.enqueue(key)
+            expected.enqueue(key)
+            key += 1
+        else:
+            before = clock.now - rng.choice([0, 1, 5, 50, 500])
+            assert list(history.pop_before_keys(before)) == list(
+                expected.pop_before_keys(before)
+            )
+            assert len(history) == len(expected.history_queue)
+    assert list(history.pop_before_keys(clock.now + 1)) == list(range(key))[
+        -len(expected.history_queue) :
+    ]
+    assert len(history) == 0
+
+
+@benchmark
+def test_history_benchmark(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(time, "time", clock)
+    n = 2_000_000
+    batch = 1000
+
+    def run(history):
+        # keys arrive 1000 per second, and those older than 60 s are purged once a second
+        for i in range(n):
+            if i % batch == 0:
+                clock.now += 1
+                for _ in history.pop_before_keys(clock.now - 60):
+                    pass
+            history.enqueue(i)
+
+    report(
+        f"{n} keys, purged every {batch}",
+        list=best_time(lambda: run(_ListHistory()), repeat=1),
+        array=best_time(lambda: run(CallbackHistoryManager()), repeat=1),
+    )
+    history = CallbackHistoryManager()
+    run(history)
+    # keys of the last 60 s, and of the current second
+    assert len(history) == 61 * batch
+
+
+@benchmark
+def test_history_memory_benchmark(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(time, "time", clock)
+    n = 1_000_000
+
+    def bytes_per_key(history) -> float:
+        tracemalloc.start()
+        try:
+            for i in range(n):
+                clock.now += 0.001
+                history.enqueue(i)
+            return tracemalloc.get_traced_memory()[0] / n
+        finally:
+            tracemalloc.stop()
+
+    print(
+        f"\n{n} keys: list {bytes_per_key(_ListHistory()):.1f} B/key,"
+        f" array {bytes_per_key(CallbackHistoryManager()):.1f} B/key"
+    )
@@ -0,0 +1,77 @@
+import pytest
+
+
+pytest.importorskip("telegram")
+pytest.importorskip("aiosqlite")
+
+from antares_bot.callback_manager import (  # noqa: E402
+    EPOCH_BASE,
+    EPOCH_SHIFT,
+    decode_callback_data,
+    encode_callback_key,
+    parse_callback_key,
+)
+
+
+@pytest.mark.parametrize("n_id", [0, 1, 63, 64, 1234567890, (1 << 62) + 12345])
+def test_encoded_key_round_trip(n_id):
+    key = encode_callback_key(n_id)
+    assert not key.isdigit()
+    assert parse_callback_key(key) == n_id
+
+
+def test_encoded_key_is_not_read_as_decimal():
+    # a key made of digits only, if it were not tagged
+    n_id = next(i for i in range(1 << 20) if encode_callback_key(i)[1:].isdigit())
+    key = encode_callback_key(n_id)
+    assert parse_callback_key(key) == n_id
+    assert parse_callback_key(key[1:]) == int(key[1:])
+
+
+@pytest.mark.parametrize("key", ["0", "7", "12345678901234"])
+def test_legacy_decimal_key(key):
+    assert parse_callback_key(key) == int(key)
+    assert decode_callback_data(f"tag:{key}").id == int(key)
+
+
+@pytest.mark.parametrize("key", ["", "~", "~A", "abc", "-1", " 1", "1.5", "~!!"])
+def test_invalid_key(key):
+    with pytest.raises(ValueError):
+        parse_callback_key(key)
+    assert decode_callback_data(f"tag:{key}").id is None
+
+
+def test_bad_checksum():
+    key = encode_callback_key(123456)
+    last = "A" if key[-1] != "A" else "B"
+    with pytest.raises(ValueError):
+        parse_callback_key(key[:-1] + last)
+
+
+def test_key_fits_signed_64_bit_after_2038():
+    epoch = 3786912000 - EPOCH_BASE  # boot at 2090-01-01 UTC
+    n_id = epoch << EPOCH_SHIFT | 0xFFFFFFFF
+    assert n_id < 1 << 63
+    assert parse_callback_key(encode_callback_key(n_id)) == n_id
+
+
+@pytest.mark.parametrize(
+    "data, tag, key",
+    [
+        ("name:a:b", "name", "a"),
+        ("k:12:34", "k", "12"),
+        ("k::x", "k", ""),
+        ("k", "k", ""),
+    ],
+)
+def test_decode_multi_colon_data(data, tag, key):
+    # the key is the first field after the tag, as `query.data.split(":")[1]`
+    cb_data_key = decode_callback_data(data)
+    assert (cb_data_key.tag, cb_data_key.key) == (tag, key)
+
+
+def test_decode_multi_colon_encoded_key():
+    key = encode_callback_key(987654321)
+    cb_data_key = decode_callback_data(f"tag:{key}:extra")
+    assert cb_data_key.key == key
+    assert cb_data_key.id == 987654321
@@ -0,0 +1,66 @@
+import asyncio
+import gc
+import sqlite3
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+
+pytest.importorskip("telegram")
+pytest.importorskip("aiosqlite")
+
+from antares_bot.callback_manager import (  # noqa: E402
+    CallbackDataManager,
+    CallbackDataStore,
+    PersistKeyboards,
+)
+
+
+def test_spilled_keyboard_is_shared(tmp_path, monkeypatch):
+    async def run():
+        store = CallbackDataStore(str(tmp_path / "cb.db"))
+        await store.connect()
+        manager = CallbackDataManager(store=store)
+        # keyboards rebind the manager of the bot instance when loaded
+        bot = SimpleNamespace(callback_manager=manager)
+        monkeypatch.setitem(
+            sys.modules,
+            "antares_bot.bot_inst",
+            SimpleNamespace(get_bot_instance=lambda: bot),
+        )
+        keyboard = PersistKeyboards(manager)
+        keyboard.setup_use_data(["a", "b", "c"])
+        keys = keyboard.cb_data_keys
+        await manager.persist()
+        del keyboard
+        gc.collect()
+        for k in keys:
+            await manager.fetch(k)
+        try:
+            _, first = manager.peek_data(keys[0])
+            _, second = manager.peek_data(keys[1])
+            assert first is second
+            assert first.cb_manager is manager
+            first.modify_data_by_index(2, "z")
+            assert second.get_data_by_index(2) == "z"
+        finally:
+            await store.db.close()
+
+    asyncio.run(run())
+
+
+def test_failed_store_write_is_rolled_back(tmp_path):
+    async def run():
+        store = CallbackDataStore(str(tmp_path / "cb.db"))
+        await store.connect()
+        try:
+            expire_at = 2e9
+            await store.write({1: (expire_at, b"p")}, set(), 0)
+            with pytest.raises(sqlite3.ProgrammingError):
+                await store.write({2: (expire_at, object())}, {1}, 0)
+            assert await store.peek(1) == (expire_at, b"p")
+        finally:
+            await store.db.close()
+
+    asyncio.run(run())
@@ -0,0 +1,125 @@
+import datetime
+import random
+from types import SimpleNamespace
+
+import pytest
+
+
+pytest.importorskip("telegram")
+
+from telegram import Chat, Message, MessageEntity, Update, User  # noqa: E402
+from telegram.ext import CommandHandler, filters  # noqa: E402
+
+from bench_utils import benchmark, best_time, report  # noqa: E402
+
+from antares_bot.framework import CommandRouter  # noqa: E402
+
+
+_BOT = SimpleNamespace(username="TestBot")
+_USER = User(1, "user", False)
+_CHATS = [Chat(1, Chat.PRIVATE), Chat(-100, Chat.SUPERGROUP)]
+
+
+async def _callback(update, context):
+    pass
+
+
+def _make_handlers(n_commands: int, rng: random.Random):
+    handlers = []
+    for i in range(n_commands):
+        r = rng.random()
+        if r < 0.1:
+            # the same command twice, told apart by the filters
+            handlers.append(
+                CommandHandler(f"cmd{i}", _callback, filters.ChatType.PRIVATE, block=False)
+            )
+            handlers.append(
+                CommandHandler(f"cmd{i}", _callback, filters.ChatType.GROUPS, block=False)
+            )
+        elif r < 0.2:
+            handlers.append(
+                CommandHandler(
+                    [f"cmd{i}", f"alias{i}"], _callback, filters.ChatType.PRIVATE, block=False
+                )
+            )
+        else:
+            handlers.append(CommandHandler(f"cmd{i}", _callback, block=False))
+    return handlers
+
+
+def _make_update(update_id: int, text: str, chat: Chat, command_len: int = 0) -> Update:
+    entities = []
+    if command_len:
+        entities.append(MessageEntity(MessageEntity.BOT_COMMAND, 0, command_len))
+    message = Message(
+        update_id,
+        datetime.datetime.now(datetime.timezone.utc),
+        chat,
+        from_user=_USER,
+        text=text,
+        entities=entities,
+    )
+    message.set_bot(_BOT)  # type: ignore[arg-type]
+    return Update(update_id, message=message)
+
+
+def _random_update(update_id: int, n_commands: int, rng: random.Random) -> Update:
+    chat = rng.choice(_CHATS)
+    r = rng.random()
+    if r < 0.1:
+        return _make_update(update_id, "just text", chat)
+    if r < 0.15:
+        # a command that does not start the message
+        return _make_update(update_id, "hi /cmd1", chat)
+    name = rng.choice(["cmd", "alias", "CMD", "none"]) + str(rng.randrange(n_commands + 5))
+    command = "/" + name + rng.choice(["", "", "@TestBot", "@testbot", "@OtherBot"])
+    text = command + rng.choice(["", " arg", " a b"])
+    return _make_update(update_id, text, chat, len(command))
+
+
+def _linear_scan(handlers, update):
+    # what the `Application` does with one handler per command
+    for handler in handlers:
+        check_result = handler.check_update(update)
+        if check_result is not None and check_result is not False:
+            return handler, check_result
+    return None
+
+
+def _make_router(handlers) -> CommandRouter:
+    router = CommandRouter()
+    for handler in handlers:
+        router.add(handler)
+    return router
+
+
+def test_command_router_same_as_linear_scan():
+    rng = random.Random(0)
+    handlers = _make_handlers(200, rng)
+    router = _make_router(handlers)
+    matched = 0
+    for i in range(5000):
+        update = _random_update(i, 200, rng)
+        expected = _linear_scan(handlers, update)
+        assert router.check_update(update) == expected, update.effective_message.text
+        matched += expected is not None
+    # a fair share of the updates reach a handler
+    assert matched > 1000
+
+
+@benchmark
+def test_command_router_benchmark():
+    rng = random.Random(1)
+    handlers = _make_handlers(200, rng)
+    router = _make_router(handlers)
+    updates = [_random_update(i, 200, rng) for i in range(20000)]
+
+    def run(check):
+        for update in updates:
+            check(update)
+
+    report(
+        f"{len(updates)} updates, {len(handlers)} command handlers",
+        linear_scan=best_time(run, lambda u: _linear_scan(handlers, u)),
+        router=best_time(run, router.check_update),
+    )
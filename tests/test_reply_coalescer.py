@@ -0,0 +1,64 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+
+pytest.importorskip("telegram")
+pytest.importorskip("aiosqlite")
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup  # noqa: E402
+
+from antares_bot.bot_method_wrapper import TelegramBotBaseWrapper  # noqa: E402
+from antares_bot.reply_coalescer import ReplyCoalescer  # noqa: E402
+
+
+class _FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, **kwargs):
+        self.sent.append(kwargs)
+        return SimpleNamespace(id=len(self.sent), chat_id=kwargs["chat_id"])
+
+
+def _wrapper(bot):
+    context = SimpleNamespace(
+        chat_id=1, message_id=None, bot=bot, is_callback_query=lambda: False
+    )
+
+    class _Wrapper(TelegramBotBaseWrapper):
+        @classmethod
+        def get_context(cls):
+            return context
+
+    return _Wrapper
+
+
+def test_direct_reply_keeps_order():
+    bot = _FakeBot()
+    wrapper = _wrapper(bot)
+    markup = InlineKeyboardMarkup([[InlineKeyboardButton("ok", callback_data="ok")]])
+
+    async def handler():
+        with ReplyCoalescer(wrapper, window=60) as coalescer:
+            try:
+                assert await wrapper.reply_v3("a") is None
+                assert await wrapper.reply_v3("b") is None
+                # can not be merged, sent right away after the buffered replies
+                await wrapper.reply_v3("c", reply_markup=markup)
+                assert await wrapper.reply_v3("d") is None
+            finally:
+                await coalescer.close()
+
+    asyncio.run(handler())
+    assert [m["text"] for m in bot.sent] == ["a\nb", "c", "d"]
+    assert bot.sent[1]["reply_markup"] is markup
+
+
+def test_merge_respects_arguments():
+    pending = [("a", {"chat_id": 1}), ("b", {"chat_id": 1}), ("c", {"chat_id": 2})]
+    assert ReplyCoalescer.merge(pending) == [
+        ("a\nb", {"chat_id": 1}),
+        ("c", {"chat_id": 2}),
+    ]
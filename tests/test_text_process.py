@@ -0,0 +1,364 @@
+import bisect
+import random
+import re
+
+import pytest
+
+
+pytest.importorskip("telegram")
+
+import legacy_text_process as legacy  # noqa: E402
+from bench_utils import benchmark, best_time, report  # noqa: E402
+
+from antares_bot.text_process import (  # noqa: E402
+    TEXT_LENGTH_LIMIT,
+    find_special_sequences,
+    is_valid_markdown_v2,
+    iter_longtext_split,
+    longtext_markdown_split,
+    longtext_split,
+    utf16_len,
+)
+
+
+# the MarkdownV2 example of the Bot API documentation
+BOT_API_MARKDOWN_V2_EXAMPLE = r"""*bold \*text*
+_italic \*text_
+__underline__
+~strikethrough~
+||spoiler||
+*bold _italic bold ~italic bold strikethrough ||italic bold strikethrough spoiler||~ __underline italic bold___ bold*
+[inline URL](http://www.example.com/)
+[inline mention of a user](tg://user?id=123456789)
+![👍](tg://emoji?id=5368324170671202286)
+`inline fixed-width code`
+```
+pre-formatted fixed-width code block
+```
+```python
+pre-formatted fixed-width code block written in the Python programming language
+```
+>Block quotation started
+>Block quotation continued
+>Block quotation continued
+>Block quotation continued
+>The last line of the block quotation
+**>The expandable block quotation started right after the previous block quotation
+>It is separated from the previous block quotation by an empty bar
+>Expandable block quotation continued
+>Hidden by default part of the expandable block quotation started
+>Expandable block quotation continued
+>The last line of the expandable block quotation with the expandability mark||"""
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        BOT_API_MARKDOWN_V2_EXAMPLE,
+        "_i __u i___",
+        "*b __u i b___ b*",
+        "__u__ _i_",
+    ],
+)
+def test_markdown_v2_valid(text):
+    assert is_valid_markdown_v2(text)
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "1. item",
+        "*bold",
+        "__underline",
+        "`code",
+        "[link(http://example.com)",
+        "|single",
+    ],
+)
+def test_markdown_v2_invalid(text):
+    assert not is_valid_markdown_v2(text)
+
+
+# letters, the common special characters, and others, including wide and odd spaces
+_SPECIAL_ALPHABET = (
+    list("aZ9中文")
+    + list("`*_~;:()[]{}<>#+-=|.!$% \n，！：")
+    + list("@&^\\/?'\"\t\r\u3000\x1c→█─│é\u9fa5\u9fa6\u4dff")
+)
+_LOG_LINE = "2026-10-17 12:00:00 INFO handler ok ==> ────────── result: {'a': 1}\n"
+
+
+def _special_corpus(seed: int, count: int, max_len: int):
+    rng = random.Random(seed)
+    for _ in range(count):
+        weights = [rng.random() for _ in _SPECIAL_ALPHABET]
+        yield "".join(rng.choices(_SPECIAL_ALPHABET, weights, k=rng.randint(0, max_len)))
+
+
+def test_regex_space_is_isspace():
+    # the double space check went from `str.isspace` to `\s`
+    text = "".join(map(chr, range(0x110000)))
+    assert [m.start() for m in re.finditer(r"\s", text)] == [
+        i for i, c in enumerate(text) if c.isspace()
+    ]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "",
+        "@@@@####^^^^&&&&",
+        "a@@@@@@@b",
+        "@@@ @@@@ @@",
+        "@@@  @@@@@@",
+        "========",
+        "=======@",
+        _LOG_LINE * 3,
+    ],
+)
+def test_special_sequences_cases(text):
+    assert find_special_sequences(text) == legacy.find_special_sequences(text)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_special_sequences_same_as_legacy(seed):
+    for text in _special_corpus(seed, 5000, 60):
+        assert find_special_sequences(text) == legacy.find_special_sequences(text), text
+
+
+@benchmark
+def test_special_sequences_benchmark():
+    rng = random.Random(0)
+    texts = {
+        "100 KB random": "".join(rng.choices(_SPECIAL_ALPHABET, k=100_000)),
+        "100 KB log": (_LOG_LINE * 1500)[:100_000],
+    }
+    for name, text in texts.items():
+        assert find_special_sequences(text) == legacy.find_special_sequences(text)
+        report(
+            name,
+            legacy=best_time(legacy.find_special_sequences, text),
+            regex=best_time(find_special_sequences, text),
+        )
+
+
+def _split_corpus(seed: int, count: int):
+    rng = random.Random(seed)
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.randint(0, 300)):
+            r = rng.random()
+            if r < 0.05:
+                lines = ("x" * rng.randint(0, 200) for _ in range(rng.randint(0, 60)))
+                parts.append("```py\n" + "\n".join(lines) + "\n```")
+            elif r < 0.07:
+                parts.append("😀" * rng.randint(0, 5000))
+            elif r < 0.09:
+                parts.append("a" * rng.randint(3000, 9000))
+            else:
+                parts.append("".join(rng.choices("ab 中😀", k=rng.randint(0, 150))))
+        yield "\n".join(parts)
+
+
+def _chunk_spans(text: str, chunks: list[str]) -> list[tuple[int, int]]:
+    # where the chunks are in the text. only the newline between two chunks may be dropped
+    spans = []
+    pos = 0
+    for i, chunk in enumerate(chunks):
+        if i > 0 and text.startswith("\n", pos):
+            pos += 1
+        assert text.startswith(chunk, pos)
+        spans.append((pos, pos + len(chunk)))
+        pos += len(chunk)
+    assert pos == len(text)
+    return spans
+
+
+def _kept_units(text: str):
+    # spans of the lines, and of the closed ``` blocks, short enough to be kept whole
+    block_start = None
+    pos = 0
+    for line in text.split("\n"):
+        end = pos + len(line)
+        if line.startswith("```"):
+            if block_start is None:
+                block_start = pos
+            else:
+                if utf16_len(text[block_start:end]) < TEXT_LENGTH_LIMIT:
+                    yield block_start, end
+                block_start = None
+        if utf16_len(line) < TEXT_LENGTH_LIMIT:
+            yield pos, end
+        pos = end + 1
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_longtext_split_properties(seed):
+    for text in _split_corpus(seed, 150):
+        chunks = longtext_split(text)
+        assert list(iter_longtext_split(text)) == chunks
+        assert all(utf16_len(chunk) < TEXT_LENGTH_LIMIT for chunk in chunks)
+        spans = _chunk_spans(text, chunks)
+        for start, end in _kept_units(text):
+            if start == end:
+                continue
+            i = bisect.bisect_right(spans, (start, len(text))) - 1
+            assert spans[i][0] <= start and end <= spans[i][1], text[start:end][:50]
+
+
+def test_longtext_split_short_text():
+    assert longtext_split("") == [""]
+    text = "😀" * (TEXT_LENGTH_LIMIT // 2 - 1)
+    assert longtext_split(text) == [text]
+    # a text shorter than the limit in code points may not be in UTF-16 code units
+    assert len(longtext_split(text + "😀")) == 2
+
+
+@benchmark
+def test_longtext_split_benchmark():
+    rng = random.Random(1)
+    lines = ("line %d " % i + "x" * rng.randint(0, 120) for i in range(60000))
+    texts = {
+        "4 MB of lines": "\n".join(lines) + "\n```\n" + "code\n" * 50 + "```\n" + "y" * 50000,
+        "one 4 MB line": "a" * 4_000_000,
+        "4 MB of short lines": "\n".join("ab" for _ in range(1_300_000)),
+    }
+    for name, text in texts.items():
+        report(
+            name,
+            legacy=best_time(legacy.longtext_split, text, repeat=1),
+            streaming=best_time(longtext_split, text, repeat=1),
+            first_chunk=best_time(lambda t: next(iter_longtext_split(t)), text),
+        )
+
+
+def _markdown_corpus(seed: int, count: int, tokens: list[str]):
+    rng = random.Random(seed)
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.randint(0, 300)):
+            if rng.random() < 0.02:
+                # enough to fill several texts now and then
+                line = "line of **words** and `code` " * rng.randint(1, 8) + "\n"
+                parts.append(line * rng.randint(1, 20))
+            else:
+                parts.append(rng.choice(tokens))
+        yield "".join(parts)
+
+
+def _split_dicts(result):
+    texts, entities = result
+    return texts, [[e.to_dict() for e in chunk] for chunk in entities]
+
+
+# markup the old parser supports, without `\`, which only escapes since the tokenizer
+_LEGACY_MARKDOWN_TOKENS = ["a", "bc", " ", "\n", "`", "**", "*", "中", "@@@@####^^^^&&&&"]
+_LEGACY_MARKDOWN_TOKENS += ["```", "```python\n", "\n\n"]
+
+
+@pytest.mark.parametrize("seed", range(2))
+def test_markdown_split_same_as_legacy(seed):
+    for text in _markdown_corpus(seed, 100, _LEGACY_MARKDOWN_TOKENS):
+        assert _split_dicts(longtext_markdown_split(text)) == _split_dicts(
+            legacy.longtext_markdown_split(text)
+        ), text
+
+
+@benchmark
+def test_markdown_split_benchmark():
+    line = "# title\nsome **bold** and *italic* and `code` text 中文 ~~~ @@@@@@@@@@\n"
+    block = "para " * 50 + "\n```python\n" + "x = 1\n" * 100 + "```\n"
+    texts = {
+        "1 MB inline markup": (line * 16000)[:1_000_000],
+        "1 MB code blocks": (block * 1500)[:1_000_000],
+    }
+    for name, text in texts.items():
+        assert _split_dicts(longtext_markdown_split(text)) == _split_dicts(
+            legacy.longtext_markdown_split(text)
+        )
+        report(
+            name,
+            legacy=best_time(legacy.longtext_markdown_split, text, repeat=1),
+            builder=best_time(longtext_markdown_split, text, repeat=1),
+        )
+
+
+@pytest.mark.parametrize(
+    "markdown, text, entity",
+    [
+        ("~~s~~ x", "s x", {"type": "strikethrough", "offset": 0, "length": 1}),
+        ("__u__", "u", {"type": "underline", "offset": 0, "length": 1}),
+        ("||sp||", "sp", {"type": "spoiler", "offset": 0, "length": 2}),
+        (
+            "[l](https://e.com)",
+            "l",
+            {"type": "text_link", "offset": 0, "length": 1, "url": "https://e.com"},
+        ),
+        (
+            "![👍](tg://emoji?id=5368324170671202286)",
+            "👍",
+            {
+                "type": "custom_emoji",
+                "offset": 0,
+                "length": 2,
+                "custom_emoji_id": "5368324170671202286",
+            },
+        ),
+        ("> q1\n> q2\nafter", "q1\nq2\nafter", {"type": "blockquote", "offset": 0, "length": 5}),
+        (
+            "**> hidden\n> more",
+            "hidden\nmore",
+            {"type": "expandable_blockquote", "offset": 0, "length": 11},
+        ),
+        ("😀 **x**", "😀 x", {"type": "bold", "offset": 3, "length": 1}),
+    ],
+)
+def test_markdown_entities(markdown, text, entity):
+    assert _split_dicts(longtext_markdown_split(markdown)) == ([text], [[entity]])
+
+
+@pytest.mark.parametrize("markdown", [r"\*not italic\*", "a ~~ b", "a || b", "[l](javascript:x)"])
+def test_markdown_no_entities(markdown):
+    texts, entities = longtext_markdown_split(markdown)
+    assert entities == [[]]
+
+
+# the subset of the markup both parsers support
+_FUZZ_MARKDOWN_TOKENS = _LEGACY_MARKDOWN_TOKENS + ["***", "  x", "#", "=", "-"]
+
+
+@pytest.mark.parametrize("seed", range(2))
+def test_markdown_tokenizer_fuzz(seed):
+    for text in _markdown_corpus(seed + 100, 100, _FUZZ_MARKDOWN_TOKENS):
+        assert _split_dicts(longtext_markdown_split(text)) == _split_dicts(
+            legacy.longtext_markdown_split(text)
+        ), text
+
+
+def test_markdown_entities_in_utf16():
+    tokens = _FUZZ_MARKDOWN_TOKENS + ["😀", "~~", "__", "||", "\\*", "[l](https://e.com)", "> "]
+    for text in _markdown_corpus(200, 100, tokens):
+        texts, entities = longtext_markdown_split(text)
+        for chunk, chunk_entities in zip(texts, entities):
+            units = utf16_len(chunk)
+            assert units < TEXT_LENGTH_LIMIT
+            for entity in chunk_entities:
+                assert 0 <= entity.offset and entity.offset + entity.length <= units
+
+
+@benchmark
+def test_markdown_tokenizer_benchmark():
+    line = "text **bold** *it* `code` __u__ ~~s~~ ||sp|| [l](https://e.com) \\* @@@@####^^^^&&&&\n"
+    doc = line * (2_000_000 // len(line))
+    # linear: the time per MB stays the same as the input grows
+    report(
+        "markdown tokenizer",
+        **{
+            f"{n // 1000} KB": best_time(longtext_markdown_split, doc[:n], repeat=1)
+            for n in (250_000, 500_000, 1_000_000, 2_000_000)
+        },
+    )
+    report(
+        "1 MB single line",
+        tokenizer=best_time(longtext_markdown_split, "*a* " * 250_000, repeat=1),
+    )